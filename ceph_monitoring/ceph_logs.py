@@ -0,0 +1,147 @@
+import re
+import collections
+
+from multiprocessing import Pool as MPExecutorPool
+
+
+# 2015-09-07 21:05:12.123456 7f0a5c7f8700  0 log_channel(cluster) log [WRN] : ...
+log_time_re = re.compile(r"(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)")
+
+# only lines with any of these are checked by event patterns below
+events_filter_re = re.compile(r"slow request|heartbeat_check|wrongly marked me down| failed \(")
+
+# cluster log line - '2015-09-07 21:05:12.123456 osd.3 192.168.1.10:6800/1234 45 : cluster [WRN] ...'
+cluster_log_who_re = re.compile(r"\S+ \S+ (?P<who>osd\.\d+|mon\.\S+) ")
+
+slow_request_re = re.compile(r"slow request (?P<age>[\d.]+) seconds old, received at \S+ \S+?: " +
+                             r"(?P<op>.*?) currently (?P<state>.*)$")
+subops_re = re.compile(r"waiting for subops from (?P<osds>[\d, ]+)")
+heartbeat_re = re.compile(r"heartbeat_check: no reply from (?:\S+ )?osd\.(?P<peer>\d+)")
+osd_failed_re = re.compile(r"osd\.(?P<osd>\d+) failed \(")
+marked_down_re = re.compile(r"wrongly marked me down")
+
+
+# event kinds
+SLOW_REQUEST = 'slow_request'
+SUBOP_WAIT = 'subop_wait'
+HEARTBEAT_NO_REPLY = 'heartbeat_no_reply'
+OSD_FAILED = 'osd_failed'
+MARKED_DOWN = 'marked_down'
+
+
+def osd_id_from_name(name):
+    return int(name.split('.', 1)[1]) if name.startswith('osd.') else None
+
+
+def mine_log(args):
+    # args - (log text, osd id of log owner or None for cluster log);
+    # returns [(time, kind, osd id, value), ...], time up to seconds;
+    # value is request age for slow requests and subop waits, None for others
+    data, log_osd_id = args
+    events = []
+
+    for line in data.split("\n"):
+        if events_filter_re.search(line) is None:
+            continue
+
+        time_m = log_time_re.match(line)
+        if time_m is None:
+            continue
+        tm = time_m.group('time')
+
+        osd_id = log_osd_id
+        if osd_id is None:
+            who_m = cluster_log_who_re.match(line)
+            osd_id = None if who_m is None else osd_id_from_name(who_m.group('who'))
+
+        slow_m = slow_request_re.search(line)
+        if slow_m is not None:
+            events.append((tm, SLOW_REQUEST, osd_id, float(slow_m.group('age'))))
+
+            # primary waits for replicas, so they are to blame
+            subops_m = subops_re.search(slow_m.group('state'))
+            if subops_m is not None:
+                for peer in subops_m.group('osds').split(','):
+                    if peer.strip() != '':
+                        events.append((tm, SUBOP_WAIT, int(peer), float(slow_m.group('age'))))
+            continue
+
+        hb_m = heartbeat_re.search(line)
+        if hb_m is not None:
+            events.append((tm, HEARTBEAT_NO_REPLY, int(hb_m.group('peer')), None))
+            continue
+
+        failed_m = osd_failed_re.search(line)
+        if failed_m is not None:
+            events.append((tm, OSD_FAILED, int(failed_m.group('osd')), None))
+            continue
+
+        if marked_down_re.search(line) is not None and osd_id is not None:
+            events.append((tm, MARKED_DOWN, osd_id, None))
+
+    return events
+
+
+class LogEventsStats(object):
+    def __init__(self):
+        # osd id => Counter(kind => events count)
+        self.per_osd = {}
+
+        # osd id => max slow request age, seconds
+        self.slow_max_age = {}
+
+        # host name => Counter(kind => events count)
+        self.per_host = {}
+
+        # 'YYYY-mm-dd HH:MM' => Counter(kind => events count)
+        self.per_minute = {}
+
+        # (osd id, minute) => slow requests and subop waits count
+        self.osd_minute_slow = collections.Counter()
+
+        self.events_count = 0
+
+
+def aggregate_log_events(events, osd_hosts):
+    # events - mine_log results, osd_hosts - {osd id: host name}
+    stats = LogEventsStats()
+    for tm, kind, osd_id, value in events:
+        stats.events_count += 1
+
+        minute = tm[:16]
+        stats.per_minute.setdefault(minute, collections.Counter())[kind] += 1
+
+        if osd_id is None:
+            continue
+
+        stats.per_osd.setdefault(osd_id, collections.Counter())[kind] += 1
+        host = osd_hosts.get(osd_id)
+        if host is not None:
+            stats.per_host.setdefault(host, collections.Counter())[kind] += 1
+
+        if kind == SLOW_REQUEST:
+            stats.slow_max_age[osd_id] = max(value, stats.slow_max_age.get(osd_id, 0))
+
+        if kind in (SLOW_REQUEST, SUBOP_WAIT):
+            stats.osd_minute_slow[(osd_id, minute)] += 1
+
+    return stats
+
+
+def mine_logs(logs, workers=1):
+    # logs - [(log text, osd id or None), ...]; the same event could be
+    # in osd log and in cluster log, so returns set of events
+    if workers > 1 and len(logs) > 1:
+        mp_pool = MPExecutorPool(processes=min(workers, len(logs)))
+        try:
+            results = mp_pool.map(mine_log, logs)
+        finally:
+            mp_pool.close()
+            mp_pool.join()
+    else:
+        results = map(mine_log, logs)
+
+    events = set()
+    for log_events in results:
+        events.update(log_events)
+    return events
@@ -1,25 +1,75 @@
 import re
 import os.path
+import cPickle
+import logging
 import datetime
-import functools
+import itertools
 import collections
 
+import numpy
 from ipaddr import IPNetwork, IPAddress
+from crush import CrushTree
+from ceph_logs import mine_logs, aggregate_log_events
+from disk_health import DiskHealth, parse_devices
+from osd_config import build_config_store
+from net_conns import parse_netstats, analyze_connections, is_loopback
+from timeline import daemon_log_events, cluster_log_events, dmesg_events, collector_log_events
 from hw_info import get_hw_info, ssize2b
+from storage import SQLiteResultStorage
 from multiprocessing import Pool as MPExecutorPool
 
 
-class CephOSD(object):
+logger = logging.getLogger('report')
+
+
+class Slotted(object):
+    # base for model classes, which can be created in tens of thousands -
+    # fixed attributes set and no per-instance __dict__
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, val in state.items():
+            setattr(self, name, val)
+
+
+class CephOSD(Slotted):
+    __slots__ = ('id', 'name', 'status', 'host', 'crush_weight', 'reweight',
+                 'primary_affinity', 'daemon_runs', 'pg_count', 'config', 'pgs',
+                 'data_stor_stats', 'j_stor_stats', 'osd_perf', 'pid', 'cpu_usage',
+                 'cpu_mean', 'cpu_peak', 'cpu_lat_corr')
+
     def __init__(self):
         self.id = None
+        self.name = None
         self.status = None
         self.host = None
+        self.crush_weight = None
+        self.reweight = None
+        self.primary_affinity = None
         self.daemon_runs = None
         self.pg_count = None
         self.config = None
         self.pgs = {}
         self.data_stor_stats = None
         self.j_stor_stats = None
+        self.osd_perf = None
+
+        # ceph-osd process cpu usage, from performance monitoring, 1.0 == one core:
+        # (timestamps, per-interval usage array), mean, peak, and
+        # correlation of usage and data device latency
+        self.pid = None
+        self.cpu_usage = None
+        self.cpu_mean = None
+        self.cpu_peak = None
+        self.cpu_lat_corr = None
 
 
 class CephMonitor(object):
@@ -36,35 +86,109 @@ class Pool(object):
         self.name = None
 
 
-class NetworkAdapter(object):
+class NetLoad(Slotted):
+    __slots__ = ('sbytes', 'rbytes', 'spackets', 'rpackets')
+
+    def __init__(self, sbytes, rbytes, spackets, rpackets):
+        self.sbytes = sbytes
+        self.rbytes = rbytes
+        self.spackets = spackets
+        self.rpackets = rpackets
+
+
+class NetworkAdapter(Slotted):
+    __slots__ = ('name', 'ip', 'is_phy', 'speed', 'speed_s', 'duplex',
+                 'perf_stats', 'perf_delta', 'perf_stats_curr', 'perf_stats_peak',
+                 'throughput', 'util_curr', 'util_p95', 'util_peak')
+
     def __init__(self, name, ip):
         self.name = name
         self.ip = ip
         self.is_phy = None
         self.speed = None
+        # speed string, if collector fails to convert it to Bps
+        self.speed_s = None
         self.duplex = None
         self.perf_stats = None
         self.perf_delta = None
         self.perf_stats_curr = None
+        # max of per-interval rates
+        self.perf_stats_peak = None
+        # (interval end times, send Bps, recv Bps) arrays
+        self.throughput = None
+        # % of negotiated link speed, None if speed is unknown
+        self.util_curr = None
+        self.util_p95 = None
+        self.util_peak = None
+
 
+class Disk(Slotted):
+    __slots__ = ('dev', 'perf_stats', 'perf_delta')
 
-class Disk(object):
     def __init__(self, dev):
         self.dev = dev
         self.perf_stats = None
         self.perf_delta = None
 
 
-class Host(object):
+class DevStats(Slotted):
+    # osd data/journal device, *_curr and *_uptime fields are None
+    # if there no monitoring data for the device
+    curr_fields = ('read_bytes_curr', 'write_bytes_curr', 'read_iops_curr', 'write_iops_curr',
+                   'io_time_curr', 'w_io_time_curr', 'iops_curr', 'queue_depth_curr', 'lat_curr')
+    uptime_fields = ('read_bytes_uptime', 'write_bytes_uptime', 'read_iops_uptime',
+                     'write_iops_uptime', 'io_time_uptime', 'w_io_time_uptime')
+
+    # (p50, p95, p99, max) of per-interval values, see io_rates_distribution
+    dist_fields = ('iops_dist', 'bytes_dist', 'lat_dist', 'queue_depth_dist')
+
+    __slots__ = ('dev', 'root_dev', 'used', 'avail', 'is_ssd') + \
+        curr_fields + uptime_fields + dist_fields
+
+    def __init__(self, dev, root_dev, used=None, avail=None, is_ssd=None):
+        self.dev = dev
+        self.root_dev = root_dev
+        self.used = used
+        self.avail = avail
+        self.is_ssd = is_ssd
+
+        for name in self.curr_fields + self.uptime_fields + self.dist_fields:
+            setattr(self, name, None)
+
+
+class Host(Slotted):
+    __slots__ = ('name', 'cluster_net', 'public_net', 'net_adapters', 'disks', 'uptime',
+                 'perf_monitoring', 'rusage_stats', 'rusage_rates', 'hw_info', 'mem_total', 'mem_free',
+                 'swap_total', 'swap_free', 'load_5m', 'clock_offset',
+                 'osd_cpu_mean', 'osd_cpu_peak', 'ips')
+
     def __init__(self, name):
         self.name = name
         self.cluster_net = None
         self.public_net = None
+
+        # all ip addresses of host, as strings
+        self.ips = []
         self.net_adapters = {}
         self.disks = {}
         self.uptime = None
         self.perf_monitoring = None
         self.rusage_stats = None
+        # {'disk': {dev: (times, rates)}, 'net': ...}, see rusage_rates
+        self.rusage_rates = None
+        self.hw_info = None
+        self.mem_total = None
+        self.mem_free = None
+        self.swap_total = None
+        self.swap_free = None
+        self.load_5m = None
+
+        # host clock - collector clock, seconds, None if unknown
+        self.clock_offset = None
+
+        # cpu usage of all ceph-osd processes, 1.0 == all cores busy
+        self.osd_cpu_mean = None
+        self.osd_cpu_peak = None
 
 
 class TabulaRasa(object):
@@ -81,11 +205,22 @@ class TabulaRasa(object):
         return name in self.__dict__
 
 
-class DevLoadLog(object):
-    def __init__(self, name, start_timstamp):
+class DevLoadLog(Slotted):
+    __slots__ = ('name', 'start_timstamp', 'fields', 'values', 'timestamps')
+
+    def __init__(self, name, start_timstamp, fields, values):
         self.name = name
-        self.values = []
         self.start_timstamp = start_timstamp
+        self.fields = fields
+
+        # 2D array, row per sample, column per field
+        self.values = values
+
+        # monitoring script takes samples with 'sleep 1' between them
+        self.timestamps = start_timstamp + numpy.arange(len(values), dtype=float)
+
+    def __getitem__(self, field):
+        return self.values[:, self.fields.index(field)]
 
 
 diskstat_fields = [
@@ -141,58 +276,246 @@ def find(lst, check, default=None):
     return default
 
 
+DIST_PERCENTILES = [50, 95, 99, 100]
+
+
+def counters_rates(samples, samples_time):
+    # samples - 2D array of counters, row per sample;
+    # returns (interval end times, 2D array of per-interval rates)
+    samples = numpy.asarray(samples, dtype=float)
+    samples_time = numpy.asarray(samples_time, dtype=float)
+
+    # drop samples with the same time, they give no interval
+    keep = numpy.concatenate(([True], numpy.diff(samples_time) > 0))
+    samples = samples[keep]
+    samples_time = samples_time[keep]
+
+    rates = numpy.diff(samples, axis=0) / numpy.diff(samples_time)[:, None]
+    return samples_time[1:], rates
+
+
+def link_utilization(send, recv, speed, duplex):
+    # send, recv - Bps, numbers or arrays; returns % of link speed,
+    # directions of half duplex link share its speed
+    if duplex is False:
+        used = numpy.add(send, recv)
+    else:
+        used = numpy.maximum(send, recv)
+    return numpy.asarray(used, dtype=float) * 100.0 / speed
+
+
+def io_rates_distribution(rates):
+    # rates - 2D array of diskstat counters rates, diskstat_fields[3:] columns;
+    # returns {'iops': (p50, p95, p99, max), ...}
+    if len(rates) < 1:
+        return {}
+
+    return dict((name, tuple(numpy.percentile(vals, DIST_PERCENTILES).tolist()))
+                for name, vals in io_load_series(rates).items())
+
+
+def io_load_series(rates):
+    # rates - 2D array of diskstat counters rates, diskstat_fields[3:] columns
+    col = dict((name, rates[:, pos]) for pos, name in enumerate(diskstat_fields[3:]))
+
+    iops = col['reads_completed'] + col['writes_completed']
+    queue_depth = 0.001 * col['weighted_io_time']
+    lat = numpy.where(iops > 1E-5, queue_depth / numpy.maximum(iops, 1E-5), 0)
+
+    return {'iops': iops,
+            'bytes': (col['sectors_read'] + col['sectors_written']) * 512,
+            'lat': lat,
+            'queue_depth': queue_depth}
+
+
+def resample(timestamps, values, grid, interpolation='linear'):
+    # values - 2D array, row per sample, sampled at timestamps (must increase);
+    # returns rows for each grid point, nan outside of sampled time range
+    timestamps = numpy.asarray(timestamps, dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    grid = numpy.asarray(grid, dtype=float)
+
+    if interpolation == 'linear':
+        res = numpy.empty((len(grid), values.shape[1]))
+        for pos in range(values.shape[1]):
+            res[:, pos] = numpy.interp(grid, timestamps, values[:, pos],
+                                       left=numpy.nan, right=numpy.nan)
+        return res
+
+    if interpolation == 'previous':
+        idx = numpy.searchsorted(timestamps, grid, side='right') - 1
+    elif interpolation == 'nearest':
+        if len(timestamps) == 1:
+            idx = numpy.zeros(len(grid), dtype=int)
+        else:
+            idx = numpy.searchsorted(timestamps, grid)
+            idx = numpy.clip(idx, 1, len(timestamps) - 1)
+            left_closer = (grid - timestamps[idx - 1]) < (timestamps[idx] - grid)
+            idx = numpy.where(left_closer, idx - 1, idx)
+    else:
+        raise ValueError("Unknown interpolation {0!r}".format(interpolation))
+
+    res = values[numpy.clip(idx, 0, len(timestamps) - 1)]
+    res[(grid < timestamps[0]) | (grid > timestamps[-1])] = numpy.nan
+    return res
+
+
+def load_dev_stats(stats):
+    return DevStats(stats['dev'], stats['root_dev'], stats.get('used'),
+                    stats.get('avail'), stats.get('is_ssd'))
+
+
 def load_performance_log_file(str_data, fields, skip=0, field_types=None):
     # first line - collection start time
-    lines = iter(str_data.split("\n"))
+    header, body = (str_data.split("\n", 1) + [""])[:2]
 
     # Mon Sep  7 21:08:26 UTC 2015
-    sdate = datetime.datetime.strptime(next(lines), "%a %b %d %H:%M:%S UTC %Y")
+    sdate = datetime.datetime.strptime(header.strip(), "%a %b %d %H:%M:%S UTC %Y")
     timestamp = (sdate - datetime.datetime(1970, 1, 1)).total_seconds()
 
-    per_dev = {}
+    tokens = body.split()
+    if tokens == []:
+        return {}
 
-    if field_types is None:
-        fied_tr = functools.partial(map, float)
+    ncols = len(body.strip().split("\n", 1)[0].split())
+    if len(tokens) == ncols * (body.strip().count("\n") + 1):
+        table = numpy.array(tokens).reshape((-1, ncols))
     else:
-        def fied_tr(data):
-            return [func(val) for func, val in zip(field_types, data)]
+        # broken lines, probably from interrupted monitoring; the first
+        # line can be broken too, so most common width is used
+        lines = [line.split() for line in body.split("\n")]
+        widths = collections.Counter(len(line) for line in lines if line != [])
+        ncols = max((count, width) for width, count in widths.items())[1]
+        table = numpy.array([line for line in lines if len(line) == ncols])
 
-    for line in lines:
-        line = line.strip()
-        if line == '':
-            continue
+    # no complete lines
+    if ncols < skip + 1 + len(fields):
+        return {}
 
-        items = line.split()[skip:]
-        dev = items[0]
+    devs = table[:, skip]
+    data = table[:, skip + 1: skip + 1 + len(fields)]
 
-        if dev not in per_dev:
-            per_dev[dev] = obj = DevLoadLog(dev, timestamp)
-        else:
-            obj = per_dev[items[0]]
+    if field_types is None:
+        data = data.astype(float)
+    else:
+        data = numpy.column_stack([numpy.array(map(func, data[:, pos]), dtype=float)
+                                   for pos, func in enumerate(field_types)])
 
-        obj.values.append(TabulaRasa(**dict(zip(fields, fied_tr(items[1:])))))
+    per_dev = {}
+    for dev in numpy.unique(devs):
+        per_dev[str(dev)] = DevLoadLog(str(dev), timestamp, list(fields), data[devs == dev])
 
     return per_dev
 
 
 class CephCluster(object):
-    def __init__(self, jstorage, storage):
-        self.osds = []
-        self.mons = []
-        self.pools = {}
-        self.hosts = {}
+    # model attributes are loaded on first access, by the loader
+    # listed here; loaders run their dependencies first
+    attr_loaders = {
+        'osd_tree': 'load_osd_tree',
+        'osd_tree_root_id': 'load_osd_tree',
+        'crush': 'load_osd_tree',
+        'osd_pool_pg': 'load_PG_distribution',
+        'pg_osd_ids': 'load_PG_distribution',
+        'pg_pool_names': 'load_PG_distribution',
+        'sum_per_pool': 'load_PG_distribution',
+        'sum_per_osd': 'load_PG_distribution',
+        'osds': 'load_osds',
+        'osd_configs': 'load_osds',
+        'cluster_net': 'load_cluster_networks',
+        'public_net': 'load_cluster_networks',
+        'pools': 'load_pools',
+        'mons': 'load_monitors',
+        'hosts': 'load_hosts',
+        'report_collected_at_local': 'load_collected_at',
+        'report_collected_at_gmt': 'load_collected_at',
+        'overall_status': 'load_status',
+        'health_summary': 'load_status',
+        'num_pgs': 'load_status',
+        'bytes_used': 'load_status',
+        'bytes_total': 'load_status',
+        'bytes_avail': 'load_status',
+        'data_bytes': 'load_status',
+        'write_bytes_sec': 'load_status',
+        'op_per_sec': 'load_status',
+        'pgmap_stat': 'load_status',
+        'settings': 'load_settings',
+        'log_stats': 'load_log_stats',
+        'disks_health': 'load_disks_health',
+        'net_conns': 'load_net_connections',
+    }
+
+    loader_deps = {
+        'load_osd_tree': [],
+        'load_PG_distribution': ['load_osd_tree'],
+        'load_osds': ['load_osd_tree', 'load_PG_distribution'],
+        'load_cluster_networks': ['load_osds'],
+        'load_pools': [],
+        'load_monitors': [],
+        'load_hosts': ['load_cluster_networks'],
+        # fills osd data/journal devices *_curr and *_uptime stats
+        'fill_io_devices_usage_stats': ['load_osds', 'load_hosts'],
+        # fills osd and host cpu_* stats
+        'fill_cpu_usage_stats': ['load_osds', 'load_hosts'],
+        'load_collected_at': [],
+        'load_status': [],
+        'load_settings': ['load_osds'],
+        'load_log_stats': ['load_osds'],
+        'load_disks_health': ['load_osds'],
+        'load_net_connections': ['load_osds', 'load_hosts'],
+    }
+
+    def __init__(self, jstorage, storage, workers=1):
+        self.storage = storage
+        self.jstorage = jstorage
+        self.manifest = storage.manifest
 
-        self.osd_tree = {}
-        self.osd_tree_root_id = None
-        self.report_collected_at_local = None
-        self.report_collected_at_gmt = None
+        # returns (jstorage, storage), used to reopen storage of
+        # model from snapshot, when not stored data is needed
+        self.storage_opener = None
 
-        self.cluster_net = None
-        self.public_net = None
+        # processes to parse per-host data
+        self.workers = workers
 
-        self.storage = storage
-        self.jstorage = jstorage
-        self.settings = TabulaRasa()
+        self.loaded = set()
+
+    def __getattr__(self, name):
+        loader = self.attr_loaders.get(name)
+        if loader is None or loader in self.__dict__.get('loaded', ()):
+            raise AttributeError(name)
+        self.require(loader)
+        return self.__dict__[name]
+
+    def __getstate__(self):
+        # only loaded data is stored, the rest is loaded from
+        # storage after restore, if it's needed
+        state = self.__dict__.copy()
+        state['storage'] = None
+        state['jstorage'] = None
+        state['storage_opener'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def attach_storage(self):
+        if self.storage is None:
+            assert self.storage_opener is not None, "No storage to load data from"
+            self.jstorage, self.storage = self.storage_opener()
+
+    def require(self, *loaders):
+        for loader in loaders:
+            if loader in self.loaded:
+                continue
+
+            for dep in self.loader_deps[loader]:
+                self.require(dep)
+
+            # mark first, so loader can't recursively call itself
+            # through __getattr__ before attribute is set
+            self.loaded.add(loader)
+            self.attach_storage()
+            getattr(self, loader)()
 
     def get_alive_osd(self):
         # try to find alive osd
@@ -201,27 +524,74 @@ class CephCluster(object):
                 return osd
         return None
 
-    def load(self):
-        self.load_osd_tree()
-        self.load_PG_distribution()
-        self.load_osds()
-        self.load_cluster_networks()
-        self.load_pools()
-        self.load_monitors()
-        self.load_hosts()
+    def prefetch(self):
+        # read all per-host and per-osd files in parallel, it
+        # makes a big difference on slow (e.g. NFS) storages
+        self.prefetch_master()
+        self.prefetch_osds()
+        self.prefetch_hosts()
+
+    def prefetch_master(self):
+        json_paths = ['master/' + name for name in ('status', 'osd_perf', 'osd_dump',
+                                                     'rados_df', 'osd_lspools', 'pg_dump')]
+        self.jstorage.prefetch(json_paths)
+        self.storage.prefetch(['master/collected_at'])
+
+    def prefetch_osds(self):
+        json_paths = []
+        raw_paths = []
+
+        # storage_ls is only used if there no pg dump
+        # configs are parsed by build_config_store
+        osd_raw_files = ['osd_daemons', 'config']
+        if self.storage.stat('master/pg_dump') is None:
+            osd_raw_files.append('storage_ls')
 
-        for host in self.hosts.values():
-            host.rusage_stats = self.get_rusage_stats(host.name)
-            host.perf_monitoring = self.get_perf_monitoring(host.name)
+        for node in self.osd_tree.values():
+            if node['type'] == 'osd':
+                path = 'osd/{0}/'.format(node['id'])
+                json_paths.extend(path + name for name in ('data/stats', 'journal/stats'))
+                raw_paths.extend(path + name for name in osd_raw_files)
 
-        self.fill_io_devices_usage_stats()
-        self.fill_net_devices_usage_stats()
+        self.jstorage.prefetch(json_paths)
+        self.storage.prefetch(raw_paths)
+
+    def prefetch_hosts(self):
+        json_paths = []
+        raw_paths = []
+
+        for host_name in self.storage.hosts[2]:
+            json_paths.append('hosts/{0}/interfaces'.format(host_name))
+            raw_paths.extend('hosts/{0}/{1}'.format(host_name, name)
+                             for name in ('lshw', 'meminfo', 'loadavg', 'ipa', 'netdev',
+                                          'uptime', 'time_ref'))
+            raw_paths.extend('perf_monitoring/{0}/{1}'.format(host_name, name)
+                             for name in ('io', 'net', 'cpu'))
+
+            rusage = self.storage.get("rusage/" + host_name, expected_format=None)
+            if rusage is not None:
+                raw_paths.extend('rusage/{0}/{1}'.format(host_name, name) for name in rusage)
 
+        self.jstorage.prefetch(json_paths)
+        self.storage.prefetch(raw_paths)
+
+    def load(self):
+        # eager load of everything
+        if self.loaded.issuperset(self.loader_deps):
+            # e.g. restored from snapshot, no need to open storage
+            return
+        self.require('load_osd_tree')
+        self.attach_storage()
+        self.prefetch()
+        self.require(*sorted(self.loader_deps))
+
+    def load_collected_at(self):
         data = self.storage.get('master/collected_at')
         assert data is not None
         self.report_collected_at_local, \
             self.report_collected_at_gmt, _ = data.strip().split("\n")
 
+    def load_status(self):
         mstorage = self.jstorage.master
 
         self.overall_status = mstorage.status['health']['overall_status']
@@ -235,6 +605,10 @@ class CephCluster(object):
         self.write_bytes_sec = mstorage.status['pgmap'].get("write_bytes_sec", 0)
         self.op_per_sec = mstorage.status['pgmap'].get("op_per_sec", 0)
 
+        self.pgmap_stat = mstorage.status['pgmap']
+
+    def load_settings(self):
+        self.settings = TabulaRasa()
         for osd in self.osds:
             if osd.status == 'up':
                 self.settings.__dict__.update(osd.config)
@@ -242,8 +616,6 @@ class CephCluster(object):
         else:
             self.settings = None
 
-        self.pgmap_stat = mstorage.status['pgmap']
-
     def fill_net_devices_usage_stats(self):
         for host in self.hosts.values():
 
@@ -263,20 +635,39 @@ class CephCluster(object):
                     sd = perf_m[net.name].values[0]
                     ed = perf_m[net.name].values[-1]
                     dtime = len(perf_m[net.name].values) - 1
+                    times, rates = counters_rates(perf_m[net.name].values, perf_m[net.name].timestamps)
                 elif host.rusage_stats is not None and 'net' in host.rusage_stats:
                     start_time, start_data = host.rusage_stats['net'][0]
                     end_time, end_data = host.rusage_stats['net'][-1]
                     dtime = end_time - start_time
-                    sd = start_data[net.name]
-                    ed = end_data[net.name]
+                    sd = numpy.array(start_data[net.name], dtype=float)
+                    ed = numpy.array(end_data[net.name], dtype=float)
+                    times, rates = host.rusage_rates['net'].get(net.name, (None, None))
                 else:
                     continue
 
-                net.perf_stats_curr = TabulaRasa()
-                net.perf_stats_curr.sbytes = (ed.sbytes - sd.sbytes) / dtime
-                net.perf_stats_curr.rbytes = (ed.rbytes - sd.rbytes) / dtime
-                net.perf_stats_curr.spackets = (ed.spackets - sd.spackets) / dtime
-                net.perf_stats_curr.rpackets = (ed.rpackets - sd.rpackets) / dtime
+                delta = dict(zip(netstat_fields, ((ed - sd) / dtime).tolist()))
+
+                net.perf_stats_curr = NetLoad(delta['sbytes'], delta['rbytes'],
+                                              delta['spackets'], delta['rpackets'])
+
+                if net.speed:
+                    net.util_curr = float(link_utilization(delta['sbytes'], delta['rbytes'],
+                                                           net.speed, net.duplex))
+
+                if rates is not None and len(rates) > 0:
+                    peak = dict(zip(netstat_fields, rates.max(axis=0).tolist()))
+                    net.perf_stats_peak = NetLoad(peak['sbytes'], peak['rbytes'],
+                                                  peak['spackets'], peak['rpackets'])
+
+                    send = rates[:, netstat_fields.index('sbytes')]
+                    recv = rates[:, netstat_fields.index('rbytes')]
+                    net.throughput = (times, send, recv)
+
+                    if net.speed:
+                        util = link_utilization(send, recv, net.speed, net.duplex)
+                        net.util_p95 = float(numpy.percentile(util, 95))
+                        net.util_peak = float(util.max())
 
     def fill_io_devices_usage_stats(self):
         for osd in self.osds:
@@ -302,19 +693,27 @@ class CephCluster(object):
                     sd = perf_m[dev].values[0]
                     ed = perf_m[dev].values[-1]
                     dtime = len(perf_m[dev].values) - 1
+                    _, rates = counters_rates(perf_m[dev].values, perf_m[dev].timestamps)
                 elif start_data is not None and dev in start_data:
                     dtime = rusage_dtime
-                    sd = start_data[dev]
-                    ed = end_data[dev]
+                    sd = numpy.array(start_data[dev][3:], dtype=float)
+                    ed = numpy.array(end_data[dev][3:], dtype=float)
+                    rates = host.rusage_rates['disk'].get(dev, (None, []))[1]
                 else:
                     continue
 
-                dev_stat.read_bytes_curr = (ed.sectors_read - sd.sectors_read) * 512 / dtime
-                dev_stat.write_bytes_curr = (ed.sectors_written - sd.sectors_written) * 512 / dtime
-                dev_stat.read_iops_curr = (ed.reads_completed - sd.reads_completed) / dtime
-                dev_stat.write_iops_curr = (ed.writes_completed - sd.writes_completed) / dtime
-                dev_stat.io_time_curr = 0.001 * (ed.io_time - sd.io_time) / dtime
-                dev_stat.w_io_time_curr = 0.001 * (ed.weighted_io_time - sd.weighted_io_time) / dtime
+                for name, dist in io_rates_distribution(rates).items():
+                    setattr(dev_stat, name + '_dist', dist)
+
+                delta = dict(zip(diskstat_fields[3:], ((ed - sd) / dtime).tolist()))
+                sd = dict(zip(diskstat_fields[3:], sd.tolist()))
+
+                dev_stat.read_bytes_curr = delta['sectors_read'] * 512
+                dev_stat.write_bytes_curr = delta['sectors_written'] * 512
+                dev_stat.read_iops_curr = delta['reads_completed']
+                dev_stat.write_iops_curr = delta['writes_completed']
+                dev_stat.io_time_curr = 0.001 * delta['io_time']
+                dev_stat.w_io_time_curr = 0.001 * delta['weighted_io_time']
 
                 # derived stats
                 dev_stat.iops_curr = dev_stat.read_iops_curr + dev_stat.write_iops_curr
@@ -325,12 +724,12 @@ class CephCluster(object):
                 else:
                     dev_stat.lat_curr = 0
 
-                dev_stat.read_bytes_uptime = (sd.sectors_read) * 512 / host.uptime
-                dev_stat.write_bytes_uptime = (sd.sectors_written) * 512 / host.uptime
-                dev_stat.read_iops_uptime = sd.reads_completed / host.uptime
-                dev_stat.write_iops_uptime = (sd.writes_completed) / host.uptime
-                dev_stat.io_time_uptime = 0.001 * sd.io_time / host.uptime
-                dev_stat.w_io_time_uptime = 0.001 * sd.weighted_io_time / host.uptime
+                dev_stat.read_bytes_uptime = sd['sectors_read'] * 512 / host.uptime
+                dev_stat.write_bytes_uptime = sd['sectors_written'] * 512 / host.uptime
+                dev_stat.read_iops_uptime = sd['reads_completed'] / host.uptime
+                dev_stat.write_iops_uptime = sd['writes_completed'] / host.uptime
+                dev_stat.io_time_uptime = 0.001 * sd['io_time'] / host.uptime
+                dev_stat.w_io_time_uptime = 0.001 * sd['weighted_io_time'] / host.uptime
 
     def load_cluster_networks(self):
         self.cluster_net = None
@@ -349,50 +748,81 @@ class CephCluster(object):
     def load_osd_tree(self):
         nodes = self.jstorage.master.osd_tree['nodes']
 
+        self.crush = CrushTree(nodes)
         self.osd_tree_root_id = nodes[0]['id']
-        self.osd_tree = dict((node['id'], node) for node in nodes)
-
-        # set backtrack links
-        def fill_parent(obj, parent_id=None):
-            obj['parent'] = parent_id
-            if 'children' in obj:
-                for child_id in obj['children']:
-                    fill_parent(self.osd_tree[child_id], obj['id'])
-
-        # set hosts
-        def fill_host(obj, host=None):
-            obj['host'] = host
-            if obj['type'] == 'host':
-                host = obj['name']
-            if 'children' in obj:
-                for child_id in obj['children']:
-                    fill_host(self.osd_tree[child_id], host)
-
-        fill_parent(self.osd_tree[self.osd_tree_root_id])
-        fill_host(self.osd_tree[self.osd_tree_root_id])
+        self.osd_tree = self.crush.nodes
+
+        # backtrack links and hosts, as in 'ceph osd tree' nodes
+        for node_id, node in self.osd_tree.items():
+            node['parent'] = self.crush.parent[node_id]
+            if node['type'] == 'host':
+                node['host'] = None
+            else:
+                node['host'] = self.crush.ancestor_name(node_id, 'host')
 
     def find_host_for_node(self, node):
-        cnode = node
-        while cnode['type'] != 'host':
-            if cnode['parent'] is None:
-                raise IndexError("Can't found host for " + str(node['id']))
-            cnode = self.osd_tree[cnode['parent']]
-        return cnode
+        host = self.crush.ancestor(node['id'], 'host')
+        if host is None:
+            raise IndexError("Can't found host for " + str(node['id']))
+        return host
+
+    def crush_aggregate(self, name):
+        # {node id: sum over subtree osds} of 'weight', 'pg_count',
+        # 'used' (data bytes), 'iops' or 'bytes' (current data devices load)
+        if name in self.crush.aggregates:
+            return self.crush.aggregates[name]
+
+        if name == 'weight':
+            per_osd = dict((osd.id, float(osd.crush_weight or 0)) for osd in self.osds)
+        elif name == 'pg_count':
+            per_osd = dict(self.sum_per_osd)
+        elif name in ('used', 'iops', 'bytes'):
+            if name != 'used':
+                self.require('fill_io_devices_usage_stats')
+
+            per_osd = {}
+            for osd in self.osds:
+                dev_stat = osd.data_stor_stats
+                if dev_stat is None:
+                    continue
+                if name == 'used':
+                    val = dev_stat.used
+                elif name == 'iops':
+                    val = dev_stat.iops_curr
+                elif dev_stat.read_bytes_curr is not None:
+                    val = dev_stat.read_bytes_curr + dev_stat.write_bytes_curr
+                else:
+                    val = None
+                if val is not None:
+                    per_osd[osd.id] = val
+        else:
+            raise ValueError("Unknown aggregate {0!r}".format(name))
+
+        return self.crush.aggregate(name, per_osd)
 
     def load_osds(self):
+        self.osds = []
+        self.prefetch_osds()
+        raw_configs = {}
+
         for node in self.osd_tree.values():
             if node['type'] != 'osd':
                 continue
 
             osd = CephOSD()
             self.osds.append(osd)
-            osd.__dict__.update(node)
+            osd.id = node['id']
+            osd.name = node.get('name')
+            osd.status = node.get('status')
+            osd.crush_weight = node.get('crush_weight')
+            osd.reweight = node.get('reweight')
+            osd.primary_affinity = node.get('primary_affinity')
             osd.host = node['host']
 
             try:
                 osd_data = getattr(self.jstorage.osd, str(node['id']))
-                osd.data_stor_stats = TabulaRasa(**osd_data.data.stats)
-                osd.j_stor_stats = TabulaRasa(**osd_data.journal.stats)
+                osd.data_stor_stats = load_dev_stats(osd_data.data.stats)
+                osd.j_stor_stats = load_dev_stats(osd_data.journal.stats)
             except AttributeError:
                 osd.data_stor_stats = None
                 osd.j_stor_stats = None
@@ -404,24 +834,65 @@ class CephCluster(object):
             if data is None:
                 osd.daemon_runs = None
             else:
-                for line in data.split("\n"):
-                    if 'ceph-osd' in line and '-i {0}'.format(osd.id) in line:
-                        osd.daemon_runs = True
-                        break
-                else:
-                    osd.daemon_runs = False
-
-            data = self.storage.get('osd/{0}/osd_daemons'.format(osd.id))
+                osd.pid = find_osd_pid(data, osd.id)
+                osd.daemon_runs = osd.pid is not None
+                if osd.pid is None and osd.status == 'up':
+                    logger.warning("%s is up, but no ceph-osd process with its id found", osd.name)
 
             if self.sum_per_osd is not None:
                 osd.pg_count = self.sum_per_osd[osd.id]
             else:
                 osd.pg_count = None
 
-            osd.config = self.jstorage.osd.get("{0}/config".format(osd.id))
+            config = self.storage.get("osd/{0}/config".format(osd.id), expected_format='json')
+            if config is not None:
+                raw_configs[osd.id] = config
 
         self.osds.sort(key=lambda x: x.id)
 
+        # ~1000 keys per OSD, mostly the same for all of them
+        self.osd_configs = build_config_store(raw_configs)
+        for osd in self.osds:
+            osd.config = self.osd_configs.config(osd.id)
+
+    def fill_cpu_usage_stats(self):
+        osds = dict((osd.id, osd) for osd in self.osds)
+        for host in self.hosts.values():
+            perf_m = host.perf_monitoring
+            if perf_m is None or 'cpu' not in perf_m:
+                continue
+
+            # cpu log is per pid
+            cpu_logs = {}
+            for osd_id in self.crush.host_osds.get(host.name, []):
+                osd = osds.get(osd_id)
+                if osd is not None and str(osd.pid) in perf_m['cpu']:
+                    cpu_logs[osd.id] = perf_m['cpu'][str(osd.pid)]
+
+            for osd_id, cpu_log in cpu_logs.items():
+                osd = osds[osd_id]
+                osd.cpu_usage = counters_rates(cpu_log.values, cpu_log.timestamps)
+                osd.cpu_mean, osd.cpu_peak = usage_mean_peak(cpu_log.values[:, 0], cpu_log.timestamps)
+
+                dev = None if osd.data_stor_stats is None else \
+                    os.path.basename(osd.data_stor_stats.root_dev)
+                if 'io' in perf_m and dev in perf_m['io']:
+                    io_times, rates = counters_rates(perf_m['io'][dev].values,
+                                                     perf_m['io'][dev].timestamps)
+                    osd.cpu_lat_corr = timed_correlation(osd.cpu_usage[0], osd.cpu_usage[1][:, 0],
+                                                         io_times, io_load_series(rates)['lat'])
+
+            cores = 0 if host.hw_info is None else sum(count for _, count in host.hw_info.cores)
+            if cpu_logs != {} and cores != 0:
+                # all logs are taken by the same script, with the same times
+                size = min(len(cpu_log.values) for cpu_log in cpu_logs.values())
+                total = sum(cpu_log.values[:size, 0] for cpu_log in cpu_logs.values())
+                timestamps = cpu_logs.values()[0].timestamps[:size]
+                mean, peak = usage_mean_peak(total, timestamps)
+                if mean is not None:
+                    host.osd_cpu_mean = mean / cores
+                    host.osd_cpu_peak = peak / cores
+
     def load_pools(self):
         self.pools = {}
 
@@ -442,6 +913,7 @@ class CephCluster(object):
                 self.pools[int(pool_part['id'])].__dict__.update(cat)
 
     def load_monitors(self):
+        self.mons = []
         srv_health = self.jstorage.master.status['health']['health']['health_services']
         assert len(srv_health) == 1
         for srv in srv_health[0]['mons']:
@@ -453,6 +925,107 @@ class CephCluster(object):
             mon.avail_percent = srv["avail_percent"]
             self.mons.append(mon)
 
+    def get_logs(self):
+        # [(log text, osd id or None for cluster-wide log), ...]
+        paths = [('osd/{0}/log'.format(osd.id), osd.id) for osd in self.osds]
+
+        mon_storage = self.storage.get('mon', expected_format=None)
+        for host_name in ([] if mon_storage is None else mon_storage):
+            paths.extend(('mon/{0}/{1}'.format(host_name, name), None)
+                         for name in ('ceph_log', 'mon_log'))
+
+        self.storage.prefetch([path for path, _ in paths])
+
+        logs = []
+        for path, osd_id in paths:
+            data = self.storage.get(path)
+            if data is not None:
+                logs.append((data, osd_id))
+        return logs
+
+    def load_log_stats(self):
+        events = mine_logs(self.get_logs(), self.workers)
+        self.log_stats = aggregate_log_events(events, dict((osd.id, osd.host) for osd in self.osds))
+
+    def load_disks_health(self):
+        # (host, device) => DiskHealth; several OSD's could share
+        # one journal device, it's parsed only once
+        self.disks_health = {}
+        devices = []
+        paths = []
+
+        for osd in sorted(self.osds, key=lambda x: x.id):
+            for role, dev_stat in (('data', osd.data_stor_stats), ('journal', osd.j_stor_stats)):
+                if dev_stat is None:
+                    continue
+
+                key = (osd.host, os.path.basename(dev_stat.root_dev))
+                health = self.disks_health.get(key)
+                if health is None:
+                    health = self.disks_health[key] = DiskHealth(*key)
+                    health.is_ssd = dev_stat.is_ssd
+                    path = 'osd/{0}/{1}/'.format(osd.id, role)
+                    devices.append((health, path + 'smartctl', path + 'hdparm'))
+                    paths.extend([path + 'smartctl', path + 'hdparm'])
+                health.users.append("{0} {1}".format(osd.name, role))
+
+        self.storage.prefetch(paths)
+        parse_devices([(health, self.storage.get(smart_path), self.storage.get(hdparm_path))
+                       for health, smart_path, hdparm_path in devices], self.workers)
+
+    def load_net_connections(self):
+        paths = ['hosts/{0}/netstat'.format(host_name) for host_name in self.hosts]
+        self.storage.prefetch(paths)
+
+        netstats = {}
+        for host_name, path in zip(self.hosts, paths):
+            data = self.storage.get(path)
+            if data is not None:
+                netstats[host_name] = data
+
+        ip_hosts = dict((ip, host.name) for host in self.hosts.values()
+                        for ip in host.ips if not is_loopback(ip))
+        osd_pids = dict(((osd.host, osd.pid), osd.id) for osd in self.osds if osd.pid is not None)
+        self.net_conns = analyze_connections(parse_netstats(netstats, self.workers), ip_hosts, osd_pids)
+
+    def timeline_streams(self):
+        # lazy per-source event streams for timeline.merge_events,
+        # raw logs are read from storage, so it must be available
+        self.attach_storage()
+        osd_hosts = dict((osd.id, osd.host) for osd in self.osds)
+        streams = []
+
+        for osd in self.osds:
+            data = self.storage.get('osd/{0}/log'.format(osd.id))
+            if data is not None:
+                streams.append(daemon_log_events(data, osd.host, osd.id, osd.name))
+
+        mon_storage = self.storage.get('mon', expected_format=None)
+        for host_name in ([] if mon_storage is None else mon_storage):
+            data = self.storage.get('mon/{0}/mon_log'.format(host_name))
+            if data is not None:
+                streams.append(daemon_log_events(data, host_name, None, 'mon'))
+
+            data = self.storage.get('mon/{0}/ceph_log'.format(host_name))
+            if data is not None:
+                streams.append(cluster_log_events(data, osd_hosts))
+
+        # dmesg has time since boot
+        collected_at = datetime.datetime.strptime(self.report_collected_at_local, "%Y-%m-%d %H:%M:%S")
+        hosts_storage = self.storage.get('hosts', expected_format=None)
+        for host_name in ([] if hosts_storage is None else hosts_storage):
+            data = self.storage.get('hosts/{0}/dmesg'.format(host_name))
+            uptime = self.storage.get('hosts/{0}/uptime'.format(host_name))
+            if data is not None and uptime is not None:
+                boot_time = collected_at - datetime.timedelta(seconds=float(uptime.split()[0]))
+                streams.append(dmesg_events(data, host_name, boot_time))
+
+        data = self.storage.get('log')
+        if data is not None:
+            streams.append(collector_log_events(data, self.report_collected_at_local.split()[0]))
+
+        return streams
+
     def get_node_net_stats(self, host_name):
         return parse_netdev(self.storage.get('hosts/{0}/netdev'.format(host_name)))
 
@@ -465,168 +1038,447 @@ class CephCluster(object):
         except AttributeError:
             pg_dump = None
 
-        self.osd_pool_pg_2d = collections.defaultdict(lambda: collections.Counter())
-        self.sum_per_pool = collections.Counter()
-        self.sum_per_osd = collections.Counter()
         pool_id2name = dict((dt['poolnum'], dt['poolname'])
                             for dt in self.jstorage.master.osd_lspools)
 
+        # one (pool id, osd id) pair per PG copy
         if pg_dump is None:
             pg_re = re.compile(r"(?P<pool_id>[0-9a-f]+)\.(?P<pg_id>[0-9a-f]+)_head$")
+            copy_pools = []
+            copy_osds = []
             for node in self.osd_tree.values():
                 if node['type'] == 'osd':
-                    osd_num = node['id']
-                    storage_ls = self.storage.get('osd/{0}/storage_ls'.format(osd_num))
-                    for pg in storage_ls.split():
-                        mobj = pg_re.match(pg)
-                        if mobj is None:
-                            continue
-
-                        pool_name = pool_id2name[int(mobj.group('pool_id'))]
-                        self.osd_pool_pg_2d[osd_num][pool_name] += 1
-                        self.sum_per_pool[pool_name] += 1
-                        self.sum_per_osd[osd_num] += 1
+                    storage_ls = self.storage.get('osd/{0}/storage_ls'.format(node['id']))
+                    pools = [int(mobj.group('pool_id'))
+                             for mobj in map(pg_re.match, storage_ls.split())
+                             if mobj is not None]
+                    copy_pools.extend(pools)
+                    copy_osds.extend([node['id']] * len(pools))
+            copy_pools = numpy.array(copy_pools, dtype=int)
+            copy_osds = numpy.array(copy_osds, dtype=int)
         else:
-            for pg in pg_dump['pg_stats']:
-                pool = int(pg['pgid'].split('.', 1)[0])
-                for osd_num in pg['acting']:
-                    pool_name = pool_id2name[pool]
-                    self.osd_pool_pg_2d[osd_num][pool_name] += 1
-                    self.sum_per_pool[pool_name] += 1
-                    self.sum_per_osd[osd_num] += 1
-
-    def parse_meminfo(self, meminfo):
-        info = {}
-        for line in meminfo.split("\n"):
-            line = line.strip()
-            if line == '':
-                continue
-            name, data = line.split(":", 1)
-            data = data.strip()
-            if " " in data:
-                data = data.replace(" ", "")
-                assert data[-1] == 'B'
-                val = ssize2b(data[:-1])
-            else:
-                val = int(data)
-            info[name] = val
-        return info
+            pg_stats = pg_dump['pg_stats']
+            acting = [pg['acting'] for pg in pg_stats]
+            copies = numpy.array(map(len, acting), dtype=int)
+            pg_pools = numpy.array([int(pg['pgid'].split('.', 1)[0]) for pg in pg_stats], dtype=int)
+            copy_pools = numpy.repeat(pg_pools, copies)
+            copy_osds = numpy.fromiter(itertools.chain.from_iterable(acting),
+                                       dtype=int, count=int(copies.sum()))
+
+        self.pg_osd_ids, osd_idx = numpy.unique(copy_osds, return_inverse=True)
+        pool_ids, pool_idx = numpy.unique(copy_pools, return_inverse=True)
+
+        # columns are ordered by pool name
+        pool_names = [pool_id2name[pool_id] for pool_id in pool_ids.tolist()]
+        order = numpy.argsort(pool_names, kind='mergesort')
+        self.pg_pool_names = [pool_names[pos] for pos in order]
+        pool_idx = numpy.argsort(order)[pool_idx]
+
+        # OSD x pool matrix of PG copies count
+        shape = (len(self.pg_osd_ids), len(self.pg_pool_names))
+        cells = numpy.bincount(osd_idx * shape[1] + pool_idx, minlength=shape[0] * shape[1])
+        self.osd_pool_pg = cells.reshape(shape)
+        self.pg_osd_ids = self.pg_osd_ids.tolist()
+
+        self.sum_per_osd = collections.Counter(
+            dict(zip(self.pg_osd_ids, self.osd_pool_pg.sum(axis=1).tolist())))
+        self.sum_per_pool = collections.Counter(
+            dict(zip(self.pg_pool_names, self.osd_pool_pg.sum(axis=0).tolist())))
+
+    def pool_pg_deviation(self):
+        # pool name => standard deviation of PG per OSD count, related to average,
+        # only OSD's with any PG are counted
+        if self.osd_pool_pg.size == 0:
+            return {}
+        avg = self.osd_pool_pg.mean(axis=0)
+        dev = self.osd_pool_pg.std(axis=0) / avg
+        return dict(zip(self.pg_pool_names, dev.tolist()))
+
+    def get_host_files(self, host_name):
+        # everything parse_host needs, so parsing can run in another process
+        stor_node = self.storage.get("hosts/" + host_name, expected_format=None)
+        files = dict((name, stor_node.get(name))
+                     for name in ('meminfo', 'loadavg', 'ipa', 'netdev', 'uptime', 'time_ref'))
+        files['lshw'] = stor_node.get('lshw', expected_format='xml')
+        files['interfaces'] = getattr(self.jstorage.hosts, host_name).interfaces
+        files['perf_monitoring'] = self.get_perf_monitoring_files(host_name)
+        files['rusage_stats'] = self.get_rusage_series(host_name)
+        if files['rusage_stats'] is None:
+            files['rusage'] = self.get_rusage_files(host_name)
+        return files
 
     def load_hosts(self):
-        for host_name in self.storage.hosts[2]:
-            stor_node = self.storage.get("hosts/" + host_name, expected_format=None)
+        self.hosts = {}
+        self.prefetch_hosts()
+
+        jobs = [(host_name, self.get_host_files(host_name), self.public_net, self.cluster_net)
+                for host_name in self.storage.hosts[2]]
+
+        if self.workers > 1 and len(jobs) > 1:
+            # parsing is cpu-bound, so threads would not help here
+            mp_pool = MPExecutorPool(processes=min(self.workers, len(jobs)))
+            try:
+                hosts = mp_pool.map(parse_host_job, jobs)
+            finally:
+                mp_pool.close()
+                mp_pool.join()
+        else:
+            hosts = map(parse_host_job, jobs)
 
-            host = Host(host_name)
+        for host in hosts:
             self.hosts[host.name] = host
 
-            lshw_xml = stor_node.get('lshw', expected_format='xml')
+        self.fill_net_devices_usage_stats()
 
-            if lshw_xml is None:
-                host.hw_info = None
-            else:
-                try:
-                    host.hw_info = get_hw_info(lshw_xml)
-                except:
-                    host.hw_info = None
+    def get_rusage_series(self, host_name):
+        if isinstance(self.storage, SQLiteResultStorage):
+            # samples may be already parsed into tables by collector
+            stats = {}
+            for stat_type, stat_cls in (('disk', DiskStats), ('net', NetStats)):
+                series = self.storage.rusage_series(host_name, stat_type, stat_cls)
+                if series is None:
+                    # text snapshots are parsed instead
+                    return None
+                stats[stat_type] = series
+            return stats
+        return None
 
-            info = self.parse_meminfo(stor_node.get('meminfo'))
-            host.mem_total = info['MemTotal']
-            host.mem_free = info['MemFree']
-            host.swap_total = info['SwapTotal']
-            host.swap_free = info['SwapFree']
-            loadavg = stor_node.get('loadavg')
+    def get_rusage_files(self, host_name):
+        host_stats = self.storage.get("rusage/" + host_name, expected_format=None)
+        if host_stats is None:
+            return None
+        return dict((stat_name, host_stats.get(stat_name)) for stat_name in host_stats)
 
-            host.load_5m = None if loadavg is None else float(loadavg.strip().split()[1])
+    def get_rusage_stats(self, host_name):
+        stats = self.get_rusage_series(host_name)
+        if stats is None:
+            stats = parse_rusage(self.get_rusage_files(host_name))
+        return stats
 
-            ipa = self.storage.get('hosts/%s/ipa' % host.name)
-            ip_rr_s = r"\d+:\s+(?P<adapter>.*?)\s+inet\s+(?P<ip>\d+\.\d+\.\d+\.\d+)/(?P<size>\d+)"
+    def get_rusage_rates(self, host_name):
+        return rusage_rates(self.get_rusage_stats(host_name))
 
-            info = collections.defaultdict(lambda: [])
-            for line in ipa.split("\n"):
-                match = re.match(ip_rr_s, line)
-                if match is not None:
-                    info[match.group('adapter')].append(
-                        (IPAddress(match.group('ip')), int(match.group('size'))))
+    def get_perf_monitoring_files(self, host_name):
+        path = "perf_monitoring/" + host_name + '/'
+        return dict((name, self.storage.get(path + name)) for name in ('io', 'net', 'cpu'))
 
-            for adapter, ips_with_sizes in info.items():
-                for ip, sz in ips_with_sizes:
-                    if self.public_net is not None and ip in self.public_net:
-                        host.public_net = NetworkAdapter(adapter, ip)
+    def get_perf_monitoring(self, host_name):
+        return parse_perf_monitoring(self.get_perf_monitoring_files(host_name))
 
-                    if self.cluster_net is not None and ip in self.cluster_net:
-                        host.cluster_net = NetworkAdapter(adapter, ip)
+    def perf_series(self, kind):
+        # yields (host name, device, timestamps in collector clock, DevLoadLog)
+        for host_name, host in sorted(self.hosts.items()):
+            if host.perf_monitoring is None or kind not in host.perf_monitoring:
+                continue
 
-            interfaces = getattr(self.jstorage.hosts, host_name).interfaces
-            for name, adapter_dct in interfaces.items():
-                adapter_dct = adapter_dct.copy()
+            offset = host.clock_offset or 0
+            for dev, log in sorted(host.perf_monitoring[kind].items()):
+                if len(log.values) != 0:
+                    yield host_name, dev, log.timestamps - offset, log
 
-                dev = adapter_dct.pop('dev')
-                adapter = NetworkAdapter(dev, None)
-                adapter.__dict__.update(adapter_dct)
-                host.net_adapters[dev] = adapter
+    def resample_perf(self, kind, step=1.0, interpolation='linear', select=None):
+        # put all 'io', 'net' or 'cpu' counters on common time grid, which
+        # covers time range, where all selected devices have samples;
+        # returns (grid, {(host name, device): 2D array of counters})
+        series = [(host_name, dev, times, log)
+                  for host_name, dev, times, log in self.perf_series(kind)
+                  if select is None or select(host_name, dev)]
 
-            net_stats = self.get_node_net_stats(host.name)
-            perf_adapters = [host.cluster_net, host.public_net] + list(host.net_adapters.values())
+        if series == []:
+            return numpy.array([]), {}
 
-            for net in perf_adapters:
-                if net is not None and net.name is not None:
-                    net.perf_stats = net_stats.get(net.name)
+        start = max(times[0] for _, _, times, _ in series)
+        stop = min(times[-1] for _, _, times, _ in series)
+        grid = numpy.arange(start, stop + step * 1E-3, step)
 
-            host.uptime = float(stor_node.get('uptime').split()[0])
+        res = {}
+        for host_name, dev, times, log in series:
+            res[(host_name, dev)] = resample(times, log.values, grid, interpolation)
+        return grid, res
+
+    def cluster_rates(self, kind, step=1.0, interpolation='linear', select=None):
+        # cluster-wide sum of counters rates, row per grid interval
+        grid, per_dev = self.resample_perf(kind, step, interpolation, select)
+        if len(grid) < 2:
+            return grid, None
+
+        total = sum(per_dev.values())
+        return grid[1:], numpy.diff(total, axis=0) / step
+
+    def cluster_io_series(self, step=1.0, interpolation='linear'):
+        # cluster-wide iops, bytes, queue depth and average latency series
+        # for osd devices; returns (grid, {name: 1D array})
+        osd_devs = set()
+        for osd in self.osds:
+            for dev_stat in (osd.data_stor_stats, osd.j_stor_stats):
+                if dev_stat is not None:
+                    osd_devs.add((osd.host, os.path.basename(dev_stat.root_dev)))
 
-    def get_rusage_stats(self, host_name):
-        stats = collections.defaultdict(lambda: [])
-        host_stats = self.storage.get("rusage/" + host_name, expected_format=None)
-        if host_stats is None:
-            return {}
+        grid, rates = self.cluster_rates('io', step, interpolation,
+                                         lambda host_name, dev: (host_name, dev) in osd_devs)
+        if rates is None:
+            return grid, {}
+        return grid, io_load_series(rates)
 
-        for stat_name in host_stats:
-            collect_time, stat_type = stat_name.split("-")
 
-            if stat_type == 'disk':
-                stat = parse_diskstats(host_stats.get(stat_name))
-            elif stat_type == 'net':
-                stat = parse_netdev(host_stats.get(stat_name))
-            else:
-                raise ValueError("Unknown stat type - {!r}".format(stat_type))
+# bump on any model change, to ignore old snapshots
+SNAPSHOT_VERSION = 12
 
-            stats[stat_type].append([int(collect_time), stat])
 
-        for stat_list in stats.values():
-            stat_list.sort()
+def save_snapshot(cluster, path, key):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fd:
+        pickler = cPickle.Pickler(fd, cPickle.HIGHEST_PROTOCOL)
+        pickler.dump((SNAPSHOT_VERSION, key))
+        pickler.dump(cluster)
+    os.rename(tmp_path, path)
 
-        return stats
 
-    def get_perf_monitoring(self, host_name):
-        path = "perf_monitoring/" + host_name + '/'
+def load_snapshot(path, key):
+    # returns None if there no snapshot for this key
+    if not os.path.isfile(path):
+        return None
 
-        res = {}
+    try:
+        with open(path, "rb") as fd:
+            unpickler = cPickle.Unpickler(fd)
+            if unpickler.load() != (SNAPSHOT_VERSION, key):
+                return None
+            return unpickler.load()
+    except Exception:
+        # broken or made by incompatible code version
+        return None
 
-        for name, fields, skip in [('io', diskstat_fields[3:], 2),
-                                   ('net', netstat_fields, 0)]:
-            stats_s = self.storage.get(path + name)
-            if stats_s is not None:
-                res[name] = load_performance_log_file(stats_s, fields, skip)
-
-        # mp_pool = MPExecutorPool(processes=2)
-        # futures = {}
-        # futures[name] = mp_pool.apply_async(load_performance_log_file,
-        #                                     [stats_s, fields, skip])
-        # for name, future in futures.items():
-        #     res[name] = future.get()
-
-        def to_seconds(val):
-            if '-' in val:
-                days, rest = val.split('-')
-            else:
-                days, rest = 0, val
 
-            h, m, s = map(int, rest.split(":"))
-            return int(days) * 24 * 3600 + h * 3600 + m * 60 + s
+def parse_time_ref(data):
+    # collector time before ssh call, host time, collector time after call
+    before, host_time, after = map(float, data.split())
+    return host_time - (before + after) / 2
 
-        stats_s = self.storage.get(path + 'cpu')
-        if stats_s is not None:
-            res['cpu'] = load_performance_log_file(stats_s, ['pid', 'cpu'], 0,
-                                                   [to_seconds])
 
-        return res
+def parse_meminfo(meminfo):
+    info = {}
+    for line in meminfo.split("\n"):
+        line = line.strip()
+        if line == '':
+            continue
+        name, data = line.split(":", 1)
+        data = data.strip()
+        if " " in data:
+            data = data.replace(" ", "")
+            assert data[-1] == 'B'
+            val = ssize2b(data[:-1])
+        else:
+            val = int(data)
+        info[name] = val
+    return info
+
+
+def parse_rusage(files):
+    stats = collections.defaultdict(lambda: [])
+    if files is None:
+        return {}
+
+    for stat_name, data in files.items():
+        collect_time, stat_type = stat_name.split("-")
+
+        if stat_type == 'disk':
+            stat = parse_diskstats(data)
+        elif stat_type == 'net':
+            stat = parse_netdev(data)
+        else:
+            raise ValueError("Unknown stat type - {!r}".format(stat_type))
+
+        stats[stat_type].append([float(collect_time), stat])
+
+    for stat_list in stats.values():
+        stat_list.sort()
+
+    return dict(stats)
+
+
+def rusage_rates(stats):
+    # stats - parse_rusage result, list of snapshots per stat type;
+    # returns {'disk': {dev: (times, rates)}, 'net': {adapter: ...}},
+    # with rates between every pair of consecutive snapshots
+    res = {}
+    for stat_type, snapshots in stats.items():
+        # diskstats has major, minor and device name first
+        skip = 3 if stat_type == 'disk' else 0
+
+        per_dev = collections.defaultdict(lambda: ([], []))
+        for stime, data in snapshots:
+            for dev, vals in data.items():
+                per_dev[dev][0].append(stime)
+                per_dev[dev][1].append(vals[skip:])
+
+        res[stat_type] = {}
+        for dev, (times, samples) in per_dev.items():
+            if len(times) > 1:
+                res[stat_type][dev] = counters_rates(samples, times)
+    return res
+
+
+# 'ceph-osd -i 3', 'ceph-osd --id 3', 'ceph-osd --id=3'
+osd_id_arg_re = re.compile(r"(?:^|\s)(?:-i|--id)(?:\s+|=)(?P<id>\d+)(?=\s|$)")
+
+
+def find_osd_pid(osd_daemons, osd_id):
+    # osd_daemons - 'ps aux' lines; returns pid of ceph-osd with osd_id or None
+    for line in osd_daemons.split("\n"):
+        if 'ceph-osd' not in line:
+            continue
+
+        for match in osd_id_arg_re.finditer(line):
+            if match.group('id') == str(osd_id):
+                return int(line.split()[1])
+    return None
+
+
+# cputime has 1 second resolution, so peak usage is taken over
+# several seconds window to get anything but 0 or 100% per core
+CPU_PEAK_WINDOW = 5
+
+
+def usage_mean_peak(cputime, timestamps, window=CPU_PEAK_WINDOW):
+    # cputime - cumulative cpu seconds; returns (mean, peak) cores used
+    if len(cputime) < 2:
+        return None, None
+
+    mean = float(cputime[-1] - cputime[0]) / (timestamps[-1] - timestamps[0])
+
+    window = min(window, len(cputime) - 1)
+    peak = ((cputime[window:] - cputime[:-window]) / (timestamps[window:] - timestamps[:-window])).max()
+    return mean, float(peak)
+
+
+def correlation(vals1, vals2):
+    # Pearson correlation of two series, sampled at the same times,
+    # longer one is cut; None if any of them is constant
+    size = min(len(vals1), len(vals2))
+    if size < 3:
+        return None
+
+    vals1 = vals1[:size]
+    vals2 = vals2[:size]
+    if vals1.std() == 0 or vals2.std() == 0:
+        return None
+    return float(numpy.corrcoef(vals1, vals2)[0, 1])
+
+
+def timed_correlation(times1, vals1, times2, vals2):
+    # series are sampled by different scripts, with own start and step,
+    # so second one is interpolated to times of the first one
+    if len(times2) < 2:
+        return None
+
+    vals2 = resample(times2, numpy.asarray(vals2, dtype=float)[:, None], times1)[:, 0]
+    inside = ~numpy.isnan(vals2)
+    return correlation(numpy.asarray(vals1, dtype=float)[inside], vals2[inside])
+
+
+def cputime_to_seconds(val):
+    if '-' in val:
+        days, rest = val.split('-')
+    else:
+        days, rest = 0, val
+
+    h, m, s = map(int, rest.split(":"))
+    return int(days) * 24 * 3600 + h * 3600 + m * 60 + s
+
+
+def parse_perf_monitoring(files):
+    res = {}
+
+    for name, fields, skip in [('io', diskstat_fields[3:], 2),
+                               ('net', netstat_fields, 0)]:
+        if files.get(name) is not None:
+            res[name] = load_performance_log_file(files[name], fields, skip)
+
+    if files.get('cpu') is not None:
+        # per-pid cpu time
+        res['cpu'] = load_performance_log_file(files['cpu'], ['cpu'], 0, [cputime_to_seconds])
+
+    return res
+
+
+def parse_host(host_name, files, public_net, cluster_net):
+    host = Host(host_name)
+
+    lshw_xml = files['lshw']
+    if lshw_xml is None:
+        host.hw_info = None
+    else:
+        try:
+            host.hw_info = get_hw_info(lshw_xml)
+        except:
+            host.hw_info = None
+
+    info = parse_meminfo(files['meminfo'])
+    host.mem_total = info['MemTotal']
+    host.mem_free = info['MemFree']
+    host.swap_total = info['SwapTotal']
+    host.swap_free = info['SwapFree']
+    loadavg = files['loadavg']
+
+    host.load_5m = None if loadavg is None else float(loadavg.strip().split()[1])
+
+    ip_rr_s = r"\d+:\s+(?P<adapter>.*?)\s+inet\s+(?P<ip>\d+\.\d+\.\d+\.\d+)/(?P<size>\d+)"
+
+    info = collections.defaultdict(lambda: [])
+    for line in files['ipa'].split("\n"):
+        match = re.match(ip_rr_s, line)
+        if match is not None:
+            info[match.group('adapter')].append(
+                (IPAddress(match.group('ip')), int(match.group('size'))))
+
+    for adapter, ips_with_sizes in info.items():
+        for ip, sz in ips_with_sizes:
+            host.ips.append(str(ip))
+
+            if public_net is not None and ip in public_net:
+                host.public_net = NetworkAdapter(adapter, ip)
+
+            if cluster_net is not None and ip in cluster_net:
+                host.cluster_net = NetworkAdapter(adapter, ip)
+
+    for name, adapter_dct in files['interfaces'].items():
+        dev = adapter_dct['dev']
+        adapter = NetworkAdapter(dev, None)
+        adapter.is_phy = adapter_dct.get('is_phy')
+        adapter.speed = adapter_dct.get('speed')
+        adapter.speed_s = adapter_dct.get('speed_s')
+        adapter.duplex = adapter_dct.get('duplex')
+        host.net_adapters[dev] = adapter
+
+    # ethtool info is collected per adapter
+    for net in (host.cluster_net, host.public_net):
+        if net is not None and net.name in host.net_adapters:
+            adapter = host.net_adapters[net.name]
+            net.speed = adapter.speed
+            net.speed_s = adapter.speed_s
+            net.duplex = adapter.duplex
+
+    net_stats = parse_netdev(files['netdev'])
+    perf_adapters = [host.cluster_net, host.public_net] + list(host.net_adapters.values())
+
+    for net in perf_adapters:
+        if net is not None and net.name is not None:
+            net.perf_stats = net_stats.get(net.name)
+
+    host.uptime = float(files['uptime'].split()[0])
+
+    if files.get('time_ref') is not None:
+        host.clock_offset = parse_time_ref(files['time_ref'])
+
+    host.rusage_stats = files['rusage_stats']
+    if host.rusage_stats is None:
+        host.rusage_stats = parse_rusage(files['rusage'])
+    host.rusage_rates = rusage_rates(host.rusage_stats)
+    host.perf_monitoring = parse_perf_monitoring(files['perf_monitoring'])
+    return host
+
+
+def parse_host_job(args):
+    # multiprocessing.Pool.map passes a single argument
+    return parse_host(*args)
@@ -0,0 +1,132 @@
+import numpy
+
+
+def _osd_perf_value(name):
+    def getter(osd):
+        return None if osd.osd_perf is None else osd.osd_perf.get(name)
+    return getter
+
+
+def _osd_dev_value(name):
+    def getter(osd):
+        return None if osd.data_stor_stats is None else getattr(osd.data_stor_stats, name)
+    return getter
+
+
+# (value name, function to get it from CephOSD, None if unknown)
+osd_diff_values = [
+    ('apply_latency_ms', _osd_perf_value('apply_latency_ms')),
+    ('commit_latency_ms', _osd_perf_value('commit_latency_ms')),
+    ('iops', _osd_dev_value('iops_curr')),
+    ('lat', _osd_dev_value('lat_curr')),
+    ('queue_depth', _osd_dev_value('queue_depth_curr')),
+    ('pg_count', lambda osd: osd.pg_count),
+]
+
+
+def delta(old_val, new_val):
+    if old_val is None or new_val is None:
+        return None
+    return new_val - old_val
+
+
+def osds_diff(old, new):
+    # returns (added osd ids, removed osd ids,
+    #          [(osd id, {value name: (old, new)}), ...] for OSDs in both)
+    old_osds = dict((osd.id, osd) for osd in old.osds)
+    new_osds = dict((osd.id, osd) for osd in new.osds)
+
+    added = sorted(set(new_osds) - set(old_osds))
+    removed = sorted(set(old_osds) - set(new_osds))
+
+    rows = []
+    for osd_id in sorted(set(old_osds) & set(new_osds)):
+        old_osd = old_osds[osd_id]
+        new_osd = new_osds[osd_id]
+        values = dict((name, (getter(old_osd), getter(new_osd)))
+                      for name, getter in osd_diff_values)
+        values['status'] = (old_osd.status, new_osd.status)
+        values['host'] = (old_osd.host, new_osd.host)
+        rows.append((osd_id, values))
+
+    return added, removed, rows
+
+
+def pg_distribution_diff(old, new):
+    # OSD x pool matrices, aligned to the union of OSD ids and pool names;
+    # returns (osd ids, pool names, old matrix, new matrix)
+    osd_ids = sorted(set(old.pg_osd_ids) | set(new.pg_osd_ids))
+    pool_names = sorted(set(old.pg_pool_names) | set(new.pg_pool_names))
+
+    def aligned(cluster):
+        res = numpy.zeros((len(osd_ids), len(pool_names)), dtype=int)
+        rows = numpy.searchsorted(osd_ids, cluster.pg_osd_ids)
+        cols = numpy.searchsorted(pool_names, cluster.pg_pool_names)
+        res[numpy.ix_(rows, cols)] = cluster.osd_pool_pg
+        return res
+
+    return osd_ids, pool_names, aligned(old), aligned(new)
+
+
+def pg_moves(old_matrix, new_matrix):
+    # per pool count of PG copies, which appears on new OSDs;
+    # equals to amount of moved copies, if PG count is not changed
+    return numpy.maximum(new_matrix - old_matrix, 0).sum(axis=0)
+
+
+def config_diff(old, new):
+    # config key => [(osd id, old value, new value), ...],
+    # None for value, if key is absent; only OSDs from both collections
+    old_osds = dict((osd.id, osd) for osd in old.osds if osd.config is not None)
+    new_osds = dict((osd.id, osd) for osd in new.osds if osd.config is not None)
+
+    res = {}
+    for osd_id in sorted(set(old_osds) & set(new_osds)):
+        old_cfg = old_osds[osd_id].config
+        new_cfg = new_osds[osd_id].config
+        for key in set(old_cfg) | set(new_cfg):
+            old_val = old_cfg.get(key)
+            new_val = new_cfg.get(key)
+            if old_val != new_val:
+                res.setdefault(key, []).append((osd_id, old_val, new_val))
+    return res
+
+
+def _net_load(net, field):
+    if net is None or net.perf_stats_curr is None:
+        return None
+    return getattr(net.perf_stats_curr, field)
+
+
+host_diff_values = [
+    ('load_5m', lambda host: host.load_5m),
+    ('mem_free', lambda host: host.mem_free),
+    ('swap_used', lambda host: None if host.swap_total is None
+                                    else host.swap_total - host.swap_free),
+    ('cluster_net_send', lambda host: _net_load(host.cluster_net, 'sbytes')),
+    ('cluster_net_recv', lambda host: _net_load(host.cluster_net, 'rbytes')),
+    ('public_net_send', lambda host: _net_load(host.public_net, 'sbytes')),
+    ('public_net_recv', lambda host: _net_load(host.public_net, 'rbytes')),
+]
+
+
+def hosts_diff(old, new):
+    # returns (added hosts, removed hosts,
+    #          [(host name, {value name: (old, new)}), ...] for hosts in both)
+    added = sorted(set(new.hosts) - set(old.hosts))
+    removed = sorted(set(old.hosts) - set(new.hosts))
+
+    rows = []
+    for name in sorted(set(old.hosts) & set(new.hosts)):
+        old_host = old.hosts[name]
+        new_host = new.hosts[name]
+        rows.append((name, dict((vname, (getter(old_host), getter(new_host)))
+                                for vname, getter in host_diff_values)))
+    return added, removed, rows
+
+
+def health_diff(old, new):
+    # returns (new messages, resolved messages), as (severity, summary) pairs
+    old_items = set((msg['severity'], msg['summary']) for msg in old.health_summary)
+    new_items = set((msg['severity'], msg['summary']) for msg in new.health_summary)
+    return sorted(new_items - old_items), sorted(old_items - new_items)
@@ -6,6 +6,8 @@ import uuid
 import Queue
 import shutil
 import socket
+import hashlib
+import sqlite3
 import logging
 import os.path
 import argparse
@@ -102,25 +104,27 @@ class Collector(object):
         if check:
             if not self.collect_settings.allowed(path):
                 return
+        t1 = time.time()
         ok, out = check_output(cmd)
         if not ok:
             logger.warning("Cmd {0} failed locally".format(cmd))
-        self.emit(path, format, ok, out, check=False)
+        self.emit(path, format, ok, out, check=False, duration=time.time() - t1)
 
     def ssh2emit(self, host, path, format, cmd, check=True):
         if check:
             if not self.collect_settings.allowed(path):
                 return
+        t1 = time.time()
         ok, out = check_output_ssh(host, self.opts, cmd)
         if not ok:
             logger.warning("Cmd {0} failed on node {1}".format(cmd, host))
-        self.emit(path, format, ok, out, check=False)
+        self.emit(path, format, ok, out, check=False, duration=time.time() - t1)
 
-    def emit(self, path, format, ok, out, check=True):
+    def emit(self, path, format, ok, out, check=True, duration=None):
         if check:
             if not self.collect_settings.allowed(path):
                 return
-        self.res_q.put((ok, path, (format if ok else 'err'), out))
+        self.res_q.put((ok, path, (format if ok else 'err'), out, duration))
 
     # should provides set of on_XXX methods
     # where XXX - node role role
@@ -333,6 +337,21 @@ class NodeCollector(Collector):
         for path_off, frmt, cmd in self.node_commands:
             self.ssh2emit(host, path + path_off, frmt, cmd)
         self.collect_interfaces_info(path, host)
+        self.collect_time_reference(path, host)
+
+    def collect_time_reference(self, path, host):
+        # node clock, bracketed by local time before and after ssh call,
+        # used to align time series from different nodes
+        if not self.collect_settings.allowed(path + 'time_ref'):
+            return
+
+        before = time.time()
+        ok, node_time = check_output_ssh(host, self.opts, "date +%s.%N")
+        after = time.time()
+
+        if ok:
+            node_time = "{0!r}\n{1}\n{2!r}\n".format(before, node_time.strip(), after)
+        self.emit(path + 'time_ref', 'txt', ok, node_time, check=False, duration=after - before)
 
     def collect_interfaces_info(self, path, host):
         interfaces = {}
@@ -380,17 +399,117 @@ class NodeCollector(Collector):
         self.emit(path + 'interfaces', 'json', True, json.dumps(interfaces))
 
 
+def rusage_time_key(ctime):
+    return "{0:.3f}".format(ctime)
+
+
+rusage_monitor_code_templ = """#!/bin/bash
+for i in $(seq __count__) ; do
+    sleep __step__
+    echo "#snapshot $(date +%s.%N)"
+    cat /proc/diskstats
+    echo "#net"
+    cat /proc/net/dev
+done > __rusage_file__
+"""
+
+
 class NodeResourseUsageCollector(Collector):
     name = 'resource'
     run_alone = True
 
+    def __init__(self, *args, **kwargs):
+        super(NodeResourseUsageCollector, self).__init__(*args, **kwargs)
+        self.run_uuid = str(uuid.uuid1())
+        self.rusage_file = "/tmp/rusage_{0}.txt".format(self.run_uuid)
+        self.remote_file = "/tmp/rusage_{0}.sh".format(self.run_uuid)
+
+        # seconds between periodic snapshots
+        self.step = None
+
+        # host => [collector time of start and end snapshots]
+        self.snapshot_times = collections.defaultdict(list)
+
     def collect_node(self, path, host):
-        cpath = '{0}/rusage/{1}/{2}-disk'.format(path, host, int(time.time()))
+        # sub-second keys, so that snapshots taken in the same second
+        # don't overwrite each other
+        ctime = time.time()
+        self.snapshot_times[host].append(ctime)
+        cpath = '{0}/rusage/{1}/{2}-disk'.format(path, host, rusage_time_key(ctime))
         self.ssh2emit(host, cpath, "txt", "cat /proc/diskstats")
 
-        cpath = '{0}/rusage/{1}/{2}-net'.format(path, host, int(time.time()))
+        cpath = '{0}/rusage/{1}/{2}-net'.format(path, host, rusage_time_key(time.time()))
         self.ssh2emit(host, cpath, "txt", "cat /proc/net/dev")
 
+    def start_periodic_collection(self, path, host, count, step):
+        # takes count snapshots on node itself, step seconds apart,
+        # between usual start and end snapshots
+        self.step = step
+        local_file = "/tmp/{0}_rusage_{1}.sh".format(host, self.run_uuid)
+
+        rusage_monitor_code = rusage_monitor_code_templ \
+            .replace('__count__', str(count)) \
+            .replace('__step__', str(step)) \
+            .replace('__rusage_file__', self.rusage_file)
+
+        open(local_file, "w").write(rusage_monitor_code)
+        try:
+            scp_cmd = "scp {0} {1} {2}:{3}".format(SSH_OPTS, local_file,
+                                                   host, self.remote_file)
+
+            ok, _ = check_output(scp_cmd)
+            assert ok
+        finally:
+            os.unlink(local_file)
+
+        start_cmd = 'screen -S ceph_rusage -d -m bash ' + self.remote_file
+        check_output_ssh(host, self.opts, start_cmd, no_retry=True)
+
+    def collect_periodic_data(self, path, host):
+        t1 = time.time()
+        ok, out = check_output_ssh(host, self.opts, "date +%s.%N ; cat " + self.rusage_file)
+        t2 = time.time()
+
+        check_output_ssh(host, self.opts, "rm -f {0} {1}".format(self.rusage_file, self.remote_file),
+                         no_retry=True)
+
+        if not ok or "\n#snapshot " not in out:
+            logger.warning("No periodic usage snapshots from node %s", host)
+            return
+
+        # snapshots have node timestamps, convert them to collector clock,
+        # as start and end snapshots use it
+        try:
+            host_time, out = out.split("\n", 1)
+            offset = (t1 + t2) / 2 - float(host_time)
+        except ValueError:
+            logger.warning("Can't get node %s time for periodic usage snapshots", host)
+            return
+
+        # end snapshot is taken at the same time, as this one
+        other_times = self.snapshot_times[host] + [t1]
+
+        for snapshot in out.split("#snapshot ")[1:]:
+            try:
+                ts, data = snapshot.split("\n", 1)
+                disk_data, net_data = data.split("#net\n", 1)
+                # time, when snapshot was actually taken, as sleep in
+                # sampler and its start are not precise
+                ts = float(ts) + offset
+            except ValueError:
+                logger.warning("Broken periodic usage snapshot from node %s", host)
+                continue
+
+            # snapshot near to start or end one gives no extra data; half of step
+            # is used, as periodic snapshots are about step apart from them
+            if any(abs(ts - other) < self.step / 2.0 for other in other_times):
+                continue
+
+            self.emit('{0}/rusage/{1}/{2}-disk'.format(path, host, rusage_time_key(ts)),
+                      "txt", True, disk_data)
+            self.emit('{0}/rusage/{1}/{2}-net'.format(path, host, rusage_time_key(ts)),
+                      "txt", True, net_data)
+
 
 performance_monitor_code_templ = """#!/bin/bash
 function monitor_ceph_io() {
@@ -517,17 +636,163 @@ class CephDiscovery(object):
                     yield 'osd', str(node['name']), {'osd_id': osd_id}
 
 
+MANIFEST_FILE = "manifest.json"
+SQLITE_FILE = "results.db"
+
+# collector log is written to the result folder directly, not through writer
+LOG_ITEM = "log"
+
+
+# payloads smaller than this are always stored as is
+DEDUP_MIN_SIZE = 256
+
+
+class FolderResultsWriter(object):
+    def __init__(self, out_folder, dedup=True):
+        self.out_folder = out_folder
+        self.dedup = dedup
+
+        # manifest records every stored item, so that the report generator
+        # can find out what was collected without walking the result folder
+        self.manifest = []
+
+        # hash => file with this content, relative to out_folder
+        self.stored = {}
+
+        # items, which are written into out_folder not by this writer
+        self.files = []
+
+    def store(self, path, frmt, ok, out, duration):
+        fname = path + '.' + frmt
+        full_fname = os.path.join(self.out_folder, fname)
+        dr = os.path.dirname(full_fname)
+
+        if not os.path.exists(dr):
+            os.makedirs(dr)
+
+        dhash = hashlib.sha1(out).hexdigest()
+        ref = self.stored.get(dhash) if self.dedup and len(out) >= DEDUP_MIN_SIZE else None
+
+        if ref is not None:
+            # same content already stored - put reference file instead,
+            # which contains path to the original file relative to own folder
+            rel_ref = os.path.relpath(os.path.join(self.out_folder, ref), dr)
+            open(full_fname + '.ref', "w").write(rel_ref)
+        else:
+            self.stored[dhash] = fname
+            if frmt == 'bin':
+                open(full_fname, "wb").write(out)
+            else:
+                open(full_fname, "w").write(out)
+
+        self.manifest.append({'path': path,
+                              'format': frmt,
+                              'ok': ok,
+                              'size': len(out),
+                              'hash': dhash,
+                              'ref': ref,
+                              'duration': duration})
+
+    def add_file(self, path, frmt):
+        self.files.append({'path': path, 'format': frmt})
+
+    def close(self, pretty=True):
+        self.manifest.sort(key=lambda x: x['path'])
+        open(os.path.join(self.out_folder, MANIFEST_FILE), "w").write(
+            json.dumps({'version': 1, 'items': self.manifest, 'files': self.files},
+                       indent=4 if pretty else None,
+                       sort_keys=True))
+
+
+rusage_path_re = re.compile(r"rusage/(?P<host>[^/]+)/(?P<ts>\d+(?:\.\d+)?)-(?P<tp>disk|net)$")
+
+sqlite_diskstat_fields = ["reads_completed", "reads_merged", "sectors_read",
+                          "read_time", "writes_completed", "writes_merged",
+                          "sectors_written", "write_time", "in_progress_io",
+                          "io_time", "weighted_io_time"]
+
+sqlite_netdev_fields = ("rbytes rpackets rerrs rdrop rfifo rframe rcompressed" +
+                        " rmulticast sbytes spackets serrs sdrop sfifo scolls" +
+                        " scarrier scompressed").split()
+
+sqlite_schema = """
+CREATE TABLE blobs (hash TEXT PRIMARY KEY, data BLOB);
+CREATE TABLE items (path TEXT PRIMARY KEY, format TEXT, ok INTEGER,
+                    size INTEGER, hash TEXT, duration REAL);
+CREATE TABLE files (path TEXT PRIMARY KEY, format TEXT);
+CREATE TABLE diskstats (host TEXT, ts REAL, major INTEGER, minor INTEGER,
+                        device TEXT, {0});
+CREATE TABLE netdev (host TEXT, ts REAL, adapter TEXT, {1});
+CREATE INDEX diskstats_idx ON diskstats (host, ts);
+CREATE INDEX netdev_idx ON netdev (host, ts);
+""".format(", ".join(name + " INTEGER" for name in sqlite_diskstat_fields),
+           ", ".join(name + " INTEGER" for name in sqlite_netdev_fields))
+
+
+class SQLiteResultsWriter(object):
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(sqlite_schema)
+
+    def store(self, path, frmt, ok, out, duration):
+        dhash = hashlib.sha1(out).hexdigest()
+        self.db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)",
+                        (dhash, sqlite3.Binary(out)))
+        self.db.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)",
+                        (path, frmt, ok, len(out), dhash, duration))
+
+        rusage_m = rusage_path_re.match(path)
+        if ok and rusage_m is not None:
+            try:
+                self.store_rusage(rusage_m.group('host'), float(rusage_m.group('ts')),
+                                  rusage_m.group('tp'), out)
+            except (ValueError, IndexError):
+                logger.warning("Can't parse %s, it would be stored as blob only", path)
+
+    def store_rusage(self, host, ts, tp, out):
+        rows = []
+        if tp == 'disk':
+            # newer kernels add extra fields at the end of line
+            nfields = len(sqlite_diskstat_fields)
+            for line in out.strip().split("\n"):
+                vals = line.split()
+                rows.append([host, ts, int(vals[0]), int(vals[1]), vals[2]] +
+                            map(int, vals[3:3 + nfields]))
+            sql = "INSERT INTO diskstats VALUES ({0})".format(", ".join("?" * (nfields + 5)))
+        else:
+            nfields = len(sqlite_netdev_fields)
+            for line in out.strip().split("\n")[2:]:
+                adapter, data = line.split(":", 1)
+                rows.append([host, ts, adapter.strip()] + map(int, data.split()[:nfields]))
+            sql = "INSERT INTO netdev VALUES ({0})".format(", ".join("?" * (nfields + 3)))
+
+        self.db.executemany(sql, rows)
+
+    # item, which is written into database folder not by this writer
+    def add_file(self, path, frmt):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?)", (path, frmt))
+
+    def close(self, pretty=True):
+        self.db.commit()
+        self.db.close()
+
+
 def save_results_th_func(opts, res_q, out_folder):
+    if opts.sqlite:
+        writer = SQLiteResultsWriter(os.path.join(out_folder, SQLITE_FILE))
+    else:
+        writer = FolderResultsWriter(out_folder, dedup=not opts.no_dedup)
+
     try:
         while True:
             val = res_q.get()
             if val is None:
                 break
 
-            ok, path, frmt, out = val
+            ok, path, frmt, out, duration = val
 
             while '//' in path:
-                path.replace('//', '/')
+                path = path.replace('//', '/')
 
             while path.startswith('/'):
                 path = path[1:]
@@ -535,25 +800,21 @@ def save_results_th_func(opts, res_q, out_folder):
             while path.endswith('/'):
                 path = path[:-1]
 
-            fname = os.path.join(out_folder, path + '.' + frmt)
-            dr = os.path.dirname(fname)
-
-            if not os.path.exists(dr):
-                os.makedirs(dr)
+            if frmt == 'json' and not opts.no_pretty_json:
+                try:
+                    out = json.dumps(json.loads(out), indent=4, sort_keys=True)
+                except Exception:
+                    pass
 
-            if frmt == 'bin':
-                open(fname, "wb").write(out)
-            elif frmt == 'json':
-                if not opts.no_pretty_json:
-                    try:
-                        out = json.dumps(json.loads(out), indent=4, sort_keys=True)
-                    except Exception:
-                        pass
-                open(fname, "w").write(out)
-            else:
-                open(fname, "w").write(out)
+            writer.store(path, frmt, ok, out, duration)
     except Exception:
         logger.exception("In save_results_th_func thread")
+    finally:
+        try:
+            writer.add_file(LOG_ITEM, 'txt')
+            writer.close(pretty=not opts.no_pretty_json)
+        except Exception:
+            logger.exception("Failed to finalize results storage")
 
 
 def discover_nodes(opts):
@@ -656,6 +917,11 @@ def parse_args(argv):
                    default=60, type=int, metavar="SEC",
                    help="Collect usage for at lease SEC seconds")
 
+    p.add_argument("--usage-snapshots",
+                   default=2, type=int, metavar="COUNT",
+                   help="Take COUNT usage snapshots over usage collect interval " +
+                   "(at least two - at the beginning and at the end)")
+
     p.add_argument("-d", "--disable", default=[],
                    nargs='*', help="Disable collect pattern")
 
@@ -681,7 +947,18 @@ def parse_args(argv):
                    action="store_true",
                    help="Don't prettify json data")
 
-    return p.parse_args(argv[1:])
+    p.add_argument("--no-dedup", default=False,
+                   action="store_true",
+                   help="Store identical outputs in separated files")
+
+    p.add_argument("--sqlite", default=False,
+                   action="store_true",
+                   help="Store all results into single sqlite database")
+
+    opts = p.parse_args(argv[1:])
+    if opts.usage_snapshots < 2:
+        p.error("--usage-snapshots should be at least 2")
+    return opts
 
 
 logger_ready = False
@@ -758,7 +1035,7 @@ def main(argv):
     os.makedirs(out_folder)
 
     setup_loggers(getattr(logging, opts.log_level),
-                  os.path.join(out_folder, "log.txt"))
+                  os.path.join(out_folder, LOG_ITEM + ".txt"))
 
     global logger_ready
     logger_ready = True
@@ -817,7 +1094,7 @@ def main(argv):
         logger.warning("Next hosts aren't awailable over ssh and would be skipped: %s",
                        ",".join(bad_hosts))
 
-    res_q.put((True, "bad_hosts", 'json', json.dumps(list(bad_hosts))))
+    res_q.put((True, "bad_hosts", 'json', json.dumps(list(bad_hosts)), None))
 
     new_nodes = collections.defaultdict(lambda: {})
 
@@ -836,6 +1113,15 @@ def main(argv):
         for node, _ in nodes['node'].items():
             run_q.put((node_resource_collector.collect_node, "", node, {}))
 
+    # periodic usage snapshots between the first and the final ones, samplers
+    # are queued before other collectors, so that they start in time
+    periodic_snapshots = opts.usage_snapshots - 2
+    if node_resource_collector is not None and periodic_snapshots > 0:
+        periodic_step = max(1, opts.usage_collect_interval // (opts.usage_snapshots - 1))
+        for node, _ in nodes['node'].items():
+            run_q.put((node_resource_collector.start_periodic_collection, "", node,
+                       {'count': periodic_snapshots, 'step': periodic_step}))
+
     for role, nodes_with_args in nodes.items():
         for collector in collectors:
             if hasattr(collector, 'collect_' + role):
@@ -863,6 +1149,8 @@ def main(argv):
             logger.info("Start final usage collection")
             for node, _ in nodes['node'].items():
                 run_q.put((node_resource_collector.collect_node, "", node, {}))
+                if periodic_snapshots > 0:
+                    run_q.put((node_resource_collector.collect_periodic_data, "", node, {}))
             run_all(opts, run_q)
 
         if ceph_performance_collector is not None:
@@ -0,0 +1,80 @@
+import collections
+
+
+class CrushTree(object):
+    # indexed 'ceph osd tree' - parent/children links, ancestors of each
+    # node by bucket type and osd sets for every subtree
+    def __init__(self, nodes):
+        self.nodes = dict((node['id'], node) for node in nodes)
+        self.children = dict((node['id'], list(node.get('children', []))) for node in nodes)
+
+        self.parent = dict((node_id, None) for node_id in self.nodes)
+        for node_id, children in self.children.items():
+            for child_id in children:
+                self.parent[child_id] = node_id
+
+        # there could be several roots, 'default' is usually first
+        self.root_ids = [node['id'] for node in nodes if self.parent[node['id']] is None]
+
+        # node id => {bucket type: ancestor (or node itself) id}
+        self.ancestors = {}
+
+        # node id => osd ids in subtree, in tree order
+        self.subtree_osds = {}
+
+        order = []
+        stack = [(root_id, {}) for root_id in reversed(self.root_ids)]
+        while stack:
+            node_id, ancestors = stack.pop()
+            ancestors = dict(ancestors)
+            ancestors[self.nodes[node_id]['type']] = node_id
+            self.ancestors[node_id] = ancestors
+            order.append(node_id)
+            for child_id in reversed(self.children[node_id]):
+                stack.append((child_id, ancestors))
+
+        # children go after parents in order, so reversed order is bottom-up
+        for node_id in reversed(order):
+            if self.nodes[node_id]['type'] == 'osd':
+                self.subtree_osds[node_id] = [node_id]
+            else:
+                self.subtree_osds[node_id] = [osd_id
+                                              for child_id in self.children[node_id]
+                                              for osd_id in self.subtree_osds[child_id]]
+
+        self.osd_ids = sorted(node_id for node_id in order if self.nodes[node_id]['type'] == 'osd')
+
+        self.host_osds = collections.defaultdict(list)
+        for osd_id in self.osd_ids:
+            host_name = self.ancestor_name(osd_id, 'host')
+            if host_name is not None:
+                self.host_osds[host_name].append(osd_id)
+        self.host_osds = dict(self.host_osds)
+
+        self.aggregates = {}
+
+    def ancestor(self, node_id, tp):
+        anc_id = self.ancestors.get(node_id, {}).get(tp)
+        return None if anc_id is None else self.nodes[anc_id]
+
+    def ancestor_name(self, node_id, tp):
+        node = self.ancestor(node_id, tp)
+        return None if node is None else node['name']
+
+    def iter_nodes(self):
+        # (depth, node) pairs, parent first
+        stack = [(0, root_id) for root_id in reversed(self.root_ids)]
+        while stack:
+            depth, node_id = stack.pop()
+            yield depth, self.nodes[node_id]
+            for child_id in reversed(self.children[node_id]):
+                stack.append((depth + 1, child_id))
+
+    def aggregate(self, name, per_osd):
+        # per_osd - {osd_id: value}, result {node_id: sum over subtree osds};
+        # cached by name, as each report section asks for the same sums
+        if name not in self.aggregates:
+            self.aggregates[name] = dict(
+                (node_id, sum(per_osd.get(osd_id, 0) for osd_id in osds))
+                for node_id, osds in self.subtree_osds.items())
+        return self.aggregates[name]
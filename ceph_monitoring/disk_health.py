@@ -0,0 +1,172 @@
+import re
+
+from multiprocessing import Pool as MPExecutorPool
+
+
+# ATA attributes table line:
+# ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE
+#   5 Reallocated_Sector_Ct   0x0033   100   100   010    Pre-fail  Always       -       0
+smart_attr_re = re.compile(r"^\s*(?P<id>\d+)\s+(?P<name>\S+)\s+0x[0-9a-fA-F]+\s+(?P<value>\d+)\s+" +
+                           r"\d+\s+\S+\s+\S+\s+\S+\s+\S+\s+(?P<raw>\d+)", re.M)
+
+smart_health_re = re.compile(r"^(?:SMART overall-health self-assessment test result|" +
+                             r"SMART Health Status):\s*(?P<status>\S+)", re.M)
+model_re = re.compile(r"^(?:Device Model|Product):\s*(?P<model>.*?)\s*$", re.M)
+serial_re = re.compile(r"^Serial [Nn]umber:\s*(?P<serial>\S+)", re.M)
+
+# SATA Version is:  SATA 3.0, 6.0 Gb/s (current: 3.0 Gb/s)
+sata_link_re = re.compile(r"^SATA Version is:.*?(?P<max>[\d.]+ Gb/s)(?: \(current: (?P<curr>[\d.]+ Gb/s)\))?",
+                          re.M)
+# SAS - 'Negotiated logical link rate: phy enabled; 6 Gbps'
+sas_link_re = re.compile(r"Negotiated logical link rate:.*?(?P<speed>[\d.]+) Gbps")
+
+# SAS devices has no attributes table
+sas_defects_re = re.compile(r"^Elements in grown defect list:\s*(?P<count>\d+)", re.M)
+sas_endurance_re = re.compile(r"^Percentage used endurance indicator:\s*(?P<used>\d+)%", re.M)
+sas_temperature_re = re.compile(r"^Current Drive Temperature:\s*(?P<temp>\d+) C", re.M)
+sas_power_on_re = re.compile(r"^\s*Accumulated power on time, hours:minutes (?P<hours>\d+)", re.M)
+
+# hdparm -I, '*' marks enabled features
+#    *    Write cache
+write_cache_re = re.compile(r"^\s*(?P<enabled>\*)?\s+Write cache\s*$", re.M)
+
+
+# smart attribute id => field, raw values
+smart_raw_attrs = {
+    5: 'reallocated',
+    9: 'power_on_hours',
+    190: 'temperature',
+    194: 'temperature',
+    197: 'pending',
+    198: 'offline_uncorrectable',
+    199: 'crc_errors',
+}
+
+# vendor-specific ssd wearout attributes, normalized value is % of life left
+smart_wearout_attrs = (233, 177, 202, 231)
+
+# fields of DiskHealth, which are bad if they are above zero
+error_counters = ('reallocated', 'pending', 'offline_uncorrectable', 'crc_errors')
+
+# SSD with less life left is about to fail, %
+WEAROUT_WARN = 10
+
+
+class DiskHealth(object):
+    def __init__(self, host, dev):
+        self.host = host
+        self.dev = dev
+
+        # ['osd.N data', 'osd.M journal', ...] - OSD's, which uses device
+        self.users = []
+        self.is_ssd = None
+
+        self.model = None
+        self.serial = None
+
+        # None if unknown
+        self.smart_passed = None
+        self.reallocated = None
+        self.pending = None
+        self.offline_uncorrectable = None
+        self.crc_errors = None
+        self.power_on_hours = None
+        self.temperature = None
+
+        # % of life left for SSD
+        self.wearout = None
+        self.write_cache = None
+
+        # 'N Gb/s' - current link speed
+        self.link_speed = None
+
+    def problems(self):
+        res = [name for name in error_counters if getattr(self, name)]
+        if self.smart_passed is False:
+            res.append('smart_passed')
+        if self.wearout is not None and self.wearout <= WEAROUT_WARN:
+            res.append('wearout')
+        return res
+
+
+def parse_smartctl(data):
+    # returns {field: value} for DiskHealth
+    res = {}
+
+    if data is None:
+        return res
+
+    match = smart_health_re.search(data)
+    if match is not None:
+        res['smart_passed'] = match.group('status') in ('PASSED', 'OK')
+
+    match = model_re.search(data)
+    if match is not None:
+        res['model'] = match.group('model')
+
+    match = serial_re.search(data)
+    if match is not None:
+        res['serial'] = match.group('serial')
+
+    for match in smart_attr_re.finditer(data):
+        attr_id = int(match.group('id'))
+        if attr_id in smart_raw_attrs:
+            res.setdefault(smart_raw_attrs[attr_id], int(match.group('raw')))
+        elif attr_id in smart_wearout_attrs:
+            res.setdefault('wearout', int(match.group('value')))
+
+    match = sata_link_re.search(data)
+    if match is not None:
+        res['link_speed'] = match.group('curr') or match.group('max')
+    else:
+        match = sas_link_re.search(data)
+        if match is not None:
+            res['link_speed'] = match.group('speed') + " Gb/s"
+
+    for rr, name, func in ((sas_defects_re, 'reallocated', int),
+                           (sas_endurance_re, 'wearout', lambda used: 100 - int(used)),
+                           (sas_temperature_re, 'temperature', int),
+                           (sas_power_on_re, 'power_on_hours', int)):
+        if name not in res:
+            match = rr.search(data)
+            if match is not None:
+                res[name] = func(match.group(1))
+
+    return res
+
+
+def parse_hdparm(data):
+    if data is None:
+        return {}
+
+    match = write_cache_re.search(data)
+    if match is None:
+        return {}
+    return {'write_cache': match.group('enabled') is not None}
+
+
+def parse_device(args):
+    # args - (smartctl output, hdparm output), None for missing
+    smartctl, hdparm = args
+    res = parse_smartctl(smartctl)
+    res.update(parse_hdparm(hdparm))
+    return res
+
+
+def parse_devices(devices, workers=1):
+    # devices - [(DiskHealth, smartctl output, hdparm output), ...];
+    # fills DiskHealth objects in place
+    args = [(smartctl, hdparm) for _, smartctl, hdparm in devices]
+    if workers > 1 and len(args) > 1:
+        mp_pool = MPExecutorPool(processes=min(workers, len(args)))
+        try:
+            results = mp_pool.map(parse_device, args)
+        finally:
+            mp_pool.close()
+            mp_pool.join()
+    else:
+        results = map(parse_device, args)
+
+    for (health, _, _), fields in zip(devices, results):
+        for name, val in fields.items():
+            setattr(health, name, val)
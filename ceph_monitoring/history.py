@@ -0,0 +1,298 @@
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import os.path
+import tarfile
+import hashlib
+import argparse
+import datetime
+import tempfile
+import itertools
+
+from storage import (open_storage, is_sqlite_file, SQLiteResultStorage,
+                     Manifest, ManifestItem, JResultStorage, MANIFEST_FILE, SQLITE_FILE)
+
+
+history_schema = """
+CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS collections (id INTEGER PRIMARY KEY, fsid TEXT,
+                                        collected_at REAL, source TEXT,
+                                        UNIQUE (fsid, collected_at));
+CREATE TABLE IF NOT EXISTS items (collection_id INTEGER, path TEXT, format TEXT,
+                                  ok INTEGER, size INTEGER, hash TEXT, duration REAL,
+                                  host TEXT, osd_id INTEGER,
+                                  PRIMARY KEY (collection_id, path));
+CREATE INDEX IF NOT EXISTS items_host_idx ON items (host, collection_id);
+CREATE INDEX IF NOT EXISTS items_osd_idx ON items (osd_id, collection_id);
+CREATE INDEX IF NOT EXISTS collections_time_idx ON collections (fsid, collected_at);
+"""
+
+per_host_dirs = ('hosts', 'rusage', 'perf_monitoring', 'mon')
+
+
+class HistoryResultStorage(SQLiteResultStorage):
+    def __init__(self, db, collection_id, manifest=None, rel_path=None, cache=None):
+        self._collection_id = collection_id
+        SQLiteResultStorage.__init__(self, db, manifest, rel_path, cache)
+
+    def _load_manifest(self):
+        items = self._db.execute("SELECT path, format, ok, size, hash, duration " +
+                                 "FROM items WHERE collection_id=?", (self._collection_id,))
+        return Manifest(ManifestItem(path, frmt, bool(ok), size, dhash, duration, None)
+                        for path, frmt, ok, size, dhash, duration in items)
+
+    def _child(self, name):
+        return self.__class__(self._db, self._collection_id, self._manifest,
+                              self._rel_join(name), self._cache)
+
+    def rusage_series(self, host, stat_type, stat_cls):
+        return None
+
+
+class HistoryStore(object):
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.executescript(history_schema)
+
+    def collections(self, fsid=None, since=None, till=None):
+        sql = "SELECT id, fsid, collected_at, source FROM collections WHERE 1"
+        params = []
+        for cond, val in (("fsid=?", fsid), ("collected_at>=?", since), ("collected_at<=?", till)):
+            if val is not None:
+                sql += " AND " + cond
+                params.append(val)
+        return self.db.execute(sql + " ORDER BY collected_at", params).fetchall()
+
+    def storage(self, collection_id):
+        return HistoryResultStorage(self.db, collection_id)
+
+    def ingest(self, path):
+        if os.path.isfile(path) and not is_sqlite_file(path):
+            return self.ingest_archive(path)
+        return self.ingest_storage(open_storage(path), path)
+
+    # returns new collection id, or None if collection is already in history
+    def ingest_storage(self, storage, source, extra_items=()):
+        jstorage = JResultStorage(storage)
+        return self.add_collection(source, jstorage.master.status,
+                                   storage.get('master/collected_at'),
+                                   jstorage.master.osd_tree,
+                                   itertools.chain(self.storage_items(storage), extra_items))
+
+    # archive members are read one by one, without unpacking archive to disk
+    def ingest_archive(self, path):
+        manifest = None
+        db_path = None
+
+        # item path => (format, size, hash)
+        items = {}
+
+        # item path => (format, referenced file), for deduplicated items
+        refs = {}
+
+        # file name => (size, hash)
+        files = {}
+        master = {}
+
+        tar = tarfile.open(path, 'r|*')
+        try:
+            for member in tar:
+                if not member.isfile():
+                    continue
+
+                name = os.path.normpath(member.name)
+                fobj = tar.extractfile(member)
+
+                if name == SQLITE_FILE:
+                    # sqlite can't read database from stream
+                    fd, db_path = tempfile.mkstemp(suffix='.db')
+                    with os.fdopen(fd, 'wb') as db_fd:
+                        shutil.copyfileobj(fobj, db_fd)
+                    continue
+
+                data = fobj.read()
+                if name == MANIFEST_FILE:
+                    manifest = Manifest.from_json(json.loads(data))
+                elif name.endswith('.ref'):
+                    item_path, frmt = name[:-len('.ref')].rsplit('.', 1)
+                    refs[item_path] = (frmt, os.path.normpath(os.path.join(os.path.dirname(name),
+                                                                           data.strip())))
+                elif '.' in os.path.basename(name):
+                    item_path, frmt = name.rsplit('.', 1)
+                    dhash = self.store_blob(data)
+                    files[name] = (len(data), dhash)
+                    items[item_path] = (frmt, len(data), dhash)
+                    if item_path in ('master/status', 'master/osd_tree', 'master/collected_at'):
+                        master[item_path] = data
+        finally:
+            tar.close()
+
+        for item_path, (frmt, ref) in refs.items():
+            if ref in files:
+                items[item_path] = (frmt,) + files[ref]
+
+        if db_path is not None:
+            # only files, collected not into database, like log.txt, are in archive next to it
+            try:
+                extra_items = [(item_path, frmt, frmt != 'err', size, dhash, None)
+                               for item_path, (frmt, size, dhash) in items.items()]
+                return self.ingest_storage(SQLiteResultStorage(db_path), path, extra_items)
+            finally:
+                os.unlink(db_path)
+
+        stored_items = []
+        for item_path, (frmt, size, dhash) in sorted(items.items()):
+            item = None if manifest is None else manifest.items.get(item_path)
+            if item is not None:
+                stored_items.append((item_path, frmt, item.ok, size, dhash, item.duration))
+            else:
+                stored_items.append((item_path, frmt, frmt != 'err', size, dhash, None))
+
+        return self.add_collection(path, json.loads(master['master/status']),
+                                   master['master/collected_at'],
+                                   json.loads(master['master/osd_tree']),
+                                   stored_items)
+
+    # yields (path, format, ok, size, hash, duration) for all items in storage
+    def storage_items(self, storage):
+        for path in storage.walk():
+            item = storage.stat(path)
+            dhash = item.hash
+
+            # only data, which isn't in history yet, is read
+            if dhash is None or not self.have_blob(dhash):
+                _, _, data = storage[path]
+                dhash = self.store_blob(data)
+
+            yield path, item.format, item.ok, item.size, dhash, item.duration
+
+    def store_blob(self, data):
+        dhash = hashlib.sha1(data).hexdigest()
+        self.db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)", (dhash, sqlite3.Binary(data)))
+        return dhash
+
+    # items - (path, format, ok, size, hash, duration), blobs must be stored
+    # by the time item is taken; returns None if collection is already in history
+    def add_collection(self, source, status, collected_at, osd_tree, items):
+        fsid = status.get('fsid')
+        collected_at = float(collected_at.strip().split("\n")[2])
+
+        if self.collections(fsid, collected_at, collected_at) != []:
+            return None
+
+        osd2host = {}
+        for node in osd_tree['nodes']:
+            if node['type'] == 'host':
+                for child_id in node.get('children', []):
+                    osd2host[child_id] = node['name']
+
+        cursor = self.db.execute("INSERT INTO collections (fsid, collected_at, source) VALUES (?, ?, ?)",
+                                 (fsid, collected_at, os.path.abspath(source)))
+        collection_id = cursor.lastrowid
+
+        for path, frmt, ok, size, dhash, duration in items:
+            host = osd_id = None
+            parts = path.split('/')
+            if len(parts) > 2 and parts[0] in per_host_dirs:
+                host = parts[1]
+            elif len(parts) > 2 and parts[0] == 'osd':
+                osd_id = int(parts[1])
+                host = osd2host.get(osd_id)
+
+            self.db.execute("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (collection_id, path, frmt, ok, size, dhash, duration, host, osd_id))
+
+        self.db.commit()
+        return collection_id
+
+    def have_blob(self, dhash):
+        return self.db.execute("SELECT 1 FROM blobs WHERE hash=?", (dhash,)).fetchone() is not None
+
+    def find(self, path_glob=None, host=None, osd_id=None, fsid=None, since=None, till=None):
+        sql = "SELECT c.id, c.collected_at, i.path, i.format, i.ok, i.size, i.hash " + \
+              "FROM items i JOIN collections c ON i.collection_id = c.id WHERE 1"
+        params = []
+        for cond, val in (("i.path GLOB ?", path_glob), ("i.host=?", host), ("i.osd_id=?", osd_id),
+                          ("c.fsid=?", fsid), ("c.collected_at>=?", since),
+                          ("c.collected_at<=?", till)):
+            if val is not None:
+                sql += " AND " + cond
+                params.append(val)
+        return self.db.execute(sql + " ORDER BY c.collected_at, i.path", params).fetchall()
+
+    def read(self, dhash):
+        data, = self.db.execute("SELECT data FROM blobs WHERE hash=?", (dhash,)).fetchone()
+        return str(data)
+
+
+def to_timestamp(val):
+    if val is None:
+        return None
+    try:
+        return float(val)
+    except ValueError:
+        sdate = datetime.datetime.strptime(val, "%Y-%m-%d")
+        return time.mktime(sdate.timetuple())
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser()
+    p.add_argument("db", help="History database file")
+    subparsers = p.add_subparsers(dest='subparser_name')
+
+    ingest_parser = subparsers.add_parser('ingest', help="Add collections to history")
+    ingest_parser.add_argument("data", nargs='+', help="Folder with data, .tar.gz archive or sqlite file")
+
+    list_parser = subparsers.add_parser('list', help="List collections")
+    list_parser.add_argument("--fsid", default=None, help="Cluster fsid")
+
+    find_parser = subparsers.add_parser('find', help="Find collected items")
+    find_parser.add_argument("-p", "--path", default=None, help="Item path glob, like 'hosts/*/meminfo'")
+    find_parser.add_argument("--host", default=None, help="Host name")
+    find_parser.add_argument("--osd", default=None, type=int, help="OSD id")
+    find_parser.add_argument("--fsid", default=None, help="Cluster fsid")
+    find_parser.add_argument("--since", default=None, help="Timestamp or YYYY-MM-DD")
+    find_parser.add_argument("--till", default=None, help="Timestamp or YYYY-MM-DD")
+    find_parser.add_argument("-d", "--dump", default=False, action="store_true",
+                             help="Print items content")
+
+    return p.parse_args(argv[1:])
+
+
+def main(argv):
+    opts = parse_args(argv)
+    store = HistoryStore(opts.db)
+
+    if opts.subparser_name == 'ingest':
+        for path in opts.data:
+            collection_id = store.ingest(path)
+            if collection_id is None:
+                print path, "is already in history"
+            else:
+                print path, "stored as collection", collection_id
+
+    elif opts.subparser_name == 'list':
+        for collection_id, fsid, collected_at, source in store.collections(opts.fsid):
+            print "{0:>5} {1} {2} {3}".format(
+                collection_id, fsid,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(collected_at)),
+                source)
+
+    elif opts.subparser_name == 'find':
+        items = store.find(opts.path, opts.host, opts.osd, opts.fsid,
+                           to_timestamp(opts.since), to_timestamp(opts.till))
+        for collection_id, collected_at, path, frmt, ok, size, dhash in items:
+            print "{0:>5} {1} {2}.{3} {4} {5}".format(
+                collection_id, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(collected_at)),
+                path, frmt, size, "" if ok else "FAILED")
+            if opts.dump:
+                print store.read(dhash)
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main(sys.argv))
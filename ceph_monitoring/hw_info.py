@@ -1,5 +1,12 @@
 import re
-import xml.etree.ElementTree as ET
+import copy
+import hashlib
+from cStringIO import StringIO
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 
 def get_data(rr, data):
@@ -150,130 +157,227 @@ class HWInfo(object):
         return str(self.hostname) + ":\n" + "\n".join("    " + i for i in res)
 
 
-def get_hw_info(lshw_out):
-    res = HWInfo()
+def get_text(node, name, default=None):
+    child = node.find(name)
+    return default if child is None else child.text
 
-    res.raw = lshw_out
-    lshw_et = ET.fromstring(lshw_out)
 
-    try:
-        res.hostname = lshw_et.find("node").attrib['id']
-    except:
-        pass
+def get_setting(node, name):
+    setting = node.find("configuration/setting[@id='{0}']".format(name))
+    return None if setting is None else setting.attrib['value']
+
 
+def on_system_node(res, node):
+    res.hostname = node.attrib.get('id')
     try:
-        res.sys_name = (lshw_et.find("node/vendor").text + " " +
-                        lshw_et.find("node/product").text)
+        res.sys_name = node.find("vendor").text + " " + node.find("product").text
         res.sys_name = res.sys_name.replace("(To be filled by O.E.M.)", "")
         res.sys_name = res.sys_name.replace("(To be Filled by O.E.M.)", "")
     except:
         pass
 
-    core = lshw_et.find("node/node[@id='core']")
-    if core is None:
-        return
 
+def on_core_node(res, node):
     try:
-        res.mb = " ".join(core.find(node).text
-                          for node in ['vendor', 'product', 'version'])
+        res.mb = " ".join(node.find(name).text for name in ['vendor', 'product', 'version'])
     except:
         pass
 
-    for cpu in core.findall("node[@class='processor']"):
-        try:
-            model = cpu.find('product').text
-            threads_node = cpu.find("configuration/setting[@id='threads']")
-            if threads_node is None:
-                threads = 1
-            else:
-                threads = int(threads_node.attrib['value'])
-            res.cores.append((model, threads))
-        except:
-            pass
 
-    res.ram_size = 0
-    for mem_node in core.findall(".//node[@class='memory']"):
-        descr = mem_node.find('description')
-        try:
-            if descr is not None and descr.text == 'System Memory':
-                mem_sz = mem_node.find('size')
-                if mem_sz is None:
-                    for slot_node in mem_node.find("node[@class='memory']"):
-                        slot_sz = slot_node.find('size')
-                        if slot_sz is not None:
-                            assert slot_sz.attrib['units'] == 'bytes'
-                            res.ram_size += int(slot_sz.text)
-                else:
-                    assert mem_sz.attrib['units'] == 'bytes'
-                    res.ram_size += int(mem_sz.text)
-        except:
-            pass
+def on_processor_node(res, node):
+    model = node.find('product').text
+    threads = get_setting(node, 'threads')
+    res.cores.append((model, 1 if threads is None else int(threads)))
 
-    for net in core.findall(".//node[@class='network']"):
-        try:
-            link = net.find("configuration/setting[@id='link']")
-            if link.attrib['value'] == 'yes':
-                name = net.find("logicalname").text
-                speed_node = net.find("configuration/setting[@id='speed']")
 
-                if speed_node is None:
-                    speed = None
-                else:
-                    speed = speed_node.attrib['value']
+def on_memory_node(res, node):
+    if get_text(node, 'description') != 'System Memory':
+        return
 
-                dup_node = net.find("configuration/setting[@id='duplex']")
-                if dup_node is None:
-                    dup = None
-                else:
-                    dup = dup_node.attrib['value']
+    mem_sz = node.find('size')
+    if mem_sz is not None:
+        assert mem_sz.attrib['units'] == 'bytes'
+        res.ram_size += int(mem_sz.text)
+    else:
+        # no total size - sum up memory banks
+        for slot_node in node.findall("node[@class='memory']"):
+            slot_sz = slot_node.find('size')
+            if slot_sz is not None:
+                assert slot_sz.attrib['units'] == 'bytes'
+                res.ram_size += int(slot_sz.text)
+
+
+def on_network_node(res, node):
+    if get_setting(node, 'link') == 'yes':
+        name = node.find("logicalname").text
+        res.net_info[name] = (get_setting(node, 'speed'), get_setting(node, 'duplex'), [])
+
+
+def on_storage_node(res, node):
+    description = get_text(node, "description", "")
+    product = get_text(node, "product", "")
+    vendor = get_text(node, "vendor", "")
+    dev = get_text(node, "logicalname", "")
+    if dev != "":
+        res.storage_controllers.append(
+            "{0}: {1} {2} {3}".format(dev, description, vendor, product))
+    else:
+        res.storage_controllers.append(
+            "{0} {1} {2}".format(description, vendor, product))
+
+
+def on_disk_node(res, node):
+    lname_node = node.find('logicalname')
+    if lname_node is not None:
+        dev = lname_node.text.split('/')[-1]
+
+        if dev == "" or dev[-1].isdigit():
+            return
+
+        sz_node = node.find('size')
+        assert sz_node.attrib['units'] == 'bytes'
+        res.disks_info[dev] = ('', int(sz_node.text))
+    else:
+        full_descr = "{0} {1} {2} {3} {4}".format(*[node.find(name).text
+                                                    for name in ('description', 'product', 'vendor',
+                                                                 'version', 'serial')])
+        res.disks_raw_info[node.find('businfo').text] = full_descr
+
+
+# node class => handler, for nodes somewhere inside motherboard node
+core_node_handlers = {
+    'memory': on_memory_node,
+    'network': on_network_node,
+    'storage': on_storage_node,
+    'disk': on_disk_node,
+}
+
+
+def parse_lshw(lshw_out):
+    # single iterparse pass - each <node> is handled, when it's complete,
+    # and child nodes are dropped after that, so only the path from the
+    # root to the current node is kept in memory
+    res = HWInfo()
+    res.raw = lshw_out
 
-                res.net_info[name] = (speed, dup, [])
-        except:
-            pass
+    # open <node> elements, [system, core, ...]
+    path = []
+    have_core = False
+
+    for event, elem in ET.iterparse(StringIO(lshw_out), events=('start', 'end')):
+        if elem.tag != 'node':
+            continue
+
+        if event == 'start':
+            path.append(elem)
+            continue
+
+        path.pop()
+        depth = len(path)
+        in_core = depth >= 2 and path[1].attrib.get('id') == 'core'
 
-    for controller in core.findall(".//node[@class='storage']"):
         try:
-            description = getattr(controller.find("description"), 'text', "")
-            product = getattr(controller.find("product"), 'text', "")
-            vendor = getattr(controller.find("vendor"), 'text', "")
-            dev = getattr(controller.find("logicalname"), 'text', "")
-            if dev != "":
-                res.storage_controllers.append(
-                    "{0}: {1} {2} {3}".format(dev, description,
-                                              vendor, product))
-            else:
-                res.storage_controllers.append(
-                    "{0} {1} {2}".format(description,
-                                         vendor, product))
+            if depth == 0:
+                on_system_node(res, elem)
+            elif depth == 1 and elem.attrib.get('id') == 'core':
+                have_core = True
+                on_core_node(res, elem)
+            elif in_core and depth == 2 and elem.attrib.get('class') == 'processor':
+                on_processor_node(res, elem)
+            elif in_core and elem.attrib.get('class') in core_node_handlers:
+                core_node_handlers[elem.attrib['class']](res, elem)
         except:
             pass
 
-    for disk in core.findall(".//node[@class='disk']"):
-        try:
-            lname_node = disk.find('logicalname')
-            if lname_node is not None:
-                dev = lname_node.text.split('/')[-1]
+        for child in list(elem):
+            if child.tag == 'node':
+                elem.remove(child)
+
+    if not have_core:
+        return None
+
+    return res
 
-                if dev == "" or dev[-1].isdigit():
-                    continue
 
-                sz_node = disk.find('size')
-                assert sz_node.attrib['units'] == 'bytes'
-                sz = int(sz_node.text)
-                res.disks_info[dev] = ('', sz)
+# lshw fields, which parse_lshw reads, by node class; settings are
+# mixed with child elements. Only first element with a name is read
+fingerprint_fields = {
+    'system': ('vendor', 'product'),
+    'bus': ('vendor', 'product', 'version'),
+    'processor': ('product', 'threads'),
+    'memory': ('description', 'size'),
+    'network': ('logicalname', 'link', 'speed', 'duplex'),
+    'storage': ('description', 'product', 'vendor', 'logicalname'),
+    'disk': ('logicalname', 'size'),
+}
+
+# disks on raid controller have no logicalname, they are described with serial
+raw_disk_fields = ('description', 'product', 'vendor', 'version', 'serial', 'businfo')
+
+lshw_token_re = re.compile(r'<node(?P<attrs>\s[^>]*)?>|(?P<end></node>)|' +
+                           r'<(?P<tag>vendor|product|version|description|logicalname|size|serial|businfo)' +
+                           r'(?:\s[^>]*)?>(?P<text>[^<]*)</(?P=tag)>|' +
+                           r'<setting id="(?P<setting>threads|link|speed|duplex)" value="(?P<value>[^"]*)"')
+node_class_re = re.compile(r'\sclass="([^"]*)"')
+system_node_re = re.compile(r'<node id="([^"]*)"')
+
+
+def hw_fingerprint(lshw_out):
+    # same hardware => same fingerprint; it's made of values, which
+    # parse_lshw reads, without full xml parsing, so hostname and other
+    # per-host values, like uuid, addresses or fs timestamps, are excluded
+    items = []
+
+    # [(node class, {field: value}), ...] - open nodes
+    path = []
+    for match in lshw_token_re.finditer(lshw_out):
+        if match.group('attrs') is not None:
+            cls_m = node_class_re.search(match.group('attrs'))
+            path.append((None if cls_m is None else cls_m.group(1), {}))
+        elif match.group('end') is not None:
+            if path == []:
+                return None
+
+            cls, fields = path.pop()
+            names = fingerprint_fields.get(cls)
+            if cls == 'disk' and 'logicalname' not in fields:
+                names = raw_disk_fields
+            if names is not None:
+                items.append((len(path), cls) + tuple(fields.get(name) for name in names))
+        elif path != []:
+            if match.group('tag') is not None:
+                path[-1][1].setdefault(match.group('tag'), match.group('text'))
             else:
-                description = disk.find('description').text
-                product = disk.find('product').text
-                vendor = disk.find('vendor').text
-                version = disk.find('version').text
-                serial = disk.find('serial').text
+                path[-1][1].setdefault(match.group('setting'), match.group('value'))
 
-                full_descr = "{0} {1} {2} {3} {4}".format(
-                    description, product, vendor, version, serial)
+    if items == [] or path != []:
+        return None
+
+    return hashlib.sha1(repr(items)).hexdigest()
 
-                businfo = disk.find('businfo').text
-                res.disks_raw_info[businfo] = full_descr
-        except:
-            pass
 
+# fingerprint => HWInfo without hostname and raw data
+hw_info_cache = {}
+
+
+def get_hw_info(lshw_out):
+    fingerprint = hw_fingerprint(lshw_out)
+    template = hw_info_cache.get(fingerprint)
+
+    if template is None:
+        res = parse_lshw(lshw_out)
+
+        # raw disks descriptions includes serial numbers, so they
+        # could not be reused, even if rest of hardware is the same
+        if fingerprint is not None and res is not None and res.disks_raw_info == {}:
+            template = copy.deepcopy(res)
+            template.hostname = None
+            template.raw = None
+            hw_info_cache[fingerprint] = template
+
+        return res
+
+    res = copy.deepcopy(template)
+    res.hostname = system_node_re.search(lshw_out).group(1)
+    res.raw = lshw_out
     return res
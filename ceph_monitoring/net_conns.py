@@ -0,0 +1,154 @@
+import re
+import collections
+
+from multiprocessing import Pool as MPExecutorPool
+
+
+# netstat -nap line:
+# tcp        0   1204 192.168.1.10:6800       192.168.1.11:45678      ESTABLISHED 1234/ceph-osd
+netstat_tcp_re = re.compile(r"^tcp6?\s+(?P<recv_q>\d+)\s+(?P<send_q>\d+)\s+" +
+                            r"(?P<local_ip>\S+):(?P<local_port>\d+)\s+" +
+                            r"(?P<remote_ip>\S+):(?P<remote_port>\d+)\s+" +
+                            r"(?P<state>ESTABLISHED)\s+(?:(?P<pid>\d+)/\S*|-)")
+
+TcpConn = collections.namedtuple("TcpConn", ["local_ip", "local_port", "remote_ip", "remote_port",
+                                             "recv_q", "send_q", "pid"])
+
+# socket with this or more bytes in send or receive queue is backed up
+QUEUE_WARN_BYTES = 64 * 1024
+
+
+def _ipv4(ip):
+    # '::ffff:192.168.1.10' => '192.168.1.10'
+    return ip[len('::ffff:'):] if ip.startswith('::ffff:') else ip
+
+
+def is_loopback(ip):
+    return ip.startswith('127.') or ip == '::1'
+
+
+def parse_netstat(data):
+    # returns established non-loopback tcp connections
+    res = []
+    for line in data.split("\n"):
+        match = netstat_tcp_re.match(line)
+        if match is None:
+            continue
+
+        remote_ip = _ipv4(match.group('remote_ip'))
+        if is_loopback(remote_ip):
+            continue
+
+        pid = match.group('pid')
+        res.append(TcpConn(_ipv4(match.group('local_ip')), int(match.group('local_port')),
+                           remote_ip, int(match.group('remote_port')),
+                           int(match.group('recv_q')), int(match.group('send_q')),
+                           None if pid is None else int(pid)))
+    return res
+
+
+def parse_netstats(data, workers=1):
+    # data - {host: netstat output}; returns {host: [TcpConn]}
+    hosts = sorted(data)
+    if workers > 1 and len(hosts) > 1:
+        mp_pool = MPExecutorPool(processes=min(workers, len(hosts)))
+        try:
+            results = mp_pool.map(parse_netstat, [data[host] for host in hosts])
+        finally:
+            mp_pool.close()
+            mp_pool.join()
+    else:
+        results = [parse_netstat(data[host]) for host in hosts]
+    return dict(zip(hosts, results))
+
+
+class ConnStats(object):
+    def __init__(self):
+        self.count = 0
+        self.recv_q = 0
+        self.send_q = 0
+        self.backed_up = 0
+
+    def add(self, conn, queue_warn):
+        self.count += 1
+        self.recv_q += conn.recv_q
+        self.send_q += conn.send_q
+        if max(conn.recv_q, conn.send_q) >= queue_warn:
+            self.backed_up += 1
+
+
+class NetConnections(object):
+    def __init__(self):
+        # hosts with collected netstat
+        self.hosts = []
+
+        # (host, remote host) => ConnStats, as seen on the first host;
+        # remote host is None for not cluster addresses, e.g. clients
+        self.host_conns = {}
+
+        # (osd id, remote osd id) => ConnStats, as seen on the first osd
+        self.osd_conns = {}
+
+        # [(host, osd id or None, local 'ip:port', remote 'ip:port',
+        #   remote host or None, remote osd id or None, recv_q, send_q), ...]
+        # largest queue first
+        self.backed_up = []
+
+        # [(name1, name2, connections on first, connections on second), ...]
+        # each tcp connection is seen by both sides, so counts must be equal
+        self.asymmetric_hosts = []
+        self.asymmetric_osds = []
+
+
+def _asymmetric(conns, is_collected):
+    res = []
+    pairs = set(tuple(sorted(pair, key=str)) for pair in conns)
+    for first, second in sorted(pairs):
+        if first == second or not (is_collected(first) and is_collected(second)):
+            continue
+
+        first_count = conns[(first, second)].count if (first, second) in conns else 0
+        second_count = conns[(second, first)].count if (second, first) in conns else 0
+        if first_count != second_count:
+            res.append((first, second, first_count, second_count))
+    return res
+
+
+def analyze_connections(host_tcp_conns, ip_hosts, osd_pids, queue_warn=QUEUE_WARN_BYTES):
+    # host_tcp_conns - {host: [TcpConn]}, ip_hosts - {ip: host},
+    # osd_pids - {(host, pid): osd id}
+    res = NetConnections()
+    res.hosts = sorted(host_tcp_conns)
+
+    # accepted connection has address of listening socket, so remote
+    # addresses of OSD's are found in netstat of their own hosts
+    addr_osds = {}
+    for host, conns in host_tcp_conns.items():
+        for conn in conns:
+            osd_id = osd_pids.get((host, conn.pid))
+            if osd_id is not None:
+                addr_osds[(conn.local_ip, conn.local_port)] = osd_id
+
+    for host, conns in host_tcp_conns.items():
+        for conn in conns:
+            remote_host = ip_hosts.get(conn.remote_ip)
+            osd_id = osd_pids.get((host, conn.pid))
+            remote_osd_id = addr_osds.get((conn.remote_ip, conn.remote_port))
+
+            res.host_conns.setdefault((host, remote_host), ConnStats()).add(conn, queue_warn)
+            if osd_id is not None and remote_osd_id is not None:
+                res.osd_conns.setdefault((osd_id, remote_osd_id), ConnStats()).add(conn, queue_warn)
+
+            if max(conn.recv_q, conn.send_q) >= queue_warn:
+                res.backed_up.append((host, osd_id,
+                                      "{0}:{1}".format(conn.local_ip, conn.local_port),
+                                      "{0}:{1}".format(conn.remote_ip, conn.remote_port),
+                                      remote_host, remote_osd_id, conn.recv_q, conn.send_q))
+
+    res.backed_up.sort(key=lambda x: -max(x[6], x[7]))
+
+    collected = set(res.hosts)
+    osd_hosts = dict((osd_id, host) for (host, _), osd_id in osd_pids.items())
+    res.asymmetric_hosts = _asymmetric(res.host_conns, lambda host: host in collected)
+    res.asymmetric_osds = _asymmetric(res.osd_conns, lambda osd_id: osd_hosts.get(osd_id) in collected)
+    return res
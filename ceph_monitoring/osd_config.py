@@ -0,0 +1,155 @@
+import re
+import json
+import hashlib
+import collections
+
+
+# placeholder for OSD id in per-OSD values, like 'osd.3' or '/var/lib/ceph/osd/ceph-3'
+OSD_ID_MARK = "{osd_id}"
+
+osd_id_templ = r"(?:(?<=osd\.)|(?<=ceph-)){0}(?!\d)"
+
+# only values of these keys contain OSD id, others, like mon_host or
+# cluster, could look alike, but are the same for all OSD's
+per_osd_keys = ('name', 'osd_data', 'osd_journal', 'admin_socket', 'log_file', 'keyring')
+
+# '"key": "value"' in 'config show' json
+per_osd_item_re = re.compile(r'"(?:{0})"\s*:\s*"(?:[^"\\]|\\.)*"'.format("|".join(per_osd_keys)))
+
+
+def to_template(text, osd_id):
+    osd_id_re = re.compile(osd_id_templ.format(osd_id))
+    return per_osd_item_re.sub(lambda match: osd_id_re.sub(OSD_ID_MARK, match.group(0)), text)
+
+
+def from_template(value, osd_id):
+    if isinstance(value, basestring):
+        if OSD_ID_MARK in value:
+            return value.replace(OSD_ID_MARK, str(osd_id))
+        return value
+    if isinstance(value, list):
+        return [from_template(item, osd_id) for item in value]
+    if isinstance(value, dict):
+        return dict((key, from_template(item, osd_id)) for key, item in value.items())
+    return value
+
+
+def _hashable(value):
+    # type is kept, so that [] and "[]", or 1 and true are different
+    if isinstance(value, (list, dict)):
+        return ('json', json.dumps(value, sort_keys=True))
+    return (type(value).__name__, value)
+
+
+class OSDConfig(object):
+    # read-only dict-like view of one OSD config in ConfigStore
+    def __init__(self, store, osd_id):
+        self.store = store
+        self.osd_id = osd_id
+
+    def __getitem__(self, key):
+        changed, missing = self.store.overrides.get(self.osd_id, ({}, ()))
+        if key in changed:
+            val = changed[key]
+        elif key in missing:
+            raise KeyError(key)
+        else:
+            val = self.store.baseline[key]
+        return from_template(val, self.osd_id)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def keys(self):
+        changed, missing = self.store.overrides.get(self.osd_id, ({}, ()))
+        return [key for key in self.store.baseline if key not in missing] + \
+            [key for key in changed if key not in self.store.baseline]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
+class ConfigStore(object):
+    # OSD configs as one baseline of most common values and sparse
+    # per-OSD overrides; values are kept with OSD_ID_MARK instead of id
+    def __init__(self):
+        self.baseline = {}
+
+        # osd id => ({key: value}, [missing keys]), OSD's with
+        # the same config share the same object
+        self.overrides = {}
+        self.osd_ids = set()
+
+    def config(self, osd_id):
+        return OSDConfig(self, osd_id) if osd_id in self.osd_ids else None
+
+    def deviations(self):
+        # {(key, baseline value or None, value or None): [osd id, ...]},
+        # None value for absent key
+        res = collections.defaultdict(list)
+        for osd_id, (changed, missing) in self.overrides.items():
+            for key, val in changed.items():
+                res[(key, self.baseline.get(key), val)].append(osd_id)
+            for key in missing:
+                res[(key, self.baseline[key], None)].append(osd_id)
+
+        for osd_ids in res.values():
+            osd_ids.sort()
+        return dict(res)
+
+
+def build_config_store(raw_configs):
+    # raw_configs - {osd id: 'config show' json}; OSD id is replaced by
+    # mark in raw text, so equal configs are parsed only once
+    store = ConfigStore()
+    store.osd_ids = set(raw_configs)
+
+    osd_digests = {}
+    texts = {}
+    for osd_id, text in raw_configs.items():
+        text = to_template(text, osd_id)
+        digest = hashlib.sha1(text.encode('utf8') if isinstance(text, unicode) else text).hexdigest()
+        texts.setdefault(digest, text)
+        osd_digests[osd_id] = digest
+
+    configs = dict((digest, json.loads(text)) for digest, text in texts.items())
+    weights = collections.Counter(osd_digests.values())
+
+    # most common value of every key, which is present in at least half of OSD's
+    counts = collections.defaultdict(collections.Counter)
+    values = {}
+    for digest, cfg in configs.items():
+        for key, val in cfg.items():
+            hval = _hashable(val)
+            counts[key][hval] += weights[digest]
+            values[hval] = val
+
+    for key, key_counts in counts.items():
+        if sum(key_counts.values()) * 2 >= len(osd_digests):
+            store.baseline[key] = values[key_counts.most_common(1)[0][0]]
+
+    overrides = {}
+    for digest, cfg in configs.items():
+        changed = dict((key, val) for key, val in cfg.items()
+                       if key not in store.baseline or _hashable(store.baseline[key]) != _hashable(val))
+        missing = sorted(set(store.baseline).difference(cfg))
+        if changed or missing:
+            overrides[digest] = (changed, missing)
+
+    for osd_id, digest in osd_digests.items():
+        if digest in overrides:
+            store.overrides[osd_id] = overrides[digest]
+
+    return store
@@ -0,0 +1,153 @@
+import warnings
+
+import numpy
+
+
+# robust z-score of 3.5 and above is a likely outlier (Iglewicz and Hoaglin)
+SUSPECT_Z = 3.5
+
+# MAD of normal distribution is 0.6745 of its standard deviation
+MAD_SCALE = 0.6745
+
+# mean absolute deviation of normal distribution is 0.7979 of std
+MEANAD_SCALE = 0.7979
+
+
+def robust_z(values, axis=0):
+    # values - 2D array, nan for unknown; z-scores along axis,
+    # based on median and MAD, so few outliers don't hide each other
+    with warnings.catch_warnings():
+        # metric, unknown for all objects, gives nan without warnings
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = numpy.nanmedian(values, axis=axis, keepdims=True)
+        abs_dev = numpy.abs(values - median)
+        mad = numpy.nanmedian(abs_dev, axis=axis, keepdims=True) / MAD_SCALE
+
+        # more than half of values are equal - fallback to mean deviation
+        mean_ad = numpy.nanmean(abs_dev, axis=axis, keepdims=True) / MEANAD_SCALE
+        scale = numpy.where(mad > 0, mad, mean_ad)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        res = (values - median) / scale
+    res[abs_dev == 0] = 0
+    return res
+
+
+def grouped_robust_z(values, groups, min_group_size=3):
+    # z-scores of rows, compared to rows from the same group only;
+    # nan for rows from groups smaller than min_group_size
+    res = numpy.empty(values.shape)
+    res.fill(numpy.nan)
+    groups = numpy.asarray(groups)
+    for group in numpy.unique(groups):
+        mask = groups == group
+        if mask.sum() >= min_group_size:
+            res[mask] = robust_z(values[mask])
+    return res
+
+
+def _dev_value(name):
+    def getter(osd):
+        dev_stat = osd.data_stor_stats
+        return None if dev_stat is None else getattr(dev_stat, name)
+    return getter
+
+
+def _osd_perf_value(name):
+    def getter(osd):
+        return None if osd.osd_perf is None else osd.osd_perf.get(name)
+    return getter
+
+
+# (metric name, getter, two sided); for one sided metrics
+# only too large values are suspicious
+osd_metrics = [
+    ('data dev lat', _dev_value('lat_curr'), False),
+    ('data dev IO time', _dev_value('io_time_curr'), False),
+    ('apply lat', _osd_perf_value('apply_latency_ms'), False),
+    ('commit lat', _osd_perf_value('commit_latency_ms'), False),
+    ('PG count', lambda osd: osd.pg_count, True),
+]
+
+
+def _net_errors(host):
+    # errors and drops per second since boot, over all adapters
+    if not host.uptime:
+        return None
+
+    errors = 0
+    for adapter in host.net_adapters.values():
+        stats = adapter.perf_stats
+        if stats is not None:
+            errors += stats.rerrs + stats.serrs + stats.rdrop + stats.sdrop
+    return float(errors) / host.uptime
+
+
+host_metrics = [
+    ('net errors', _net_errors, False),
+    ('load avg', lambda host: host.load_5m, False),
+]
+
+
+def metrics_matrix(objs, metrics):
+    res = numpy.empty((len(objs), len(metrics)))
+    for col, (_, getter, _) in enumerate(metrics):
+        res[:, col] = [numpy.nan if val is None else val
+                       for val in map(getter, objs)]
+    return res
+
+
+def suspects_scores(values, metrics, peer_z=None):
+    # score is max of cluster-wide and peer z-scores, only in
+    # suspicious direction; returns (scores, cluster z, peer z)
+    cluster_z = robust_z(values)
+    if peer_z is None:
+        peer_z = numpy.empty(values.shape)
+        peer_z.fill(numpy.nan)
+
+    two_sided = numpy.array([two_sided for _, _, two_sided in metrics], dtype=bool)
+    scores = numpy.fmax(cluster_z, peer_z)
+    scores = numpy.where(two_sided, numpy.fmax(numpy.abs(cluster_z), numpy.abs(peer_z)), scores)
+    return scores, cluster_z, peer_z
+
+
+def find_suspects(cluster, threshold=SUSPECT_Z):
+    # returns [(score, kind, name, host, [(metric, value, cluster median,
+    #           cluster z, peer z), ...]), ...], most suspicious first
+    cluster.require('fill_io_devices_usage_stats')
+
+    res = []
+
+    osds = cluster.osds
+    if osds != []:
+        values = metrics_matrix(osds, osd_metrics)
+        peer_z = grouped_robust_z(values, [osd.host for osd in osds])
+        scores, cluster_z, peer_z = suspects_scores(values, osd_metrics, peer_z)
+        res.extend(_collect_suspects(scores, values, cluster_z, peer_z, osd_metrics, threshold,
+                                     [('osd', "osd.{0}".format(osd.id), osd.host) for osd in osds]))
+
+    hosts = sorted(cluster.hosts.values(), key=lambda x: x.name)
+    if hosts != []:
+        values = metrics_matrix(hosts, host_metrics)
+        scores, cluster_z, peer_z = suspects_scores(values, host_metrics)
+        res.extend(_collect_suspects(scores, values, cluster_z, peer_z, host_metrics, threshold,
+                                     [('host', host.name, host.name) for host in hosts]))
+
+    res.sort(key=lambda x: -x[0])
+    return res
+
+
+def _collect_suspects(scores, values, cluster_z, peer_z, metrics, threshold, names):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        medians = numpy.nanmedian(values, axis=0)
+    flagged = numpy.nan_to_num(scores) >= threshold
+
+    res = []
+    for row in numpy.nonzero(flagged.any(axis=1))[0].tolist():
+        kind, name, host = names[row]
+        details = [(metrics[col][0], values[row, col], medians[col],
+                    cluster_z[row, col], peer_z[row, col])
+                   for col in numpy.nonzero(flagged[row])[0].tolist()]
+        res.append((float(numpy.nanmax(scores[row])), kind, name, host, details))
+    return res
@@ -1,15 +1,132 @@
 import json
+import itertools
+import sqlite3
 import os.path
+import collections
+from multiprocessing.pool import ThreadPool
+
+
+MANIFEST_FILE = 'manifest.json'
+SQLITE_FILE = 'results.db'
+PREFETCH_WORKERS = 16
+
+# ref - file with the same content, if item was deduplicated by collector
+ManifestItem = collections.namedtuple("ManifestItem",
+                                      "path format ok size hash duration ref")
+
+
+# index of collected items, written by collector alongside the data;
+# files - {path: format} for items, which collector writes to the folder
+# directly, like own log, they have no size or hash in manifest
+class Manifest(object):
+    def __init__(self, items, files=None):
+        self.items = {}
+        self.files = {} if files is None else files
+        self.dirs = collections.defaultdict(dict)
+
+        for item in items:
+            self.items[item.path] = item
+            self.add_path(item.path, item.format)
+
+        for path, frmt in self.files.items():
+            self.add_path(path, frmt)
+
+    def add_path(self, path, frmt):
+        parts = path.split('/')
+        for pos in range(len(parts) - 1):
+            self.dirs['/'.join(parts[:pos])][parts[pos]] = None
+        self.dirs['/'.join(parts[:-1])][parts[-1]] = frmt
+
+    @classmethod
+    def load(cls, root):
+        fname = os.path.join(root, MANIFEST_FILE)
+        if not os.path.isfile(fname):
+            return None
+
+        return cls.from_json(json.load(open(fname)))
+
+    @classmethod
+    def from_json(cls, data):
+        items = [ManifestItem(item['path'], item['format'], item['ok'],
+                              item['size'], item['hash'], item['duration'],
+                              item.get('ref'))
+                 for item in data['items']]
+        files = dict((item['path'], item['format']) for item in data.get('files', []))
+        return cls(items, files)
+
+    def isdir(self, path):
+        return path in self.dirs
+
+    def listdir(self, path):
+        return self.dirs.get(path, {})
+
+    def failed(self):
+        return [item for item in self.items.values() if not item.ok]
 
 
 class RawResultStorage(object):
-    def __init__(self, root):
+    def __init__(self, root, manifest=None, rel_path=None, cache=None):
         self._root = root
         self._all = None
 
+        if rel_path is None:
+            rel_path = ""
+            manifest = self._load_manifest()
+            cache = {}
+
+        self._rel_path = rel_path
+        self._manifest = manifest
+
+        # rel_path => (ext, raw data), filled by prefetch
+        self._cache = cache
+
+    def _load_manifest(self):
+        return Manifest.load(self._root)
+
+    def _item_location(self, name, ext):
+        if ext is None:
+            return os.path.join(os.path.abspath(self._root), name)
+
+        location = os.path.join(os.path.abspath(self._root), name + "." + ext)
+        item = self._manifest.items.get(self._rel_join(name))
+        if item is not None and item.ref is not None:
+            location += '.ref'
+        return location
+
+    def _read(self, location):
+        if location.endswith('.ref'):
+            ref = open(location).read().strip()
+            location = os.path.normpath(os.path.join(os.path.dirname(location), ref))
+        return open(location, 'rb').read()
+
+    def _read_many(self, locations, pool):
+        def read(location):
+            try:
+                return self._read(location)
+            except (IOError, OSError):
+                return None
+        return pool.map(read, locations)
+
+    def _child(self, name):
+        return self.__class__(os.path.join(self._root, name),
+                              self._manifest,
+                              self._rel_join(name),
+                              self._cache)
+
+    def _rel_join(self, name):
+        if self._rel_path == "":
+            return name
+        return self._rel_path + "/" + name
+
     def _load(self):
         if self._all is None:
             self._all = {}
+
+            if self._manifest is not None:
+                for fname, ext in self._manifest.listdir(self._rel_path).items():
+                    self._all[fname] = (ext is not None, ext, self._item_location(fname, ext))
+                return self._all
+
             rt = os.path.abspath(self._root)
             for fname in os.listdir(rt):
                 if fname.startswith('.'):
@@ -17,7 +134,10 @@ class RawResultStorage(object):
 
                 full_path = os.path.join(rt, fname)
 
-                if '.' in fname:
+                if fname.endswith('.ref'):
+                    fname_no_ext, ext = fname[:-len('.ref')].rsplit('.', 1)
+                    self._all[fname_no_ext] = (True, ext, full_path)
+                elif '.' in fname:
                     fname_no_ext, ext = fname.rsplit('.', 1)
                     self._all[fname_no_ext] = (True, ext, full_path)
                 else:
@@ -25,22 +145,30 @@ class RawResultStorage(object):
 
         return self._all
 
+    def _isdir(self, name):
+        if self._manifest is not None:
+            return self._manifest.isdir(self._rel_join(name))
+        return os.path.isdir(os.path.join(self._root, name))
+
     def __getattr__(self, name):
         self._load()
 
-        path = os.path.join(self._root, name)
-        if os.path.isdir(path):
-            return True, None, self.__class__(path)
+        if self._isdir(name):
+            return True, None, self._child(name)
 
         if name in self._all:
             is_file, ext, full_path = self._all[name]
             setattr(self, name, (is_file, ext, full_path))
 
             if is_file:
-                data = open(full_path, 'rb').read()
+                cached = self._cache.get(self._rel_join(name))
+                if cached is not None:
+                    data = cached[1]
+                else:
+                    data = self._read(full_path)
                 return ext != 'err', ext, data
             else:
-                return True, None, self.__class__(full_path)
+                return True, None, self._child(name)
 
         raise AttributeError(
             "No storage for {0!r} found. Have only '{1}' attrs".format(name, ",".join(self)))
@@ -48,6 +176,22 @@ class RawResultStorage(object):
     def __iter__(self):
         return iter(self._load().keys())
 
+    # yields relative paths of all stored items
+    def walk(self):
+        if self._manifest is not None:
+            prefix = "" if self._rel_path == "" else self._rel_path + "/"
+            for path in itertools.chain(self._manifest.items, self._manifest.files):
+                if path.startswith(prefix):
+                    yield path[len(prefix):]
+            return
+
+        for name, (is_file, _, _) in self._load().items():
+            if self._isdir(name):
+                for sub_path in self._child(name).walk():
+                    yield name + "/" + sub_path
+            elif is_file:
+                yield name
+
     def __getitem__(self, path):
         if '/' not in path:
             return getattr(self, path)
@@ -71,10 +215,199 @@ class RawResultStorage(object):
 
         return data
 
+    def stat(self, path):
+        # without manifest only path, format, ok and size are available
+        rel_path = self._rel_join(path)
+        if self._manifest is not None:
+            if rel_path in self._manifest.items:
+                return self._manifest.items[rel_path]
+
+            frmt = self._manifest.files.get(rel_path)
+            if frmt is None:
+                return None
+
+            # file is still written, while collector stores manifest
+            location = os.path.join(self._root, path + "." + frmt)
+            return ManifestItem(rel_path, frmt, frmt != 'err', os.path.getsize(location),
+                                None, None, None)
+
+        dr, name = os.path.split(os.path.join(self._root, path))
+        if not os.path.isdir(dr):
+            return None
+
+        for fname in os.listdir(dr):
+            is_ref = fname.endswith('.ref')
+            if is_ref:
+                fname = fname[:-len('.ref')]
+
+            if '.' in fname and fname.rsplit('.', 1)[0] == name:
+                ext = fname.rsplit('.', 1)[1]
+                location = os.path.join(dr, fname)
+                ref = None
+
+                if is_ref:
+                    location += '.ref'
+                    ref = open(location).read().strip()
+                    ref = os.path.normpath(os.path.join(os.path.dirname(rel_path), ref))
+                    size = len(self._read(location))
+                else:
+                    size = os.path.getsize(location)
+
+                return ManifestItem(rel_path, ext, ext != 'err', size, None, None, ref)
+        return None
+
+    @property
+    def manifest(self):
+        return self._manifest
+
+    # read set of items in parallel, so that later accesses are served
+    # from memory; only reading is done in threads, decoding holds GIL
+    def prefetch(self, paths, workers=PREFETCH_WORKERS):
+        dirs = {}
+        found = []
+        for path in paths:
+            if '/' in path:
+                dr, name = path.rsplit('/', 1)
+            else:
+                dr, name = "", path
+
+            if dr not in dirs:
+                stor = self
+                for dname in (dr.split('/') if dr != "" else []):
+                    if stor is None or not stor._isdir(dname):
+                        stor = None
+                    else:
+                        stor = stor._child(dname)
+                dirs[dr] = stor
+
+            stor = dirs[dr]
+            if stor is None:
+                continue
+
+            rel_path = stor._rel_join(name)
+            if rel_path in self._cache:
+                continue
+
+            is_file, ext, location = stor._load().get(name, (False, None, None))
+            if is_file and ext != 'err':
+                found.append((rel_path, ext, location))
+
+        if found == []:
+            return 0
+
+        pool = ThreadPool(workers)
+        try:
+            datas = self._read_many([location for _, _, location in found], pool)
+        finally:
+            pool.close()
+
+        for (rel_path, ext, _), data in zip(found, datas):
+            if data is not None:
+                self._cache[rel_path] = (ext, data)
+
+        return len(found)
+
     def __len__(self):
         return len(self._load())
 
 
+class SQLiteResultStorage(RawResultStorage):
+    # root - folder with database, files in it are visible as items too
+    def __init__(self, db, manifest=None, rel_path=None, cache=None, root=None):
+        if not isinstance(db, sqlite3.Connection):
+            db = sqlite3.connect(db, check_same_thread=False)
+            db.text_factory = str
+        self._db = db
+        RawResultStorage.__init__(self, root, manifest, rel_path, cache)
+
+    def _load_manifest(self):
+        items = self._db.execute("SELECT path, format, ok, size, hash, duration FROM items")
+        items = [ManifestItem(path, frmt, bool(ok), size, dhash, duration, None)
+                 for path, frmt, ok, size, dhash, duration in items]
+
+        # files are next to database, so without folder they can't be read
+        files = {}
+        if self._root is not None:
+            try:
+                files = dict(self._db.execute("SELECT path, format FROM files"))
+            except sqlite3.OperationalError:
+                # database, created before files table was added
+                pass
+
+        return Manifest(items, files)
+
+    def _item_location(self, name, ext):
+        rel_path = self._rel_join(name)
+        if rel_path in self._manifest.files:
+            return RawResultStorage._item_location(self, name, ext)
+        return rel_path
+
+    def _read(self, location):
+        # files from folder have absolute path as location
+        if os.path.isabs(location):
+            return RawResultStorage._read(self, location)
+
+        dhash = self._manifest.items[location].hash
+        data, = self._db.execute("SELECT data FROM blobs WHERE hash=?", (dhash,)).fetchone()
+        return str(data)
+
+    def _read_many(self, locations, pool):
+        if any(os.path.isabs(location) for location in locations):
+            return [self._read(location) for location in locations]
+
+        # single connection can't be used from many threads, but all blobs
+        # can be selected at once
+        hashes = [self._manifest.items[location].hash for location in locations]
+        blobs = {}
+        for pos in range(0, len(hashes), 500):
+            part = hashes[pos: pos + 500]
+            sql = "SELECT hash, data FROM blobs WHERE hash IN ({0})".format(",".join("?" * len(part)))
+            for dhash, data in self._db.execute(sql, part):
+                blobs[dhash] = str(data)
+        return [blobs.get(dhash) for dhash in hashes]
+
+    def _child(self, name):
+        root = None if self._root is None else os.path.join(self._root, name)
+        return self.__class__(self._db, self._manifest, self._rel_join(name), self._cache, root)
+
+    # returns the same [[timestamp, {dev: stats}], ...] list, as
+    # CephCluster.get_rusage_stats builds from rusage text snapshots,
+    # or None, if host has no samples in tables, e.g. collector failed to parse them
+    def rusage_series(self, host, stat_type, stat_cls):
+        if stat_type == 'disk':
+            table, key = 'diskstats', 'device'
+        elif stat_type == 'net':
+            table, key = 'netdev', 'adapter'
+        else:
+            raise ValueError("Unknown stat type - {!r}".format(stat_type))
+
+        sql = "SELECT ts, {0}, {1} FROM {2} WHERE host=? ORDER BY ts"
+        rows = self._db.execute(sql.format(key, ", ".join(stat_cls._fields), table), (host,))
+
+        res = []
+        for row in rows:
+            if res == [] or res[-1][0] != row[0]:
+                res.append([row[0], {}])
+            res[-1][1][row[1]] = stat_cls(*row[2:])
+        return res if res != [] else None
+
+
+def is_sqlite_file(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as fd:
+        return fd.read(16) == 'SQLite format 3\x00'
+
+
+def open_storage(path):
+    if os.path.isdir(path) and os.path.isfile(os.path.join(path, SQLITE_FILE)):
+        return SQLiteResultStorage(os.path.join(path, SQLITE_FILE), root=path)
+
+    if is_sqlite_file(path):
+        return SQLiteResultStorage(path)
+    return RawResultStorage(path)
+
+
 class JResultStorage(object):
     def __init__(self, storage):
         self.__storage = storage
@@ -94,12 +427,16 @@ class JResultStorage(object):
         setattr(self, name, res)
         return res
 
+    # prefetched items are cached as text, so every call returns new object
     def get(self, path, default=None, expected_format='json'):
         res = self.__storage.get(path, default, expected_format=expected_format)
         if res is not None:
             return json.loads(res)
         return res
 
+    def prefetch(self, paths, workers=PREFETCH_WORKERS):
+        return self.__storage.prefetch(paths, workers)
+
     def __iter__(self):
         return iter(self.__storage)
 
@@ -0,0 +1,148 @@
+import re
+import heapq
+import datetime
+import collections
+from cStringIO import StringIO
+
+
+# from least to most severe
+SEVERITIES = ['DBG', 'INF', 'WRN', 'ERR']
+
+# time is 'YYYY-mm-dd HH:MM:SS.ffffff' string, so events are ordered by time first;
+# host is None for cluster-wide events, osd_id is None for non-osd events
+TimelineEvent = collections.namedtuple("TimelineEvent",
+                                       ["time", "host", "osd_id", "source", "severity", "message"])
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# 2015-09-07 21:05:12.123456 7f0a5c7f8700  0 log_channel(cluster) log [WRN] : ...
+daemon_log_re = re.compile(r"(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?P<frac>\.\d+)?\s+\S+\s+" +
+                           r"(?P<level>-?\d+)\s+(?P<message>.*)$")
+
+# 2015-09-07 21:05:12.123456 osd.3 192.168.1.10:6800/1234 45 : cluster [WRN] ...
+cluster_log_re = re.compile(r"(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?P<frac>\.\d+)?\s+" +
+                            r"(?P<who>\S+)\s+\S+\s+\d+\s+:\s+(?:\S+\s+)?" +
+                            r"\[(?P<severity>[A-Z]+)\]\s+(?P<message>.*)$")
+
+# channel severity in daemon log message - 'log_channel(cluster) log [WRN] : ...'
+channel_severity_re = re.compile(r"\[(?P<severity>DBG|INF|WRN|ERR|SEC)\]")
+
+# [   12.345678] sd 2:0:0:0: [sdb] ...
+dmesg_re = re.compile(r"\[\s*(?P<uptime>\d+\.\d+)\]\s?(?P<message>.*)$")
+dmesg_problem_re = re.compile(r"error|fail|warn|timeout|reset", re.I)
+
+# 21:08:20 - INFO - message
+collector_log_re = re.compile(r"(?P<time>\d\d:\d\d:\d\d) - (?P<level>[A-Z]+) - (?P<message>.*)$")
+
+collector_levels = {
+    'DEBUG': 'DBG',
+    'INFO': 'INF',
+    'WARNING': 'WRN',
+    'ERROR': 'ERR',
+    'CRITICAL': 'ERR',
+}
+
+
+def _lines(data):
+    # lazy lines iterator, don't split the whole text at once
+    for line in StringIO(data):
+        yield line.rstrip("\n")
+
+
+def _ceph_time(match):
+    frac = match.group('frac') or ".0"
+    return match.group('time') + (frac + "00000")[:7]
+
+
+def osd_id_from_name(name):
+    return int(name.split('.', 1)[1]) if name.startswith('osd.') else None
+
+
+def daemon_log_events(data, host, osd_id, source):
+    # ceph-osd/ceph-mon logs; lines without timestamp, like stack
+    # traces, are skipped
+    for line in _lines(data):
+        match = daemon_log_re.match(line)
+        if match is None:
+            continue
+
+        message = match.group('message')
+        channel_m = channel_severity_re.search(message)
+        if channel_m is not None:
+            severity = channel_m.group('severity')
+            if severity == 'SEC':
+                severity = 'WRN'
+        else:
+            level = int(match.group('level'))
+            severity = 'ERR' if level < 0 else ('INF' if level == 0 else 'DBG')
+
+        yield TimelineEvent(_ceph_time(match), host, osd_id, source, severity, message)
+
+
+def cluster_log_events(data, osd_hosts, source='ceph.log'):
+    # osd_hosts - {osd id: host}; host of event is one of its osd, not of monitor,
+    # so equal events from ceph.log copies on monitors could be dropped after merge
+    for line in _lines(data):
+        match = cluster_log_re.match(line)
+        if match is None:
+            continue
+
+        severity = match.group('severity')
+        if severity not in SEVERITIES:
+            severity = 'WRN' if severity == 'SEC' else 'INF'
+
+        osd_id = osd_id_from_name(match.group('who'))
+        yield TimelineEvent(_ceph_time(match), osd_hosts.get(osd_id), osd_id,
+                            source, severity, match.group('who') + ": " + match.group('message'))
+
+
+def dmesg_events(data, host, boot_time):
+    # dmesg has time since boot, boot_time - datetime
+    for line in _lines(data):
+        match = dmesg_re.match(line)
+        if match is None:
+            continue
+
+        tm = boot_time + datetime.timedelta(seconds=float(match.group('uptime')))
+        message = match.group('message')
+        severity = 'WRN' if dmesg_problem_re.search(message) else 'INF'
+        yield TimelineEvent(tm.strftime(TIME_FORMAT), host, None, 'dmesg', severity, message)
+
+
+def collector_log_events(data, date):
+    # collector log has time of day only, date - 'YYYY-mm-dd' of collection
+    for line in _lines(data):
+        match = collector_log_re.match(line)
+        if match is None:
+            continue
+
+        severity = collector_levels.get(match.group('level'), 'INF')
+        yield TimelineEvent("{0} {1}.000000".format(date, match.group('time')), None, None,
+                            'collector', severity, match.group('message'))
+
+
+def merge_events(streams, hosts=None, osds=None, min_severity=None):
+    # streams - iterables of TimelineEvent, each sorted by time;
+    # yields filtered events of all streams ordered by time, only heads
+    # of streams are kept in memory
+    min_level = 0 if min_severity is None else SEVERITIES.index(min_severity)
+    hosts = None if hosts is None else set(hosts)
+    osds = None if osds is None else set(osds)
+
+    prev = None
+    for event in heapq.merge(*streams):
+        # same event from other copy of cluster log
+        if event == prev:
+            continue
+        prev = event
+
+        if SEVERITIES.index(event.severity) < min_level:
+            continue
+
+        if hosts is not None and event.host not in hosts:
+            continue
+
+        if osds is not None and event.osd_id not in osds:
+            continue
+
+        yield event
@@ -1,25 +1,41 @@
 import sys
+import cgi
 import json
 import shutil
 import pprint
+import hashlib
+import logging
 import bisect
 import os.path
-import warnings
+import tempfile
+import threading
 import argparse
+import functools
 import itertools
 import subprocess
 import collections
 
+import numpy
+
 import html2
+import outliers
+import ceph_logs
+import disk_health
+import osd_config
+import cluster_diff
+import timeline
 
 from hw_info import b2ssize
 import ceph_report_template
-from cluster import CephCluster
-from storage import RawResultStorage, JResultStorage
+from cluster import CephCluster, load_snapshot, save_snapshot
+from history import HistoryStore
+from storage import open_storage, is_sqlite_file, JResultStorage
 
 
 H = html2.rtag
 
+SNAPSHOT_EXT = ".cache"
+
 
 def CH3(text):
     return H.center(H.H3(text))
@@ -43,6 +59,9 @@ class Report(object):
         # self.div_lines = []
         self.divs = []
 
+        # func(output_dir, css_links, js_links), for sections with own pages
+        self.writers = []
+
     def next_line(self):
         self.add_block(None, None, None)
 
@@ -158,6 +177,9 @@ class Report(object):
 
         open(index_path, "w").write(index)
 
+        for writer in self.writers:
+            writer(output_dir, css_links, js_links)
+
 
 def show_summary(report, cluster):
     t = html2.HTMLTable(["Setting", "Value"])
@@ -216,6 +238,48 @@ def show_summary(report, cluster):
         report.add_block(2, "Status messages:", t)
 
 
+# metric name => function to format its value
+suspect_metric_fmt = {
+    'data dev lat': lambda x: "{0} ms".format(int(x * 1000)),
+    'data dev IO time': lambda x: "{0}%".format(int(x * 100)),
+    'apply lat': lambda x: "{0} ms".format(int(x)),
+    'commit lat': lambda x: "{0} ms".format(int(x)),
+    'PG count': lambda x: str(int(x)),
+    'net errors': lambda x: "{0:.2f} per s".format(x),
+    'load avg': lambda x: "{0:.2f}".format(x),
+}
+
+
+def show_suspects(report, cluster):
+    suspects = outliers.find_suspects(cluster)
+    if suspects == []:
+        report.add_block(12, "Suspects:", H.font("No outliers found", color="green"))
+        return
+
+    table = html2.HTMLTable(headers=["Object", "Host", "Score",
+                                     "Metric", "Value", "Cluster<br>median",
+                                     "Cluster<br>z-score", "Host peers<br>z-score"])
+
+    def z_str(val):
+        return '-' if numpy.isnan(val) else "{0:.1f}".format(val)
+
+    for score, _, name, host, details in suspects:
+        details.sort(key=lambda x: -numpy.nan_to_num(numpy.fmax(abs(x[3]), abs(x[4]))))
+        fmt = [suspect_metric_fmt.get(metric, str) for metric, _, _, _, _ in details]
+        table.add_row(map(str, [
+            name,
+            host,
+            "{0:.1f}".format(score),
+            "<br>".join(metric for metric, _, _, _, _ in details),
+            "<br>".join(func(val) for func, (_, val, _, _, _) in zip(fmt, details)),
+            "<br>".join(func(median) for func, (_, _, median, _, _) in zip(fmt, details)),
+            "<br>".join(z_str(c_z) for _, _, _, c_z, _ in details),
+            "<br>".join(z_str(p_z) for _, _, _, _, p_z in details),
+        ]))
+
+    report.add_block(12, "Suspects (robust z-score >= {0}):".format(outliers.SUSPECT_Z), table)
+
+
 def show_mons_info(report, cluster):
     table = html2.HTMLTable(headers=["Name", "Node", "Role",
                                      "Disk free<br>B (%)"])
@@ -280,6 +344,7 @@ def show_pools_info(report, cluster):
                                      "PGP",
                                      "PG per OSD<br>Dev %"])
 
+    pg_dev = None if cluster.sum_per_osd is None else cluster.pool_pg_deviation()
     for _, pool in sorted(cluster.pools.items()):
         table.add_cell(pool.name)
         table.add_cell(str(pool.id))
@@ -301,11 +366,8 @@ def show_pools_info(report, cluster):
         if cluster.sum_per_osd is None:
             table.add_cell('-')
         else:
-            row = [osd_pg.get(pool.name, 0)
-                   for osd_pg in cluster.osd_pool_pg_2d.values()]
-            avg = float(sum(row)) / len(row)
-            dev = (sum((i - avg) ** 2.0 for i in row) / len(row)) ** 0.5
-            table.add_cell(str(int(dev * 100. / avg)))
+            dev = pg_dev.get(pool.name)
+            table.add_cell('-' if dev is None else str(int(dev * 100.)))
 
         table.next_row()
 
@@ -323,6 +385,87 @@ def html_fail(text):
     return H.font(text, color="red")
 
 
+def show_disks_health(report, cluster):
+    table = html2.HTMLTable(headers=["Node",
+                                     "Device",
+                                     "Used by",
+                                     "Model",
+                                     "SSD",
+                                     "SMART",
+                                     "Reallocated<br>sectors",
+                                     "Pending<br>sectors",
+                                     "Offline<br>uncorrectable",
+                                     "CRC<br>errors",
+                                     "Wearout<br>life left %",
+                                     "Power on<br>hours",
+                                     "Temp C",
+                                     "Write<br>cache",
+                                     "Link"])
+
+    def counter_cell(val, is_bad):
+        if val is None:
+            table.add_cell(HTML_UNKNOWN, sorttable_customkey='-1')
+        else:
+            table.add_cell(html_fail(str(val)) if is_bad else str(val), sorttable_customkey=str(val))
+
+    # most broken devices first
+    for health in sorted(cluster.disks_health.values(),
+                         key=lambda x: (-len(x.problems()), x.host, x.dev)):
+        problems = health.problems()
+
+        table.add_cell(health.host)
+        table.add_cell(health.dev)
+        table.add_cell("<br>".join(health.users))
+        table.add_cell(health.model or HTML_UNKNOWN)
+        table.add_cell(HTML_UNKNOWN if health.is_ssd is None else ('yes' if health.is_ssd else 'no'))
+
+        if health.smart_passed is None:
+            table.add_cell(HTML_UNKNOWN)
+        else:
+            table.add_cell(html_ok("ok") if health.smart_passed else html_fail("failed"))
+
+        for name in disk_health.error_counters:
+            counter_cell(getattr(health, name), name in problems)
+        counter_cell(health.wearout, 'wearout' in problems)
+
+        for val in (health.power_on_hours, health.temperature):
+            table.add_cell(HTML_UNKNOWN if val is None else str(val), sorttable_customkey=str(val or 0))
+
+        if health.write_cache is None:
+            table.add_cell(HTML_UNKNOWN)
+        else:
+            table.add_cell('on' if health.write_cache else 'off')
+
+        table.add_cell(health.link_speed or HTML_UNKNOWN)
+        table.next_row()
+
+    report.add_block(12, "Disks health:", table)
+
+
+CONFIG_DRIFT_MAX_OSDS = 20
+
+
+def show_config_drift(report, cluster):
+    deviations = cluster.osd_configs.deviations()
+    if deviations == {}:
+        report.add_block(6, "OSD config drift:", html_ok("All OSD's have the same config"))
+        return
+
+    def fmt_val(val):
+        return HTML_UNKNOWN if val is None else cgi.escape(str(val))
+
+    table = html2.HTMLTable(headers=["Key", "Most OSD's", "Deviating value", "OSD count", "OSD's"])
+    for (key, base_val, val), osd_ids in sorted(deviations.items(),
+                                                key=lambda x: (-len(x[1]), x[0][0])):
+        osds_s = ", ".join(map(str, osd_ids[:CONFIG_DRIFT_MAX_OSDS]))
+        if len(osd_ids) > CONFIG_DRIFT_MAX_OSDS:
+            osds_s += ", ..."
+        table.add_cells(key, fmt_val(base_val), fmt_val(val), str(len(osd_ids)), osds_s)
+
+    report.add_block(12, "OSD config drift ({0} for OSD id):".format(osd_config.OSD_ID_MARK),
+                     table, "OSD config drift")
+
+
 def show_osd_info(report, cluster):
     table = html2.HTMLTable(headers=["OSD",
                                      "node",
@@ -346,8 +489,8 @@ def show_osd_info(report, cluster):
             daemon_msg = html_fail('no')
 
         if osd.data_stor_stats is not None:
-            used_b = osd.data_stor_stats.get('used')
-            avail_b = osd.data_stor_stats.get('avail')
+            used_b = osd.data_stor_stats.used
+            avail_b = osd.data_stor_stats.avail
             avail_perc = int((avail_b * 100.0) / (avail_b + used_b) + 0.5)
 
             if avail_perc < 20:
@@ -436,6 +579,7 @@ def show_osd_perf_info(report, cluster):
                                      "J IO<br>time %",
                                      ])
 
+    cluster.require('fill_io_devices_usage_stats')
     for osd in cluster.osds:
         if osd.osd_perf is not None:
             apply_latency_ms = osd.osd_perf["apply_latency_ms"]
@@ -447,7 +591,7 @@ def show_osd_perf_info(report, cluster):
         perf_info = []
 
         for dev_stat in (osd.data_stor_stats, osd.j_stor_stats):
-            if dev_stat is None or 'read_bytes_uptime' not in dev_stat:
+            if dev_stat is None or dev_stat.read_bytes_uptime is None:
                 perf_info.extend([('-', 0)] * 6)
                 continue
 
@@ -478,6 +622,8 @@ def show_osd_perf_info(report, cluster):
                                      "D read<br>OPS",
                                      "D write<br>OPS",
                                      "D lat<br>ms",
+                                     "CPU %<br>mean / peak",
+                                     "CPU / D lat<br>correlation",
                                      "D IO<br>time %",
                                      "J dev",
                                      "J read<br>Bps",
@@ -488,14 +634,28 @@ def show_osd_perf_info(report, cluster):
                                      "J IO<br>time %",
                                      ])
 
+    cluster.require('fill_cpu_usage_stats')
     have_any_data = False
     for osd in cluster.osds:
         perf_info = []
 
+        if osd.cpu_mean is None:
+            cpu_info = [('-', 0)]
+        else:
+            cpu_info = [("{0} / {1}".format(int(osd.cpu_mean * 100), int(osd.cpu_peak * 100)),
+                         osd.cpu_mean)]
+
+        if osd.cpu_lat_corr is None:
+            cpu_info.append(('-', 0))
+        else:
+            cpu_info.append(("%.2f" % (osd.cpu_lat_corr,), osd.cpu_lat_corr))
+
         have_data = False
-        for dev_stat in (osd.data_stor_stats, osd.j_stor_stats):
-            if dev_stat is None or 'read_bytes_curr' not in dev_stat:
+        for is_data, dev_stat in ((True, osd.data_stor_stats), (False, osd.j_stor_stats)):
+            if dev_stat is None or dev_stat.read_bytes_curr is None:
                 perf_info.extend([('-', 0)] * 7)
+                if is_data:
+                    perf_info[-1:-1] = cpu_info
                 continue
 
             have_data = True
@@ -509,6 +669,9 @@ def show_osd_perf_info(report, cluster):
                 (int(dev_stat.lat_curr * 1000), dev_stat.lat_curr),
                 (int(dev_stat.io_time_curr * 100), dev_stat.io_time_curr)
             ])
+            # cpu goes next to data device latency
+            if is_data:
+                perf_info[-1:-1] = cpu_info
 
         if have_data:
             table.add_cell(str(osd.id))
@@ -522,6 +685,46 @@ def show_osd_perf_info(report, cluster):
     else:
         report.add_block(6, "OSD's current load unawailable", "")
 
+    table = html2.HTMLTable(headers=["OSD",
+                                     "node",
+                                     "dev",
+                                     "type",
+                                     "OPS<br>p50 / p95 / p99 / max",
+                                     "Bps<br>p50 / p95 / p99 / max",
+                                     "lat, ms<br>p50 / p95 / p99 / max",
+                                     "QD<br>p50 / p95 / p99 / max"])
+
+    have_any_data = False
+    for osd in cluster.osds:
+        if osd.data_stor_stats is not None and \
+           osd.j_stor_stats is not None and \
+           osd.j_stor_stats.root_dev == osd.data_stor_stats.root_dev:
+            dev_list = [('data/journal', osd.data_stor_stats)]
+        else:
+            dev_list = [('data', osd.data_stor_stats),
+                        ('journal', osd.j_stor_stats)]
+
+        for tp, dev_stat in dev_list:
+            if dev_stat is None or dev_stat.iops_dist is None:
+                continue
+
+            have_any_data = True
+            table.add_cell(str(osd.id))
+            table.add_cell(osd.host)
+            table.add_cell(os.path.basename(dev_stat.root_dev))
+            table.add_cell(tp)
+
+            # sorted by p95
+            for dist, fmt in ((dev_stat.iops_dist, lambda x: b2ssize(x, False)),
+                              (dev_stat.bytes_dist, lambda x: b2ssize(x, False)),
+                              (dev_stat.lat_dist, lambda x: str(int(x * 1000))),
+                              (dev_stat.queue_depth_dist, lambda x: "%.1f" % (x,))):
+                table.add_cell(" / ".join(map(fmt, dist)), sorttable_customkey=str(dist[1]))
+            table.next_row()
+
+    if have_any_data:
+        report.add_block(8, "OSD's load distribution:", table)
+
 
 def show_host_network_load_in_color(report, cluster):
     net_io = collections.defaultdict(lambda: {})
@@ -550,9 +753,9 @@ def show_host_network_load_in_color(report, cluster):
                          net.perf_stats_curr.rbytes))
 
             if usage > 0 or name in ('cluster', 'public'):
-                net_io[host.name][name] = (usage, net.speed)
-                send_net_io[host.name][name] = (net.perf_stats_curr.sbytes, net.speed)
-                recv_net_io[host.name][name] = (net.perf_stats_curr.rbytes, net.speed)
+                net_io[host.name][name] = (usage, net)
+                send_net_io[host.name][name] = (net.perf_stats_curr.sbytes, net)
+                recv_net_io[host.name][name] = (net.perf_stats_curr.rbytes, net)
 
     if len(net_io) == 0:
         report.add_block(6, "No network load awailable", "")
@@ -584,17 +787,22 @@ def show_host_network_load_in_color(report, cluster):
                     table.add_cell('-')
                     continue
 
-                usage, speed = data[net_name]
-                if speed is None:
+                # colored by link saturation, half duplex link is
+                # saturated by both directions together
+                usage, net = data[net_name]
+                if net.util_curr is None:
                     color = "#FFFFFF"
+                    usage_s = b2ssize(usage, False)
                 else:
-                    color = val_to_color(float(usage) / speed)
+                    util = net.util_curr if net.duplex is False else usage * 100.0 / net.speed
+                    color = val_to_color(util / 100)
+                    usage_s = "{0} ({1}%)".format(b2ssize(usage, False), int(util + 0.5))
 
                 if net_name not in std_nets:
                     text = H.div(net_name, _class="left") + \
-                           H.div(b2ssize(usage, False), _class="right")
+                           H.div(usage_s, _class="right")
                 else:
-                    text = b2ssize(usage, False)
+                    text = usage_s
 
                 table.add_cell(text,
                                bgcolor=color,
@@ -624,9 +832,10 @@ def show_host_io_load_in_color(report, cluster):
     io_time = collections.defaultdict(lambda: {})
     w_io_time = collections.defaultdict(lambda: {})
 
+    cluster.require('fill_io_devices_usage_stats')
     for osd in cluster.osds:
         for dev_stat in (osd.data_stor_stats, osd.j_stor_stats):
-            if dev_stat is None or 'write_bytes_curr' not in dev_stat:
+            if dev_stat is None or dev_stat.write_bytes_curr is None:
                 continue
 
             dev = os.path.basename(dev_stat.root_dev)
@@ -705,17 +914,87 @@ def show_host_io_load_in_color(report, cluster):
         report.add_block(weight, tp, table, "Disk IO - " + tp)
 
 
+# heatmap size limits, busiest OSD's and latest minutes are shown
+LOG_HEATMAP_OSDS = 30
+LOG_HEATMAP_MINUTES = 60
+
+log_event_columns = [
+    (ceph_logs.SLOW_REQUEST, "Slow<br>requests"),
+    (ceph_logs.SUBOP_WAIT, "Waited as<br>replica"),
+    (ceph_logs.HEARTBEAT_NO_REPLY, "Heartbeat<br>no reply"),
+    (ceph_logs.OSD_FAILED, "Reported<br>failed"),
+    (ceph_logs.MARKED_DOWN, "Wrongly<br>marked down"),
+]
+
+
+def show_log_events(report, cluster):
+    stats = cluster.log_stats
+    if stats.events_count == 0:
+        report.add_block(4, "Log events:", "No slow requests or OSD failures in logs")
+        return
+
+    # slow requests on OSD itself and ones, where other OSD's waits for it
+    def slow_score(counts):
+        return counts[ceph_logs.SLOW_REQUEST] + counts[ceph_logs.SUBOP_WAIT]
+
+    table = html2.HTMLTable(headers=["OSD", "node", "Max slow<br>request age, s"] +
+                                    [header for _, header in log_event_columns])
+    osd_hosts = dict((osd.id, osd.host) for osd in cluster.osds)
+    for osd_id, counts in sorted(stats.per_osd.items(), key=lambda x: -slow_score(x[1])):
+        table.add_cell(str(osd_id))
+        table.add_cell(str(osd_hosts.get(osd_id, '-')))
+        max_age = stats.slow_max_age.get(osd_id)
+        table.add_cell('-' if max_age is None else "%.1f" % (max_age,),
+                       sorttable_customkey=str(max_age or 0))
+        for kind, _ in log_event_columns:
+            table.add_cell(str(counts[kind]))
+        table.next_row()
+    report.add_block(6, "OSD's log events:", table)
+
+    table = html2.HTMLTable(headers=["Host"] + [header for _, header in log_event_columns])
+    for host_name, counts in sorted(stats.per_host.items()):
+        table.add_row([host_name] + [str(counts[kind]) for kind, _ in log_event_columns])
+    report.add_block(6, "Host's log events:", table)
+
+    # OSD x minute heatmap of slow requests
+    per_osd = collections.Counter()
+    for (osd_id, _), count in stats.osd_minute_slow.items():
+        per_osd[osd_id] += count
+
+    if len(per_osd) == 0:
+        return
+
+    osd_ids = sorted(osd_id for osd_id, _ in per_osd.most_common(LOG_HEATMAP_OSDS))
+    minutes = sorted(set(minute for _, minute in stats.osd_minute_slow))[-LOG_HEATMAP_MINUTES:]
+    max_val = max(stats.osd_minute_slow.values())
+
+    table = html2.HTMLTable(['OSD'] + [minute[11:] for minute in minutes], zebra=False)
+    for osd_id in osd_ids:
+        table.add_cell("osd.{0}".format(osd_id))
+        for minute in minutes:
+            val = stats.osd_minute_slow.get((osd_id, minute), 0)
+            table.add_cell(str(val) if val != 0 else "",
+                           bgcolor=val_to_color(float(val) / max_val) if val != 0 else "#FFFFFF",
+                           sorttable_customkey=str(val))
+        table.next_row()
+
+    report.add_block(12, "Slow requests per minute, since " + minutes[0], table,
+                     "Slow requests heatmap")
+
+
 def show_hosts_info(report, cluster):
+    cluster.require('fill_cpu_usage_stats')
     header_row = ["Name",
                   "Services",
                   "CPU's",
                   "RAM<br>total",
                   "RAM<br>free",
                   "Swap<br>used",
-                  "Load avg<br>5m"]
+                  "Load avg<br>5m",
+                  "OSD's CPU %<br>mean / peak"]
     table = html2.HTMLTable(headers=header_row)
     for host in sorted(cluster.hosts.values(), key=lambda x: x.name):
-        services = ["osd-{0}".format(osd.id) for osd in cluster.osds if osd.host == host.name]
+        services = ["osd-{0}".format(osd_id) for osd_id in cluster.crush.host_osds.get(host.name, [])]
         all_mons = [mon.name for mon in cluster.mons]
 
         if host.name in all_mons:
@@ -745,11 +1024,120 @@ def show_hosts_info(report, cluster):
         table.add_cell(b2ssize(host.swap_total - host.swap_free),
                        sorttable_customkey=str(host.swap_total - host.swap_free))
         table.add_cell(host.load_5m)
+
+        if host.osd_cpu_mean is None:
+            table.add_cell('-', sorttable_customkey='0')
+        else:
+            cpu = "{0} / {1}".format(int(host.osd_cpu_mean * 100), int(host.osd_cpu_peak * 100))
+            # OSD's alone nearly saturate host CPU's
+            if host.osd_cpu_peak >= 0.9:
+                cpu = html_fail(cpu)
+            table.add_cell(str(cpu), sorttable_customkey=str(host.osd_cpu_mean))
         table.next_row()
 
     report.add_block(6, "Host's info:", table)
 
 
+def show_crush_tree(report, cluster):
+    table = html2.HTMLTable(headers=["Bucket",
+                                     "Type",
+                                     "OSD's",
+                                     "Weight",
+                                     "PG's",
+                                     "Used",
+                                     "IOPS",
+                                     "Bps"])
+
+    weight = cluster.crush_aggregate('weight')
+    pg_count = cluster.crush_aggregate('pg_count')
+    used = cluster.crush_aggregate('used')
+    iops = cluster.crush_aggregate('iops')
+    bts = cluster.crush_aggregate('bytes')
+
+    for depth, node in cluster.crush.iter_nodes():
+        if node['type'] == 'osd':
+            continue
+
+        node_id = node['id']
+        table.add_cell("&nbsp;" * (depth * 4) + str(node['name']))
+        table.add_cell(node['type'])
+        table.add_cell(str(len(cluster.crush.subtree_osds[node_id])))
+        table.add_cell("%.3f" % (weight[node_id],))
+        table.add_cell(str(pg_count[node_id]))
+        table.add_cell(b2ssize(used[node_id], False), sorttable_customkey=str(used[node_id]))
+        table.add_cell(b2ssize(iops[node_id], False), sorttable_customkey=str(iops[node_id]))
+        table.add_cell(b2ssize(bts[node_id], False), sorttable_customkey=str(bts[node_id]))
+        table.next_row()
+
+    report.add_block(6, "Crush tree:", table)
+
+
+NET_CONNS_TOP = 30
+
+
+def show_net_connections(report, cluster):
+    conns = cluster.net_conns
+    if conns.hosts == []:
+        report.add_block(6, "TCP connections:", "No netstat data")
+        return
+
+    # host x host connections matrix, as seen on source host
+    table = html2.HTMLTable(headers=["From \\ To"] + conns.hosts + ["other"], zebra=False)
+    for host in conns.hosts:
+        table.add_cell(host)
+        for remote_host in conns.hosts + [None]:
+            stats = conns.host_conns.get((host, remote_host))
+            if stats is None:
+                table.add_cell('-')
+                continue
+
+            text = "{0}<br>{1} / {2}".format(stats.count, b2ssize(stats.send_q, False),
+                                            b2ssize(stats.recv_q, False))
+            table.add_cell(html_fail(text) if stats.backed_up else text,
+                           sorttable_customkey=str(stats.count))
+        table.next_row()
+    report.add_block(12, "TCP connections (count<br>send / recv queue, B):", table,
+                     "TCP connections")
+
+    report.next_line()
+
+    table = html2.HTMLTable(headers=["Host", "OSD", "Local", "Remote", "Remote<br>host",
+                                     "Remote<br>OSD", "Recv-Q", "Send-Q"])
+    for host, osd_id, local, remote, remote_host, remote_osd_id, recv_q, send_q in \
+            conns.backed_up[:NET_CONNS_TOP]:
+        table.add_cells(host, '-' if osd_id is None else str(osd_id), local, remote,
+                        remote_host or '-', '-' if remote_osd_id is None else str(remote_osd_id),
+                        b2ssize(recv_q, False), b2ssize(send_q, False))
+    report.add_block(6, "Backed up sockets:",
+                     table if conns.backed_up != [] else html_ok("No backed up sockets"))
+
+    # OSD pairs, which connections have most queued data
+    def queued(item):
+        return item[1].send_q + item[1].recv_q
+
+    table = html2.HTMLTable(headers=["OSD", "Remote<br>OSD", "Connections", "Send-Q", "Recv-Q"])
+    osd_pairs = sorted((item for item in conns.osd_conns.items() if queued(item) > 0),
+                       key=lambda item: -queued(item))
+    for (osd_id, remote_osd_id), stats in osd_pairs[:NET_CONNS_TOP]:
+        table.add_cells(str(osd_id), str(remote_osd_id), str(stats.count),
+                        b2ssize(stats.send_q, False), b2ssize(stats.recv_q, False))
+    report.add_block(3, "OSD pairs with queued data:",
+                     table if osd_pairs != [] else html_ok("No queued data"))
+
+    table = html2.HTMLTable(headers=["Kind", "First", "Second", "Conns<br>on first",
+                                     "Conns<br>on second"])
+    for kind, pairs in (('host', conns.asymmetric_hosts), ('osd', conns.asymmetric_osds)):
+        for first, second, first_count, second_count in pairs:
+            table.add_cells(kind, str(first), str(second), str(first_count), str(second_count))
+    asymmetric = conns.asymmetric_hosts + conns.asymmetric_osds
+    report.add_block(3, "Asymmetric peering:",
+                     table if asymmetric != [] else html_ok("All connections are seen by both sides"))
+
+
+# link with higher peak usage, %, is saturated
+LINK_SATURATION = 90
+
+
 def show_hosts_resource_usage(report, cluster):
     nets_info = {}
 
@@ -771,9 +1159,11 @@ def show_hosts_resource_usage(report, cluster):
                   "Cluster net<br>dev, ip<br>settings",
                   "Cluster net<br>uptime average<br>send/recv",
                   "Cluster net<br>current<br>send/recv",
+                  "Cluster net<br>link usage %<br>p95 / peak",
                   "Public net<br>dev, ip<br>settings",
                   "Public net<br>uptime average<br>send/recv",
-                  "Public net<br>current<br>send/recv"]
+                  "Public net<br>current<br>send/recv",
+                  "Public net<br>link usage %<br>p95 / peak"]
 
     header_row += ["Net"] * max_nets
     row_len = len(header_row)
@@ -784,7 +1174,7 @@ def show_hosts_resource_usage(report, cluster):
 
         for net in (host.cluster_net, host.public_net):
             if net is None:
-                perf_info.extend(["-"] * 3)
+                perf_info.extend(["-"] * 4)
             else:
                 dev_ip = "{0}<br>{1}".format(net.name, net.ip)
 
@@ -803,15 +1193,26 @@ def show_hosts_resource_usage(report, cluster):
                 ))
 
                 if net.perf_stats_curr is not None:
-                    perf_info.append("{0} / {1} Bps<br>{2} / {3} Pps".format(
+                    curr = "{0} / {1} Bps<br>{2} / {3} Pps".format(
                         b2ssize(net.perf_stats_curr.sbytes, False),
                         b2ssize(net.perf_stats_curr.rbytes, False),
                         b2ssize(net.perf_stats_curr.spackets, False),
                         b2ssize(net.perf_stats_curr.rpackets, False),
-                    ))
+                    )
+                    if net.perf_stats_peak is not None:
+                        curr += "<br>peak {0} / {1} Bps".format(
+                            b2ssize(net.perf_stats_peak.sbytes, False),
+                            b2ssize(net.perf_stats_peak.rbytes, False))
+                    perf_info.append(curr)
                 else:
                     perf_info.append('-')
 
+                if net.util_peak is None:
+                    perf_info.append('-')
+                else:
+                    usage = "{0:.0f} / {1:.0f}".format(net.util_p95, net.util_peak)
+                    perf_info.append(html_fail(usage) if net.util_peak >= LINK_SATURATION else usage)
+
         for net in nets_info[host.name]:
             if net.speed is not None:
                 cell_data = H.div(net.name, _class="left") + \
@@ -826,6 +1227,73 @@ def show_hosts_resource_usage(report, cluster):
     report.add_block(12, "Host's resource usage:", table)
 
 
+per_node_dirs = ('hosts', 'osd', 'mon', 'rusage', 'perf_monitoring')
+
+
+def get_item_type(path):
+    # 'hosts/node-1/lshw' => ('hosts/*/lshw', 'node-1')
+    parts = path.split('/')
+    if parts[0] not in per_node_dirs or len(parts) < 3:
+        return path, None
+
+    owner = parts[1]
+    parts[1] = '*'
+    if parts[0] == 'rusage':
+        parts[2] = '*-' + parts[2].split('-', 1)[-1]
+    return "/".join(parts), owner
+
+
+def show_collection_coverage(report, cluster):
+    manifest = cluster.manifest
+    if manifest is None:
+        return
+
+    owners = collections.defaultdict(lambda: set())
+    items_ok = collections.defaultdict(lambda: {})
+    items_size = collections.Counter()
+    items_time = collections.Counter()
+
+    for item in manifest.items.values():
+        tp, owner = get_item_type(item.path)
+        owners[tp.split('/', 1)[0]].add(owner)
+        items_ok[tp][owner] = items_ok[tp].get(owner, True) and item.ok
+        items_size[tp] += item.size
+        items_time[tp] += item.duration or 0
+
+    table = html2.HTMLTable(headers=["Item",
+                                     "Collected",
+                                     "Failed",
+                                     "Missing",
+                                     "Size",
+                                     "Collect<br>time, s"])
+
+    have_gaps = False
+    for tp, per_owner in sorted(items_ok.items()):
+        failed = sorted(owner for owner, ok in per_owner.items() if not ok)
+        missing = sorted(owners[tp.split('/', 1)[0]] - set(per_owner))
+
+        if failed == [] and missing == []:
+            continue
+
+        have_gaps = True
+        table.add_cell(tp)
+        table.add_cell(str(len(per_owner) - len(failed)))
+        table.add_cell(html_fail(", ".join(map(str, failed))) if failed else "-",
+                       sorttable_customkey=str(len(failed)))
+        table.add_cell(html_fail(", ".join(map(str, missing))) if missing else "-",
+                       sorttable_customkey=str(len(missing)))
+        table.add_cell(b2ssize(items_size[tp], False),
+                       sorttable_customkey=str(items_size[tp]))
+        table.add_cell("%.1f" % (items_time[tp],))
+        table.next_row()
+
+    if have_gaps:
+        report.add_block(8, "Collection gaps:", table)
+    else:
+        report.add_block(4, "Collection gaps: all {0} items collected".format(
+            len(manifest.items)), "")
+
+
 def get_io_resource_usage(cluster):
     writes_per_dev = {}
     reads_per_dev = {}
@@ -852,13 +1320,9 @@ def get_io_resource_usage(cluster):
             if dev not in perf_m['io']:
                 continue
 
-            prev_val = perf_m['io'][dev].values[0]
-            writes = []
-            reads = []
-            for val in perf_m['io'][dev].values[1:]:
-                writes.append(val.writes_completed - prev_val.writes_completed)
-                reads.append(val.reads_completed - prev_val.reads_completed)
-                prev_val = val
+            dev_log = perf_m['io'][dev]
+            writes = numpy.diff(dev_log['writes_completed']).astype(int).tolist()
+            reads = numpy.diff(dev_log['reads_completed']).astype(int).tolist()
 
             dev_uuid = "osd-{0}.{1}".format(str(osd.id), tp)
             writes_per_dev[dev_uuid] = writes
@@ -985,21 +1449,18 @@ def show_osd_pool_PG_distribution(report, cluster):
         report.add_block(6, "PG copy per OSD: No pg dump data. Probably too many PG", "")
         return
 
-    pools = sorted(cluster.sum_per_pool)
+    pools = cluster.pg_pool_names
     table = html2.HTMLTable(headers=["OSD/pool"] + list(pools) + ['sum'])
 
-    for osd_id, row in sorted(cluster.osd_pool_pg_2d.items()):
-        data = [osd_id] + \
-               [row.get(pool_name, 0) for pool_name in pools] + \
-               [cluster.sum_per_osd[osd_id]]
-
-        table.add_row(map(str, data))
+    per_osd = cluster.osd_pool_pg.sum(axis=1)
+    for osd_id, row, osd_sum in zip(cluster.pg_osd_ids, cluster.osd_pool_pg.tolist(), per_osd.tolist()):
+        table.add_row(map(str, [osd_id] + row + [osd_sum]))
 
     table.add_cell("sum",
                    sorttable_customkey=str(max(osd.id for osd in cluster.osds) + 1))
 
-    map(table.add_cell, (cluster.sum_per_pool[pool_name] for pool_name in pools))
-    table.add_cell(str(sum(cluster.sum_per_pool.values())))
+    map(table.add_cell, cluster.osd_pool_pg.sum(axis=0).tolist())
+    table.add_cell(str(cluster.osd_pool_pg.sum()))
 
     report.add_block(8, "PG copy per OSD:", table)
 
@@ -1079,12 +1540,13 @@ def tree_to_visjs(report, cluster):
         w = (float(node['crush_weight']) - min_w) / (max_w - min_w)
         return val_to_color(w)
 
-    try:
-        min_pg = min(cluster.sum_per_osd.values())
-        max_pg = max(cluster.sum_per_osd.values())
-        min_pg = min(max_pg / 2, min_pg)
-    except AttributeError:
+    if cluster.sum_per_osd is None or cluster.osd_pool_pg.size == 0:
         min_pg = max_pg = None
+    else:
+        per_osd = cluster.osd_pool_pg.sum(axis=1)
+        min_pg = int(per_osd.min())
+        max_pg = int(per_osd.max())
+        min_pg = min(max_pg / 2, min_pg)
 
     def get_color_pg_count(node):
         if cluster.sum_per_osd is None or min_pg is None or \
@@ -1108,7 +1570,7 @@ def tree_to_visjs(report, cluster):
         ]
 
         for node in cluster.osd_tree.values():
-            for child_id in node.get('children', []):
+            for child_id in cluster.crush.children[node['id']]:
                 eges_list.append(
                     "{{from: {0}, to: {1} }}".format(node['id'], child_id)
                 )
@@ -1135,6 +1597,281 @@ def tree_to_visjs(report, cluster):
         report.onload.append("draw1()")
 
 
+TIMELINE_PAGE_SIZE = 1000
+severity_colors = {'WRN': 'orange', 'ERR': 'red'}
+
+
+def timeline_page_name(page):
+    return "timeline_{0}.html".format(page)
+
+
+def write_timeline_page(report, output_dir, css_links, js_links, page, events, is_last):
+    table = html2.HTMLTable(headers=["Time", "Host", "OSD", "Source", "Severity", "Message"])
+    for event in events:
+        table.add_cell(event.time)
+        table.add_cell('-' if event.host is None else event.host)
+        table.add_cell('-' if event.osd_id is None else str(event.osd_id))
+        table.add_cell(event.source)
+        color = severity_colors.get(event.severity)
+        table.add_cell(event.severity if color is None else H.font(event.severity, color=color))
+        table.add_cell(cgi.escape(event.message), style="text-align: left;")
+        table.next_row()
+
+    links = []
+    if page > 1:
+        links.append(H.a("&lt; prev", href=timeline_page_name(page - 1)))
+    links.append(H.a("report", href=report.output_file))
+    if not is_last:
+        links.append(H.a("next &gt;", href=timeline_page_name(page + 1)))
+    nav = H.center(" | ".join(links))
+
+    doc = html2.Doc()
+    with doc.html:
+        with doc.head:
+            doc.title("Ceph cluster timeline: {0}, page {1}".format(report.cluster_name, page))
+            for url in css_links:
+                doc.link(href=url, rel="stylesheet", type="text/css")
+            doc.style("\n".join(report.style), type="text/css")
+            for url in js_links:
+                doc.script(type="text/javascript", src=url)
+
+        with doc.body:
+            with doc.div(_class="container-fluid"):
+                doc(nav)
+                doc(str(table) if events != [] else H.center("No events"))
+                doc(nav)
+
+    with open(os.path.join(output_dir, timeline_page_name(page)), "w") as fd:
+        fd.write("<!doctype html>" + str(doc))
+
+
+def show_timeline(report, cluster, hosts=None, osds=None, min_severity=None):
+    # events are merged from raw logs, while pages are written,
+    # so only one page of them is kept in memory
+    def writer(output_dir, css_links, js_links):
+        events = timeline.merge_events(cluster.timeline_streams(), hosts, osds, min_severity)
+        pages = iter(lambda: list(itertools.islice(events, TIMELINE_PAGE_SIZE)), [])
+
+        page = 1
+        curr = next(pages, [])
+        while True:
+            nxt = next(pages, [])
+            write_timeline_page(report, output_dir, css_links, js_links, page, curr, nxt == [])
+            if nxt == []:
+                break
+            curr = nxt
+            page += 1
+
+    report.writers.append(writer)
+
+    table = html2.HTMLTable(["Filter", "Value"])
+    table.add_cells("Hosts", "All" if hosts is None else ", ".join(hosts))
+    table.add_cells("OSDs", "All" if osds is None else ", ".join(map(str, osds)))
+    table.add_cells("Min severity", min_severity or timeline.SEVERITIES[0])
+    report.add_block(4, "Events timeline:",
+                     str(table) + H.a("Timeline of logs and dmesg events", href=timeline_page_name(1)))
+
+
+# report rows, sections of a row are placed side by side;
+# model data is only loaded for sections which are rendered
+report_layout = [
+    [('suspects', show_suspects)],
+    [('summary', show_summary)],
+    [('hosts', show_hosts_info), ('mons', show_mons_info), ('osd_state', show_osd_state)],
+    [('osd_info', show_osd_info)],
+    [('disks_health', show_disks_health)],
+    [('config_drift', show_config_drift)],
+    [('crush', show_crush_tree)],
+    [('osd_perf', show_osd_perf_info)],
+    [('pools', show_pools_info), ('pg_state', show_pg_state)],
+    [('pg_distribution', show_osd_pool_PG_distribution)],
+    [('io_load', show_host_io_load_in_color)],
+    [('net_load', show_host_network_load_in_color)],
+    [('net_conns', show_net_connections)],
+    [('resource_usage', show_hosts_resource_usage)],
+    [('log_events', show_log_events)],
+    [('timeline', show_timeline)],
+    [('coverage', show_collection_coverage)],
+    [('graph', tree_to_visjs)],
+]
+
+report_sections = [name for row in report_layout for name, _ in row]
+
+# sections, which read raw data and are rendered only if selected with --sections,
+# so that report for archive can be made from model snapshot without extracting it
+raw_data_sections = ('timeline',)
+default_sections = [name for name in report_sections if name not in raw_data_sections]
+
+
+def fmt_change(old_val, new_val, fmt=str, worse_if_grows=False):
+    if old_val is None and new_val is None:
+        return '-'
+
+    res = "{0} &rarr; {1}".format('-' if old_val is None else fmt(old_val),
+                                   '-' if new_val is None else fmt(new_val))
+
+    # 20% grow of latency and alike is worth to look at
+    if worse_if_grows and old_val is not None and new_val is not None and \
+       new_val > old_val * 1.2 and new_val - old_val > 1E-3:
+        return str(html_fail(res))
+    return res
+
+
+def show_summary_diff(report, old, new):
+    t = html2.HTMLTable(["Setting", "Before", "After"])
+    t.add_cells("Collected at", old.report_collected_at_local, new.report_collected_at_local)
+    t.add_cells("Status", old.overall_status, new.overall_status)
+    t.add_cells("OSD count", len(old.osds), len(new.osds))
+    t.add_cells("PG count", old.num_pgs, new.num_pgs)
+    t.add_cells("Pool count", len(old.pools), len(new.pools))
+    t.add_cells("Used", b2ssize(old.bytes_used, False), b2ssize(new.bytes_used, False))
+    t.add_cells("Client IO Bps", b2ssize(old.write_bytes_sec, False),
+                b2ssize(new.write_bytes_sec, False))
+    t.add_cells("Client IO IOPS", b2ssize(old.op_per_sec, False),
+                b2ssize(new.op_per_sec, False))
+    report.add_block(4, "Status:", t)
+
+
+def show_health_diff(report, old, new):
+    new_msgs, resolved_msgs = cluster_diff.health_diff(old, new)
+
+    t = html2.Doc()
+    if new_msgs == [] and resolved_msgs == []:
+        t.font("No changes")
+
+    for severity, msg in new_msgs:
+        t.font("New: " + msg.capitalize(),
+               color="red" if severity == "HEALTH_ERR" else "orange")
+        t.br
+
+    for severity, msg in resolved_msgs:
+        t.font("Resolved: " + msg.capitalize(), color="green")
+        t.br
+
+    report.add_block(4, "Status messages:", t)
+
+
+def show_osd_diff(report, old, new):
+    added, removed, rows = cluster_diff.osds_diff(old, new)
+
+    table = html2.HTMLTable(headers=["OSD", "Host", "Status",
+                                     "Apply<br>lat, ms", "Commit<br>lat, ms",
+                                     "Data dev<br>IOPS", "Data dev<br>lat, ms",
+                                     "Data dev<br>queue depth", "PG count"])
+
+    def lat_ms(val):
+        return str(int(val * 1000))
+
+    for osd_id, values in rows:
+        old_status, new_status = values['status']
+        if old_status == new_status:
+            status = html_ok(new_status) if new_status == 'up' else html_fail(new_status)
+        else:
+            status = html_fail("{0} &rarr; {1}".format(old_status, new_status))
+
+        old_host, new_host = values['host']
+        host = old_host if old_host == new_host else "{0} &rarr; {1}".format(old_host, new_host)
+
+        table.add_row(map(str, [
+            osd_id, host, status,
+            fmt_change(*values['apply_latency_ms'], worse_if_grows=True),
+            fmt_change(*values['commit_latency_ms'], worse_if_grows=True),
+            fmt_change(*values['iops'], fmt=lambda x: b2ssize(x, False)),
+            fmt_change(*values['lat'], fmt=lat_ms, worse_if_grows=True),
+            fmt_change(*values['queue_depth'], fmt=lambda x: "%.1f" % (x,), worse_if_grows=True),
+            fmt_change(*values['pg_count']),
+        ]))
+
+    doc = html2.Doc()
+    if added != []:
+        doc.font("New OSD's: " + ", ".join(map(str, added)))
+        doc.br
+    if removed != []:
+        doc.font("Removed OSD's: " + ", ".join(map(str, removed)), color="red")
+        doc.br
+
+    report.add_block(12, "OSD's changes:", str(doc) + str(table))
+
+
+def show_pg_distribution_diff(report, old, new):
+    osd_ids, pool_names, old_matrix, new_matrix = cluster_diff.pg_distribution_diff(old, new)
+    moved = cluster_diff.pg_moves(old_matrix, new_matrix)
+    per_osd_delta = numpy.abs(new_matrix - old_matrix)
+
+    table = html2.HTMLTable(headers=["Pool", "PG copies<br>before", "PG copies<br>after",
+                                     "Moved<br>copies", "OSD's<br>changed",
+                                     "Max change<br>per OSD"])
+
+    for pos, pool_name in enumerate(pool_names):
+        table.add_row(map(str, [
+            pool_name,
+            old_matrix[:, pos].sum(),
+            new_matrix[:, pos].sum(),
+            moved[pos],
+            (per_osd_delta[:, pos] != 0).sum(),
+            per_osd_delta[:, pos].max() if len(osd_ids) != 0 else 0,
+        ]))
+
+    report.add_block(6, "PG distribution changes:", table)
+
+
+def show_config_diff(report, old, new):
+    changes = cluster_diff.config_diff(old, new)
+
+    table = html2.HTMLTable(headers=["Setting", "OSD's", "Change"])
+    for key, osd_changes in sorted(changes.items()):
+        # same change on many OSD's is shown once
+        per_change = collections.Counter((old_val, new_val)
+                                         for _, old_val, new_val in osd_changes)
+        descr = "<br>".join("{0} ({1})".format(fmt_change(old_val, new_val), count)
+                            for (old_val, new_val), count in sorted(per_change.items()))
+        table.add_row(map(str, [key, len(osd_changes), descr]))
+
+    report.add_block(6, "OSD's config changes:", table)
+
+
+def show_hosts_diff(report, old, new):
+    added, removed, rows = cluster_diff.hosts_diff(old, new)
+
+    table = html2.HTMLTable(headers=["Host", "Load avg<br>5m", "Free mem", "Swap used",
+                                     "Cluster net<br>send, Bps", "Cluster net<br>recv, Bps",
+                                     "Public net<br>send, Bps", "Public net<br>recv, Bps"])
+
+    def size(val):
+        return b2ssize(val, False)
+
+    for name, values in rows:
+        table.add_row(map(str, [
+            name,
+            fmt_change(*values['load_5m'], worse_if_grows=True),
+            fmt_change(*values['mem_free'], fmt=size),
+            fmt_change(*values['swap_used'], fmt=size, worse_if_grows=True),
+            fmt_change(*values['cluster_net_send'], fmt=size),
+            fmt_change(*values['cluster_net_recv'], fmt=size),
+            fmt_change(*values['public_net_send'], fmt=size),
+            fmt_change(*values['public_net_recv'], fmt=size),
+        ]))
+
+    doc = html2.Doc()
+    if added != []:
+        doc.font("New hosts: " + ", ".join(added))
+        doc.br
+    if removed != []:
+        doc.font("Removed hosts: " + ", ".join(removed), color="red")
+        doc.br
+
+    report.add_block(12, "Host's resource usage changes:", str(doc) + str(table))
+
+
+# same as report_layout, for two collections comparison
+compare_layout = [
+    [show_summary_diff, show_health_diff],
+    [show_osd_diff],
+    [show_pg_distribution_diff, show_config_diff],
+    [show_hosts_diff],
+]
+
+
 def parse_args(argv):
     p = argparse.ArgumentParser()
     p.add_argument("-o", '--out',
@@ -1148,27 +1885,140 @@ def parse_args(argv):
                    action="store_true")
     p.add_argument("--profile", help="Don't draw OSD graphs", default=False,
                    action="store_true")
-    p.add_argument("data_folder", help="Folder with data, or .tar.gz archive")
+    p.add_argument("--sections", default=None, metavar="NAME[,NAME...]",
+                   help="Comma separated list of report sections to render, one of: " +
+                        ", ".join(report_sections) + ". All, except " +
+                        ", ".join(raw_data_sections) + ", by default")
+    p.add_argument("--no-cache", action="store_true", default=False,
+                   help="Don't use or store loaded model snapshot for archives")
+    p.add_argument("-j", "--jobs", help="Processes to parse per-host data", default=1,
+                   type=int, metavar="N")
+    p.add_argument("--history-id", help="Render collection ID from history database",
+                   default=None, type=int, metavar="ID")
+    p.add_argument("--timeline-hosts", default=None, metavar="HOST[,HOST...]",
+                   help="Show only events of these hosts in timeline")
+    p.add_argument("--timeline-osds", default=None, metavar="ID[,ID...]",
+                   help="Show only events of these OSD's in timeline")
+    p.add_argument("--timeline-severity", default=None, choices=timeline.SEVERITIES,
+                   help="Show only events of this or higher severity in timeline")
+    p.add_argument("data_folder", help="Folder with data, .tar.gz archive or sqlite results file")
     return p.parse_args(argv[1:])
 
 
+def parse_compare_args(argv):
+    p = argparse.ArgumentParser(prog="visualize_cluster.py compare")
+    p.add_argument("-o", '--out',
+                   help="report output folder", required=True)
+    p.add_argument("-w", '--overwrite', action='store_true', default=False,
+                   help="Overwrite result folder data")
+    p.add_argument("-n", "--name", help="Report name", default="Nemo")
+    p.add_argument("--no-cache", action="store_true", default=False,
+                   help="Don't use or store loaded model snapshot for archives")
+    p.add_argument("-j", "--jobs", help="Processes to parse per-host data of each collection",
+                   default=1, type=int, metavar="N")
+    p.add_argument("old_data", help="Collection before change - folder, archive or sqlite file")
+    p.add_argument("new_data", help="Collection after change - folder, archive or sqlite file")
+    return p.parse_args(argv[1:])
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(1024 ** 2), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_archive_file(path):
+    return os.path.isfile(path) and not is_sqlite_file(path)
+
+
+class CollectionSource(object):
+    # raw data and model snapshot of one collection; archive is
+    # extracted only when data, which isn't in snapshot, is needed
+    def __init__(self, data_path, use_cache=True, history_id=None):
+        self.data_path = data_path
+        self.history_id = history_id
+        self.tmp_folder = None
+
+        # loaded model of archive is cached next to it
+        self.snapshot_path = self.snapshot_key = None
+        if is_archive_file(data_path) and use_cache:
+            self.snapshot_path = data_path + SNAPSHOT_EXT
+            self.snapshot_key = file_sha1(data_path)
+
+        # loaders, which are in stored snapshot
+        self.snapshot_loaded = None
+
+    def open_storage(self):
+        # returns (jstorage, storage)
+        if is_archive_file(self.data_path):
+            self.tmp_folder = folder = tempfile.mkdtemp()
+            subprocess.call("tar -zxvf {0} -C {1} >/dev/null 2>&1".format(self.data_path, folder),
+                            shell=True)
+        else:
+            folder = self.data_path
+
+        if self.history_id is not None:
+            storage = HistoryStore(folder).storage(self.history_id)
+        else:
+            storage = open_storage(folder)
+        return JResultStorage(storage), storage
+
+    def load_cluster(self, jobs=1):
+        if self.snapshot_path is not None:
+            cluster = load_snapshot(self.snapshot_path, self.snapshot_key)
+            if cluster is not None:
+                cluster.storage_opener = self.open_storage
+                self.snapshot_loaded = set(cluster.loaded)
+                return cluster
+
+        # model is loaded lazily, only data for selected sections
+        jstorage, storage = self.open_storage()
+        cluster = CephCluster(jstorage, storage, workers=jobs)
+        cluster.storage_opener = self.open_storage
+        return cluster
+
+    def save_snapshot(self, cluster):
+        # called after model is used, so snapshot has all loaded data
+        if self.snapshot_path is None or self.snapshot_loaded == cluster.loaded:
+            return
+
+        try:
+            save_snapshot(cluster, self.snapshot_path, self.snapshot_key)
+            self.snapshot_loaded = set(cluster.loaded)
+        except (IOError, OSError) as exc:
+            print "Can't store model snapshot to {0}: {1}".format(self.snapshot_path, exc)
+
+    def close(self):
+        if self.tmp_folder is not None:
+            shutil.rmtree(self.tmp_folder)
+            self.tmp_folder = None
+
+
+def open_cluster(data_path, jobs=1, use_cache=True, history_id=None):
+    # returns (cluster, CollectionSource), source must be closed after use
+    source = CollectionSource(data_path, use_cache, history_id)
+    try:
+        return source.load_cluster(jobs), source
+    except:
+        source.close()
+        raise
+
+
 def main(argv):
     opts = parse_args(argv)
-    remove_folder = False
-
-    if os.path.isfile(opts.data_folder):
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            arch_name = opts.data_folder
-            folder = os.tempnam()
-            os.makedirs(folder)
-            remove_folder = True
-            subprocess.call("tar -zxvf {0} -C {1} >/dev/null 2>&1".format(arch_name, folder), shell=True)
-    else:
-        folder = opts.data_folder
 
-    if not os.path.isdir(folder):
-        print "First argument should be a folder with data or path to archive"
+    if not os.path.exists(opts.data_folder):
+        print "First argument should be a folder with data, sqlite file or path to archive"
+        return 1
+
+    sections = set(default_sections if opts.sections is None else opts.sections.split(","))
+    if opts.no_graph:
+        sections.discard('graph')
+
+    if not sections.issubset(report_sections):
+        print "Unknown report sections:", ", ".join(sorted(sections - set(report_sections)))
         return 1
 
     index_path = os.path.join(opts.out, 'index.html')
@@ -1179,13 +2029,14 @@ def main(argv):
     elif not os.path.exists(opts.out):
         os.makedirs(opts.out)
 
-    try:
-        storage = RawResultStorage(folder)
-        jstorage = JResultStorage(storage)
-
-        cluster = CephCluster(jstorage, storage)
-        cluster.load()
+    timeline_opts = {'min_severity': opts.timeline_severity}
+    if opts.timeline_hosts is not None:
+        timeline_opts['hosts'] = opts.timeline_hosts.split(",")
+    if opts.timeline_osds is not None:
+        timeline_opts['osds'] = map(int, opts.timeline_osds.split(","))
 
+    cluster, source = open_cluster(opts.data_folder, opts.jobs, not opts.no_cache, opts.history_id)
+    try:
         report = Report(opts.name, "index.html")
         report.style.append('body {font: 10pt sans;}')
         report.style_links.append("https://maxcdn.bootstrapcdn.com/bootstrap/3.3.4/css/bootstrap.min.css")
@@ -1196,41 +2047,23 @@ def main(argv):
         else:
             report.script_links.append("http://www.kryogenix.org/code/browser/sorttable/sorttable.js")
 
-        show_summary(report, cluster)
-        report.next_line()
-
-        show_hosts_info(report, cluster)
-        show_mons_info(report, cluster)
-        show_osd_state(report, cluster)
-        report.next_line()
-
-        show_osd_info(report, cluster)
-        report.next_line()
-
-        show_osd_perf_info(report, cluster)
-        report.next_line()
-
-        show_pools_info(report, cluster)
-        show_pg_state(report, cluster)
-        report.next_line()
-
-        show_osd_pool_PG_distribution(report, cluster)
-        report.next_line()
-
-        show_host_io_load_in_color(report, cluster)
-        report.next_line()
-
-        show_host_network_load_in_color(report, cluster)
-        report.next_line()
+        first_row = True
+        for row in report_layout:
+            row = [functools.partial(func, **timeline_opts) if name == 'timeline' else func
+                   for name, func in row if name in sections]
+            if row == []:
+                continue
 
-        show_hosts_resource_usage(report, cluster)
-        report.next_line()
+            if not first_row:
+                report.next_line()
+            first_row = False
 
-        if not opts.no_graph:
-            tree_to_visjs(report, cluster)
+            for func in row:
+                func(report, cluster)
 
         report.save_to(opts.out)
         print "Report successfully stored in", index_path
+        source.save_snapshot(cluster)
 
         # perf_path = os.path.join(opts.out, "performance.html")
         # load_report = Report(opts.name, "performance.html")
@@ -1239,8 +2072,75 @@ def main(argv):
         # load_report.save_to(opts.out)
         # print "Peformance report successfully stored in", perf_path
     finally:
-        if remove_folder:
-            shutil.rmtree(folder)
+        source.close()
+
+
+def open_clusters(paths, jobs=1, use_cache=True):
+    # collections are extracted and parsed concurrently - each in own
+    # thread, with own process pool for per-host data; returns loaded models
+    results = [None] * len(paths)
+
+    def loader(pos, path):
+        try:
+            cluster, source = open_cluster(path, jobs, use_cache)
+            try:
+                cluster.load()
+                source.save_snapshot(cluster)
+            finally:
+                source.close()
+            results[pos] = (True, cluster)
+        except Exception:
+            results[pos] = (False, sys.exc_info())
+
+    ths = [threading.Thread(target=loader, args=(pos, path))
+           for pos, path in enumerate(paths)]
+
+    for th in ths:
+        th.daemon = True
+        th.start()
+
+    for th in ths:
+        th.join()
+
+    # re-raise in main thread with original traceback
+    for ok, res in results:
+        if not ok:
+            raise res[0], res[1], res[2]
+
+    return [res for _, res in results]
+
+
+def compare_main(argv):
+    opts = parse_compare_args(argv)
+
+    for path in (opts.old_data, opts.new_data):
+        if not os.path.exists(path):
+            print path, "should be a folder with data, sqlite file or path to archive"
+            return 1
+
+    index_path = os.path.join(opts.out, 'index.html')
+    if os.path.exists(index_path):
+        if not opts.overwrite:
+            print index_path, "already exists. Exits"
+            return 1
+    elif not os.path.exists(opts.out):
+        os.makedirs(opts.out)
+
+    old, new = open_clusters([opts.old_data, opts.new_data], opts.jobs, not opts.no_cache)
+
+    report = Report(opts.name, "index.html")
+    report.style.append('body {font: 10pt sans;}')
+    report.style_links.append("https://maxcdn.bootstrapcdn.com/bootstrap/3.3.4/css/bootstrap.min.css")
+    report.script_links.append("http://www.kryogenix.org/code/browser/sorttable/sorttable.js")
+
+    for pos, row in enumerate(compare_layout):
+        if pos != 0:
+            report.next_line()
+        for func in row:
+            func(report, old, new)
+
+    report.save_to(opts.out)
+    print "Comparison report successfully stored in", index_path
 
 
 if __name__ == "__main__":
@@ -1250,7 +2150,12 @@ if __name__ == "__main__":
         prof = hotshot.Profile("/tmp/cl_2.prof")
         prof.start()
 
-    res = main(sys.argv)
+    logging.basicConfig(format="%(levelname)s - %(message)s")
+
+    if sys.argv[1:2] == ['compare']:
+        res = compare_main(sys.argv[1:])
+    else:
+        res = main(sys.argv)
 
     if '--profile' in sys.argv:
         prof.stop()
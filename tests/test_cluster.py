@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from cluster import (CephCluster, load_performance_log_file, find_osd_pid, timed_correlation,
+                     parse_rusage, rusage_rates, resample)
+from storage import open_storage, JResultStorage, SQLITE_FILE
+from collect_info import SQLiteResultsWriter, FolderResultsWriter
+
+
+HEADER = "Mon Sep  7 21:08:26 UTC 2015\n"
+
+
+class PerformanceLogTest(unittest.TestCase):
+    def test_load(self):
+        res = load_performance_log_file(HEADER + "sda 1 2\nsdb 3 4\nsda 5 6\n", ['r', 'w'])
+        self.assertEqual(sorted(res), ['sda', 'sdb'])
+        self.assertEqual(res['sda'].values.tolist(), [[1, 2], [5, 6]])
+
+    def test_broken_lines(self):
+        res = load_performance_log_file(HEADER + "sda 1\nsda 1 2\nsdb 3 4\nsda 5\n", ['r', 'w'])
+        self.assertEqual(res['sda'].values.tolist(), [[1, 2]])
+        self.assertEqual(res['sdb'].values.tolist(), [[3, 4]])
+
+    def test_all_lines_broken(self):
+        self.assertEqual(load_performance_log_file(HEADER + "sda 1\nsdb 3\nsda\n", ['r', 'w']), {})
+        self.assertEqual(load_performance_log_file(HEADER, ['r', 'w']), {})
+
+
+PS = """root      1234  2.1  3.4 ... /usr/bin/ceph-osd -i 10 --pid-file /var/run/ceph/osd.10.pid -c /etc/ceph/ceph.conf
+ceph      1235  2.1  3.4 ... /usr/bin/ceph-osd -f --cluster ceph --id 1 --setuser ceph --setgroup ceph
+ceph      1236  2.1  3.4 ... /usr/bin/ceph-osd -f --cluster ceph --id=2
+root      1237  0.0  0.0 ... grep ceph-osd -i 3
+"""
+
+
+class OSDPidTest(unittest.TestCase):
+    def test_id_forms(self):
+        self.assertEqual(find_osd_pid(PS, 10), 1234)
+        self.assertEqual(find_osd_pid(PS, 1), 1235)
+        self.assertEqual(find_osd_pid(PS, 2), 1236)
+        self.assertEqual(find_osd_pid(PS, 0), None)
+
+
+class ResampleTest(unittest.TestCase):
+    def resample(self, grid, interpolation):
+        res = resample([0, 10, 20], [[1, 10], [2, 30], [3, 20]], grid, interpolation)
+        return numpy.where(numpy.isnan(res), -1, res).tolist()
+
+    def test_linear(self):
+        self.assertEqual(self.resample([-1, 0, 5, 20, 21], 'linear'),
+                         [[-1, -1], [1, 10], [1.5, 20], [3, 20], [-1, -1]])
+
+    def test_previous(self):
+        self.assertEqual(self.resample([-1, 5, 10, 19, 25], 'previous'),
+                         [[-1, -1], [1, 10], [2, 30], [2, 30], [-1, -1]])
+
+    def test_nearest(self):
+        self.assertEqual(self.resample([4, 6, 16, 20], 'nearest'),
+                         [[1, 10], [2, 30], [3, 20], [3, 20]])
+        self.assertEqual(resample([5], [[7]], [4, 5, 6], 'nearest')[1].tolist(), [7])
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, resample, [0], [[0]], [0], 'cubic')
+
+
+class PGDistributionTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        writer = FolderResultsWriter(self.folder)
+        pg_stats = [{'pgid': '1.0', 'acting': [0, 1]},
+                    {'pgid': '1.1', 'acting': [1, 2]},
+                    {'pgid': '2.0', 'acting': [0, 2]},
+                    {'pgid': '2.1', 'acting': [0, 1]},
+                    {'pgid': '2.2', 'acting': [0]}]
+        writer.store('master/pg_dump', 'json', True, json.dumps({'pg_stats': pg_stats}), 0.1)
+        writer.store('master/osd_lspools', 'json', True,
+                     json.dumps([{'poolnum': 1, 'poolname': 'rbd'},
+                                 {'poolnum': 2, 'poolname': 'data'},
+                                 {'poolnum': 3, 'poolname': 'empty'}]), 0.1)
+        writer.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_matrix(self):
+        storage = open_storage(self.folder)
+        cluster = CephCluster(JResultStorage(storage), storage)
+        cluster.load_PG_distribution()
+
+        # columns are sorted by pool name, pools without PG are skipped
+        self.assertEqual(cluster.pg_osd_ids, [0, 1, 2])
+        self.assertEqual(cluster.pg_pool_names, ['data', 'rbd'])
+        self.assertEqual(cluster.osd_pool_pg.tolist(), [[3, 1], [1, 2], [1, 1]])
+        self.assertEqual(cluster.sum_per_osd, {0: 4, 1: 3, 2: 2})
+        self.assertEqual(cluster.sum_per_pool, {'data': 5, 'rbd': 4})
+
+
+class TimedCorrelationTest(unittest.TestCase):
+    def test_different_start_and_step(self):
+        cpu_times = numpy.arange(0, 21, 2.0)
+        io_times = numpy.arange(5, 31, 1.0)
+        corr = timed_correlation(cpu_times, cpu_times % 7, io_times, io_times % 7)
+        self.assertAlmostEqual(corr, 1.0)
+
+    def test_no_overlap(self):
+        times = numpy.arange(0, 10, 1.0)
+        self.assertEqual(timed_correlation(times, times, times + 100, times), None)
+
+
+class RusageSeriesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        writer = SQLiteResultsWriter(os.path.join(self.folder, SQLITE_FILE))
+        for host in ('node-1', 'node-2'):
+            for pos, ts in enumerate(('1000.000', '1010.500', '1030.250')):
+                disk = "".join("   8  {0} sd{1} {2}\n".format(
+                    minor, dev, " ".join(str((pos + 1) * (minor + 1) * val) for val in range(1, 12)))
+                    for minor, dev in ((0, 'a'), (16, 'b')))
+                net = "Inter-|   Receive\n face |bytes\n  eth0: {0}\n".format(
+                    " ".join(str(pos * pos * val) for val in range(1, 17)))
+                writer.store('rusage/{0}/{1}-disk'.format(host, ts), 'txt', True, disk, 0.1)
+                writer.store('rusage/{0}/{1}-net'.format(host, ts), 'txt', True, net, 0.1)
+        writer.close()
+
+        # as if collector failed to parse node-2 snapshots into tables
+        db = sqlite3.connect(os.path.join(self.folder, SQLITE_FILE))
+        db.execute("DELETE FROM diskstats WHERE host='node-2'")
+        db.execute("DELETE FROM netdev WHERE host='node-2'")
+        db.commit()
+        db.close()
+
+        storage = open_storage(self.folder)
+        self.cluster = CephCluster(JResultStorage(storage), storage)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def rates(self, stats):
+        return dict((stat_type, dict((dev, (times.tolist(), rates.tolist()))
+                                     for dev, (times, rates) in per_dev.items()))
+                    for stat_type, per_dev in rusage_rates(stats).items())
+
+    def test_sqlite_rates_as_parsed(self):
+        series = self.cluster.get_rusage_series('node-1')
+        parsed = parse_rusage(self.cluster.get_rusage_files('node-1'))
+        self.assertEqual(self.rates(series), self.rates(parsed))
+        self.assertEqual(sorted(self.rates(series)['disk']), ['sda', 'sdb'])
+        self.assertEqual(len(self.rates(series)['net']['eth0'][0]), 2)
+
+    def test_fallback_to_snapshots(self):
+        self.assertEqual(self.cluster.get_rusage_series('node-2'), None)
+        self.assertEqual(self.rates(self.cluster.get_rusage_stats('node-2')),
+                         self.rates(self.cluster.get_rusage_stats('node-1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
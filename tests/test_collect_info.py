@@ -0,0 +1,87 @@
+import os
+import sys
+import Queue
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+import collect_info
+from storage import open_storage, SQLITE_FILE
+
+
+DISKSTATS = "   8       0 sda 1 2 3 4 5 6 7 8 0 9 10\n"
+NETDEV = "Inter-|   Receive\n face |bytes\n  eth0: 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16\n"
+
+
+class PeriodicUsageTest(unittest.TestCase):
+    def setUp(self):
+        self.check_output_ssh = collect_info.check_output_ssh
+        self.time = collect_info.time.time
+
+    def tearDown(self):
+        collect_info.check_output_ssh = self.check_output_ssh
+        collect_info.time.time = self.time
+
+    def collect(self, host_times, start_time, end_time, step):
+        # returns emitted paths; node clock is 100 seconds ahead of collector
+        out = "{0}\n".format(end_time + 100)
+        for tm in host_times:
+            out += "#snapshot {0}\n{1}#net\n{2}".format(tm + 100, DISKSTATS, NETDEV)
+
+        collect_info.check_output_ssh = lambda host, opts, cmd, **kwargs: (True, out)
+        collect_info.time.time = lambda: end_time
+
+        res_q = Queue.Queue()
+        collector = collect_info.NodeResourseUsageCollector(None, collect_info.CollectSettings(), res_q)
+        collector.step = step
+        collector.snapshot_times['node-1'].append(start_time)
+        collector.collect_periodic_data("", 'node-1')
+
+        paths = []
+        while not res_q.empty():
+            paths.append(res_q.get()[1])
+        return paths
+
+    def test_snapshots_near_start_and_end_skipped(self):
+        paths = self.collect([1000, 1010, 1020, 1029], 1000.4, 1030.0, 10)
+        self.assertEqual(paths, ['/rusage/node-1/1010.000-disk', '/rusage/node-1/1010.000-net',
+                                 '/rusage/node-1/1020.000-disk', '/rusage/node-1/1020.000-net'])
+
+    def test_actual_snapshot_time_used(self):
+        paths = self.collect([1010.25, 1021.5], 1000.0, 1030.0, 10)
+        self.assertEqual(paths, ['/rusage/node-1/1010.250-disk', '/rusage/node-1/1010.250-net',
+                                 '/rusage/node-1/1021.500-disk', '/rusage/node-1/1021.500-net'])
+
+    def test_sub_second_keys_stored(self):
+        folder = tempfile.mkdtemp()
+        try:
+            writer = collect_info.SQLiteResultsWriter(os.path.join(folder, SQLITE_FILE))
+            for path in ('rusage/node-1/1000.250-disk', 'rusage/node-1/1000.750-disk'):
+                writer.store(path, 'txt', True, DISKSTATS, 0.1)
+            writer.close()
+
+            storage = open_storage(folder)
+            series = storage.rusage_series('node-1', 'disk', collect_info.collections.namedtuple(
+                'Stat', collect_info.sqlite_diskstat_fields))
+            self.assertEqual([ts for ts, _ in series], [1000.25, 1000.75])
+        finally:
+            shutil.rmtree(folder)
+
+
+class ParseArgsTest(unittest.TestCase):
+    def test_usage_snapshots_count(self):
+        self.assertEqual(collect_info.parse_args(['x', '--usage-snapshots', '3']).usage_snapshots, 3)
+
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            for count in ('1', '0'):
+                self.assertRaises(SystemExit, collect_info.parse_args, ['x', '--usage-snapshots', count])
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from crush import CrushTree
+
+
+NODES = [
+    {'id': -1, 'name': 'default', 'type': 'root', 'children': [-2, -3]},
+    {'id': -2, 'name': 'h1', 'type': 'host', 'children': [1, 0]},
+    {'id': -3, 'name': 'h2', 'type': 'host', 'children': [2]},
+    {'id': 0, 'name': 'osd.0', 'type': 'osd'},
+    {'id': 1, 'name': 'osd.1', 'type': 'osd'},
+    {'id': 2, 'name': 'osd.2', 'type': 'osd'},
+    # not in crush map yet
+    {'id': 3, 'name': 'osd.3', 'type': 'osd'},
+]
+
+
+class CrushTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tree = CrushTree(NODES)
+
+    def test_links(self):
+        self.assertEqual(self.tree.root_ids, [-1, 3])
+        self.assertEqual(self.tree.parent[0], -2)
+        self.assertEqual(self.tree.parent[-1], None)
+        self.assertEqual(self.tree.children[-2], [1, 0])
+
+    def test_ancestors(self):
+        self.assertEqual(self.tree.ancestor_name(1, 'host'), 'h1')
+        self.assertEqual(self.tree.ancestor_name(2, 'root'), 'default')
+        self.assertEqual(self.tree.ancestor_name(-3, 'host'), 'h2')
+        self.assertEqual(self.tree.ancestor(3, 'host'), None)
+        self.assertEqual(self.tree.ancestor(100, 'host'), None)
+
+    def test_osd_sets(self):
+        self.assertEqual(self.tree.osd_ids, [0, 1, 2, 3])
+        self.assertEqual(self.tree.subtree_osds[-1], [1, 0, 2])
+        self.assertEqual(self.tree.subtree_osds[3], [3])
+        self.assertEqual(self.tree.host_osds, {'h1': [0, 1], 'h2': [2]})
+
+    def test_iter_nodes(self):
+        self.assertEqual([(depth, node['name']) for depth, node in self.tree.iter_nodes()],
+                         [(0, 'default'), (1, 'h1'), (2, 'osd.1'), (2, 'osd.0'),
+                          (1, 'h2'), (2, 'osd.2'), (0, 'osd.3')])
+
+    def test_aggregate(self):
+        sums = self.tree.aggregate('pg', {0: 10, 1: 20, 2: 5})
+        self.assertEqual((sums[-1], sums[-2], sums[-3], sums[3]), (35, 30, 5, 0))
+
+        # cached by name
+        self.assertEqual(self.tree.aggregate('pg', {})[-1], 35)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from disk_health import DiskHealth, parse_devices, parse_smartctl, parse_hdparm
+
+
+ATA_SMART = """=== START OF INFORMATION SECTION ===
+Device Model:     INTEL SSDSC2BB480G4
+Serial Number:    BTWL1234567
+SATA Version is:  SATA 3.0, 6.0 Gb/s (current: 3.0 Gb/s)
+
+=== START OF READ SMART DATA SECTION ===
+SMART overall-health self-assessment test result: PASSED
+
+ID# ATTRIBUTE_NAME          FLAG     VALUE WORST THRESH TYPE      UPDATED  WHEN_FAILED RAW_VALUE
+  5 Reallocated_Sector_Ct   0x0032   100   100   000    Old_age   Always       -       8
+  9 Power_On_Hours          0x0032   100   100   000    Old_age   Always       -       12345
+194 Temperature_Celsius     0x0022   035   045   000    Old_age   Always       -       35 (Min/Max 20/45)
+197 Current_Pending_Sector  0x0012   100   100   000    Old_age   Always       -       0
+233 Media_Wearout_Indicator 0x0032   005   005   000    Old_age   Always       -       0
+"""
+
+SAS_SMART = """Product:              ST4000NM0023
+Serial number:        Z1Z0ABCD
+SMART Health Status: OK
+Current Drive Temperature:     40 C
+  Accumulated power on time, hours:minutes 20000:15
+Elements in grown defect list: 0
+Percentage used endurance indicator: 3%
+Negotiated logical link rate: phy enabled; 6 Gbps
+"""
+
+HDPARM = """Commands/features:
+	Enabled	Supported:
+	   *	SMART feature set
+	    	Write cache
+"""
+
+
+class SmartctlTest(unittest.TestCase):
+    def test_ata(self):
+        res = parse_smartctl(ATA_SMART)
+        self.assertEqual(res, {'smart_passed': True,
+                               'model': 'INTEL SSDSC2BB480G4',
+                               'serial': 'BTWL1234567',
+                               'link_speed': '3.0 Gb/s',
+                               'reallocated': 8,
+                               'power_on_hours': 12345,
+                               'temperature': 35,
+                               'pending': 0,
+                               'wearout': 5})
+
+    def test_sas(self):
+        res = parse_smartctl(SAS_SMART)
+        self.assertEqual(res, {'smart_passed': True,
+                               'model': 'ST4000NM0023',
+                               'serial': 'Z1Z0ABCD',
+                               'link_speed': '6 Gb/s',
+                               'reallocated': 0,
+                               'power_on_hours': 20000,
+                               'temperature': 40,
+                               'wearout': 97})
+
+    def test_failed(self):
+        res = parse_smartctl("SMART overall-health self-assessment test result: FAILED!\n")
+        self.assertEqual(res, {'smart_passed': False})
+        self.assertEqual(parse_smartctl(None), {})
+
+    def test_write_cache(self):
+        self.assertEqual(parse_hdparm(HDPARM), {'write_cache': False})
+        self.assertEqual(parse_hdparm(HDPARM.replace("\t    \tWrite", "\t   *\tWrite")),
+                         {'write_cache': True})
+        self.assertEqual(parse_hdparm(None), {})
+
+
+class DiskHealthTest(unittest.TestCase):
+    def test_problems(self):
+        ssd = DiskHealth('h1', 'sda')
+        hdd = DiskHealth('h1', 'sdb')
+        unknown = DiskHealth('h2', 'sda')
+        parse_devices([(ssd, ATA_SMART, HDPARM), (hdd, SAS_SMART, None), (unknown, None, None)])
+
+        self.assertEqual(ssd.problems(), ['reallocated', 'wearout'])
+        self.assertEqual(ssd.write_cache, False)
+        self.assertEqual(hdd.problems(), [])
+        self.assertEqual(hdd.wearout, 97)
+        self.assertEqual(unknown.problems(), [])
+        self.assertEqual(unknown.smart_passed, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from history import HistoryStore
+from collect_info import FolderResultsWriter
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data = os.path.join(self.folder, 'data')
+        os.makedirs(self.data)
+
+        writer = FolderResultsWriter(self.data)
+        writer.store('master/status', 'json', True, json.dumps({'fsid': 'x'}), 0.1)
+        writer.store('master/osd_tree', 'json', True,
+                     json.dumps({'nodes': [{'type': 'host', 'name': 'h1', 'children': [1]}]}), 0.1)
+        writer.store('master/collected_at', 'txt', True, "date\nlocal\n1465387801.0", 0.1)
+
+        # second copy is stored as reference
+        writer.store('osd/1/config', 'json', True, json.dumps({'x': 'y' * 300}), 0.2)
+        writer.store('osd/1/config_copy', 'json', True, json.dumps({'x': 'y' * 300}), 0.2)
+        writer.add_file('log', 'txt')
+        writer.close()
+        open(os.path.join(self.data, 'log.txt'), 'w').write("collector log\n")
+
+        self.archive = os.path.join(self.folder, 'data.tar.gz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            for name in os.listdir(self.data):
+                tar.add(os.path.join(self.data, name), name)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def items(self, store):
+        return sorted(row[2:] for row in store.find())
+
+    def test_archive_as_folder(self):
+        from_folder = HistoryStore(':memory:')
+        self.assertEqual(from_folder.ingest(self.data), 1)
+
+        from_archive = HistoryStore(':memory:')
+        self.assertEqual(from_archive.ingest(self.archive), 1)
+        self.assertEqual(from_archive.ingest(self.archive), None)
+
+        items = self.items(from_archive)
+        self.assertEqual(items, self.items(from_folder))
+        self.assertEqual([path for path, _, _, _, _ in items],
+                         ['log', 'master/collected_at', 'master/osd_tree', 'master/status',
+                          'osd/1/config', 'osd/1/config_copy'])
+        self.assertEqual(items[4][1:], items[5][1:])
+        self.assertEqual(from_archive.find(osd_id=1)[0][2], 'osd/1/config')
+
+
+if __name__ == '__main__':
+    unittest.main()
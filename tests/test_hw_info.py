@@ -0,0 +1,121 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+import hw_info
+
+
+LSHW = """<?xml version="1.0" standalone="yes" ?>
+<list>
+<node id="{host}" claimed="true" class="system" handle="DMI:0001">
+ <description>Computer</description>
+ <product>X9DRW</product>
+ <vendor>Supermicro</vendor>
+ <serial>{serial}</serial>
+ <configuration>
+  <setting id="uuid" value="{uuid}" />
+ </configuration>
+ <node id="core" claimed="true" class="bus" handle="DMI:0002">
+  <description>Motherboard</description>
+  <product>X9DRW</product>
+  <vendor>Supermicro</vendor>
+  <version>1.0</version>
+  <node id="cpu:0" claimed="true" class="processor" handle="DMI:0004">
+   <product>{cpu}</product>
+   <size units="Hz">{clock}</size>
+   <configuration>
+    <setting id="threads" value="16" />
+   </configuration>
+  </node>
+  <node id="memory" claimed="true" class="memory" handle="DMI:0005">
+   <description>System Memory</description>
+   <size units="bytes">68719476736</size>
+  </node>
+  <node id="network" claimed="true" class="network" handle="PCI:0000:01:00.0">
+   <description>Ethernet interface</description>
+   <logicalname>eth0</logicalname>
+   <serial>{mac}</serial>
+   <configuration>
+    <setting id="duplex" value="full" />
+    <setting id="ip" value="{ip}" />
+    <setting id="link" value="yes" />
+    <setting id="speed" value="{speed}" />
+   </configuration>
+  </node>
+  <node id="storage" claimed="true" class="storage" handle="PCI:0000:00:1f.2">
+   <description>SATA controller</description>
+   <product>C600/X79 series chipset 6-Port SATA AHCI Controller</product>
+   <vendor>Intel Corporation</vendor>
+   <node id="disk" claimed="true" class="disk" handle="GUID:{guid}">
+    <description>ATA Disk</description>
+    <product>ST4000</product>
+    <businfo>scsi@0:0.0.0</businfo>
+    {lnames}
+    <serial>{serial}</serial>
+    <size units="bytes">{disk_size}</size>
+    <configuration>
+     <setting id="guid" value="{guid}" />
+    </configuration>
+    <node id="volume" claimed="true" class="volume" handle="GUID:{guid}">
+     <description>EXT4 volume</description>
+     <logicalname>/dev/sda1</logicalname>
+     <serial>{guid}</serial>
+     <configuration>
+      <setting id="created" value="{created}" />
+      <setting id="mounted" value="{created}" />
+     </configuration>
+    </node>
+   </node>
+  </node>
+ </node>
+</node>
+</list>
+"""
+
+BASE = dict(host='node-1', serial='S1', uuid='00000000-0001', cpu='Intel Xeon E5-2650',
+            clock='1200000000', mac='00:25:90:00:00:01', ip='10.0.0.1', speed='10Gbit/s',
+            guid='aaaa-0001', disk_size='4000787030016', created='2016-01-01 10:00:00',
+            lnames='<logicalname>/dev/sda</logicalname><logicalname>/dev/sg0</logicalname>')
+
+
+def lshw(**kwargs):
+    params = BASE.copy()
+    params.update(kwargs)
+    return LSHW.format(**params)
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_per_host_values_ignored(self):
+        fingerprint = hw_info.hw_fingerprint(lshw())
+        self.assertNotEqual(fingerprint, None)
+        other = lshw(host='node-2', serial='S2', uuid='00000000-0002', clock='1300000000',
+                     mac='00:25:90:00:00:02', ip='10.0.0.2', guid='aaaa-0002',
+                     created='2016-02-02 11:00:00',
+                     lnames='<logicalname>/dev/sda</logicalname><logicalname>/dev/sg1</logicalname>')
+        self.assertEqual(hw_info.hw_fingerprint(other), fingerprint)
+
+    def test_parsed_values_used(self):
+        fingerprint = hw_info.hw_fingerprint(lshw())
+        for changed in (dict(cpu='Intel Xeon E5-2660'), dict(speed='1Gbit/s'),
+                        dict(disk_size='2000398934016'),
+                        dict(lnames='<logicalname>/dev/sdb</logicalname>'),
+                        dict(lnames='')):
+            self.assertNotEqual(hw_info.hw_fingerprint(lshw(**changed)), fingerprint)
+
+    def test_cached_info(self):
+        hw_info.hw_info_cache.clear()
+        hw_info.get_hw_info(lshw())
+        res = hw_info.get_hw_info(lshw(host='node-2', ip='10.0.0.2'))
+        expected = hw_info.parse_lshw(lshw(host='node-2', ip='10.0.0.2'))
+        self.assertEqual(res.hostname, 'node-2')
+        self.assertEqual((res.cores, res.ram_size, res.net_info, res.disks_info),
+                         (expected.cores, expected.ram_size, expected.net_info, expected.disks_info))
+
+    def test_not_lshw(self):
+        self.assertEqual(hw_info.hw_fingerprint("lshw: command not found"), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from net_conns import parse_netstat, parse_netstats, analyze_connections, TcpConn
+
+
+H1_NETSTAT = """Active Internet connections (servers and established)
+Proto Recv-Q Send-Q Local Address           Foreign Address         State       PID/Program name
+tcp        0      0 10.0.0.1:6800           0.0.0.0:*               LISTEN      100/ceph-osd
+tcp        0      0 10.0.0.1:40000          10.0.0.2:6800           ESTABLISHED 100/ceph-osd
+tcp    70000      0 10.0.0.1:6800           10.0.0.9:5000           ESTABLISHED 100/ceph-osd
+tcp        0      0 10.0.0.1:50000          10.0.0.2:22             ESTABLISHED -
+tcp        0      0 127.0.0.1:6789          127.0.0.1:55555         ESTABLISHED 100/ceph-osd
+"""
+
+H2_NETSTAT = """Active Internet connections (servers and established)
+Proto Recv-Q Send-Q Local Address           Foreign Address         State       PID/Program name
+tcp6       0      0 ::ffff:10.0.0.2:6800    ::ffff:10.0.0.1:40000   ESTABLISHED 200/ceph-osd
+"""
+
+IP_HOSTS = {'10.0.0.1': 'h1', '10.0.0.2': 'h2'}
+OSD_PIDS = {('h1', 100): 0, ('h2', 200): 1}
+
+
+class ParseNetstatTest(unittest.TestCase):
+    def test_established_only(self):
+        self.assertEqual(parse_netstat(H1_NETSTAT),
+                         [TcpConn('10.0.0.1', 40000, '10.0.0.2', 6800, 0, 0, 100),
+                          TcpConn('10.0.0.1', 6800, '10.0.0.9', 5000, 70000, 0, 100),
+                          TcpConn('10.0.0.1', 50000, '10.0.0.2', 22, 0, 0, None)])
+
+    def test_ipv4_mapped(self):
+        self.assertEqual(parse_netstat(H2_NETSTAT),
+                         [TcpConn('10.0.0.2', 6800, '10.0.0.1', 40000, 0, 0, 200)])
+
+
+class AnalyzeConnectionsTest(unittest.TestCase):
+    def setUp(self):
+        conns = parse_netstats({'h1': H1_NETSTAT, 'h2': H2_NETSTAT})
+        self.res = analyze_connections(conns, IP_HOSTS, OSD_PIDS)
+
+    def test_host_connections(self):
+        self.assertEqual(self.res.hosts, ['h1', 'h2'])
+        self.assertEqual(sorted((pair, stats.count) for pair, stats in self.res.host_conns.items()),
+                         [(('h1', None), 1), (('h1', 'h2'), 2), (('h2', 'h1'), 1)])
+
+    def test_osd_connections(self):
+        # accepted connection on h2 is matched to osd by listening address
+        self.assertEqual(sorted((pair, stats.count) for pair, stats in self.res.osd_conns.items()),
+                         [((0, 1), 1), ((1, 0), 1)])
+
+    def test_backed_up(self):
+        self.assertEqual(self.res.backed_up,
+                         [('h1', 0, '10.0.0.1:6800', '10.0.0.9:5000', None, None, 70000, 0)])
+        self.assertEqual(self.res.host_conns[('h1', None)].backed_up, 1)
+
+    def test_asymmetric(self):
+        # ssh connection to h2 isn't in h2 netstat, clients are never checked
+        self.assertEqual(self.res.asymmetric_hosts, [('h1', 'h2', 2, 1)])
+        self.assertEqual(self.res.asymmetric_osds, [])
+
+    def test_not_collected_host_skipped(self):
+        res = analyze_connections(parse_netstats({'h1': H1_NETSTAT}), IP_HOSTS, OSD_PIDS)
+        self.assertEqual(res.asymmetric_hosts, [])
+        self.assertEqual(res.asymmetric_osds, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
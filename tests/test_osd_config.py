@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from osd_config import build_config_store
+
+
+def config_show(osd_id, **kwargs):
+    cfg = {'name': 'osd.{0}'.format(osd_id),
+           'osd_data': '/var/lib/ceph/osd/ceph-{0}'.format(osd_id),
+           'keyring': '/var/lib/ceph/osd/ceph-{0}/keyring'.format(osd_id),
+           'admin_socket': '/var/run/ceph/ceph-osd.{0}.asok'.format(osd_id),
+           'mon_host': 'ceph-1,ceph-2,ceph-3',
+           'host': 'ceph-1',
+           'osd_max_backfills': '1'}
+    cfg.update(kwargs)
+    return cfg
+
+
+class ConfigStoreTest(unittest.TestCase):
+    def check(self, configs):
+        store = build_config_store(dict((osd_id, json.dumps(cfg)) for osd_id, cfg in configs.items()))
+        for osd_id, cfg in configs.items():
+            self.assertEqual(dict(store.config(osd_id).items()), cfg)
+        return store
+
+    def test_per_osd_keys(self):
+        store = self.check(dict((osd_id, config_show(osd_id)) for osd_id in range(4)))
+        self.assertEqual(store.overrides, {})
+        self.assertEqual(store.baseline['name'], 'osd.{osd_id}')
+        self.assertEqual(store.baseline['host'], 'ceph-1')
+
+    def test_other_keys_not_templated(self):
+        # osd.1 runs on ceph-1, its host must not become per-osd value
+        configs = dict((osd_id, config_show(osd_id, host='ceph-1' if osd_id == 1 else 'ceph-0'))
+                       for osd_id in range(4))
+        store = self.check(configs)
+        self.assertEqual(store.deviations()[('host', 'ceph-0', 'ceph-1')], [1])
+
+    def test_value_types(self):
+        configs = dict((osd_id, config_show(osd_id, debug_osd=[], osd_op_threads=1))
+                       for osd_id in range(3))
+        configs[1]['debug_osd'] = "[]"
+        configs[2]['osd_op_threads'] = True
+        store = self.check(configs)
+        self.assertEqual(sorted(store.overrides), [1, 2])
+        self.assertEqual(store.config(2)['osd_op_threads'], True)
+        self.assertEqual(store.config(1)['debug_osd'], "[]")
+
+    def test_containers_from_template(self):
+        store = build_config_store({1: json.dumps(config_show(1))})
+        store.baseline['paths'] = {'data': ['/var/lib/ceph/osd/ceph-{osd_id}']}
+        self.assertEqual(store.config(1)['paths'], {'data': ['/var/lib/ceph/osd/ceph-1']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from outliers import robust_z, grouped_robust_z, suspects_scores, SUSPECT_Z
+
+
+nan = float('nan')
+
+
+class RobustZTest(unittest.TestCase):
+    def test_single_outlier(self):
+        z = robust_z(numpy.array([[10.0], [10.0], [11.0], [9.0], [10.0], [50.0]]))[:, 0]
+        self.assertGreater(z[5], SUSPECT_Z)
+        self.assertTrue((numpy.abs(z[:5]) < SUSPECT_Z).all())
+        self.assertEqual(z[0], 0)
+        self.assertAlmostEqual(z[2], -z[3])
+
+    def test_mostly_equal_values(self):
+        # MAD is zero, mean absolute deviation is used instead
+        z = robust_z(numpy.array([[5.0], [5.0], [5.0], [5.0], [8.0]]))[:, 0]
+        self.assertEqual(z[:4].tolist(), [0, 0, 0, 0])
+        self.assertAlmostEqual(z[4], 3.0 / (0.6 / 0.7979))
+
+    def test_unknown_values(self):
+        z = robust_z(numpy.array([[1.0, nan], [2.0, nan], [nan, nan], [3.0, nan]]))
+        self.assertTrue(numpy.allclose(z[[0, 1, 3], 0], [-0.6745, 0, 0.6745]))
+        self.assertTrue(numpy.isnan(z[2, 0]))
+        self.assertTrue(numpy.isnan(z[:, 1]).all())
+
+    def test_groups(self):
+        values = numpy.array([[1.0], [1.0], [2.0], [100.0], [100.0], [101.0], [5.0]])
+        z = grouped_robust_z(values, ['a', 'a', 'a', 'b', 'b', 'b', 'c'])[:, 0]
+        self.assertEqual(z[[0, 1, 3, 4]].tolist(), [0, 0, 0, 0])
+        self.assertGreater(z[2], 0)
+        self.assertAlmostEqual(z[2], z[5])
+        self.assertTrue(numpy.isnan(z[6]))
+
+
+class SuspectsScoresTest(unittest.TestCase):
+    def test_one_and_two_sided(self):
+        metrics = [('lat', None, False), ('PG count', None, True)]
+        values = numpy.array([[10.0, 100.0], [10.0, 100.0], [11.0, 101.0], [9.0, 99.0], [0.0, 0.0]])
+        scores, cluster_z, _ = suspects_scores(values, metrics)
+
+        # too small latency isn't a problem, too few PG is
+        self.assertLess(cluster_z[4, 0], -SUSPECT_Z)
+        self.assertLess(scores[4, 0], SUSPECT_Z)
+        self.assertGreater(scores[4, 1], SUSPECT_Z)
+
+    def test_peer_score_used(self):
+        metrics = [('lat', None, False)]
+        values = numpy.array([[1.0], [2.0], [3.0]])
+        peer_z = numpy.array([[nan], [10.0], [-10.0]])
+        scores, _, _ = suspects_scores(values, metrics, peer_z)
+        self.assertEqual(scores[1, 0], 10.0)
+        self.assertEqual(scores[0, 0], robust_z(values)[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
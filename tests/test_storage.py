@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from storage import open_storage, JResultStorage, SQLITE_FILE
+from collect_info import FolderResultsWriter, SQLiteResultsWriter
+
+
+LOG = "2016-06-08 12:10:01 - INFO - collect - Start collecting\n"
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def fill(self, writer):
+        writer.store('master/status', 'json', True, '{"fsid": "x"}', 0.1)
+        writer.store('hosts/h1/uptime', 'txt', True, '100.0 50.0', 0.1)
+        writer.add_file('log', 'txt')
+        writer.close()
+
+        # collector writes own log directly, not through results writer
+        open(os.path.join(self.folder, 'log.txt'), 'w').write(LOG)
+
+        # files, unknown to manifest, are not visible
+        if not os.path.isdir(os.path.join(self.folder, 'hosts', 'h1')):
+            os.makedirs(os.path.join(self.folder, 'hosts', 'h1'))
+        open(os.path.join(self.folder, 'hosts', 'h1', 'extra.txt'), 'w').write('extra')
+
+    def check(self, storage):
+        self.assertEqual(storage.get('log'), LOG)
+        self.assertEqual(storage.get('hosts/h1/uptime'), '100.0 50.0')
+        self.assertEqual(storage.get('hosts/h1/extra'), None)
+        self.assertEqual(storage.get('master/status', expected_format='json'), '{"fsid": "x"}')
+        self.assertEqual(sorted(storage.walk()), ['hosts/h1/uptime', 'log', 'master/status'])
+        self.assertEqual(storage.stat('log').size, len(LOG))
+        self.assertEqual(storage.stat('hosts/h1/extra'), None)
+
+        storage = open_storage(self.folder)
+        self.assertEqual(storage.prefetch(['log', 'hosts/h1/uptime']), 2)
+        self.assertEqual(storage.get('log'), LOG)
+
+    def check_no_disk_scan(self):
+        storage = open_storage(self.folder)
+
+        def fail(*args):
+            raise AssertionError("disk is scanned, while manifest is present")
+
+        listdir, isdir = os.listdir, os.path.isdir
+        os.listdir = os.path.isdir = fail
+        try:
+            self.assertEqual(storage.prefetch(['log', 'hosts/h1/uptime']), 2)
+            self.assertEqual(storage.get('log'), LOG)
+            self.assertEqual(storage.get('hosts/h1/uptime'), '100.0 50.0')
+            self.assertEqual(storage.get('hosts/h2/uptime'), None)
+            self.assertEqual(len(list(storage.walk())), 3)
+            self.assertEqual(storage.stat('master/status').format, 'json')
+        finally:
+            os.listdir, os.path.isdir = listdir, isdir
+
+    def test_manifest_folder(self):
+        self.fill(FolderResultsWriter(self.folder))
+        self.check(open_storage(self.folder))
+        self.check_no_disk_scan()
+
+    def test_sqlite_folder(self):
+        self.fill(SQLiteResultsWriter(os.path.join(self.folder, SQLITE_FILE)))
+        self.check(open_storage(self.folder))
+        self.check_no_disk_scan()
+
+    def test_folder_without_manifest(self):
+        open(os.path.join(self.folder, 'log.txt'), 'w').write(LOG)
+        os.makedirs(os.path.join(self.folder, 'hosts', 'h1'))
+        open(os.path.join(self.folder, 'hosts', 'h1', 'uptime.txt'), 'w').write('100.0 50.0')
+
+        storage = open_storage(self.folder)
+        self.assertEqual(storage.get('hosts/h1/uptime'), '100.0 50.0')
+        self.assertEqual(sorted(storage.walk()), ['hosts/h1/uptime', 'log'])
+        self.assertEqual(storage.stat('log').size, len(LOG))
+
+    def test_json_get_returns_copy(self):
+        self.fill(FolderResultsWriter(self.folder))
+        jstorage = JResultStorage(open_storage(self.folder))
+        jstorage.prefetch(['master/status'])
+
+        jstorage.get('master/status')['fsid'] = 'changed'
+        self.assertEqual(jstorage.get('master/status'), {'fsid': 'x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
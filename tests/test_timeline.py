@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ceph_monitoring'))
+
+from timeline import merge_events
+from cluster import CephCluster
+from storage import open_storage, JResultStorage, SQLITE_FILE
+from collect_info import FolderResultsWriter, SQLiteResultsWriter
+
+
+class CollectorLogTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def events(self, writer):
+        writer.store('master/status', 'json', True, '{}', 0.1)
+        writer.add_file('log', 'txt')
+        writer.close()
+        open(os.path.join(self.folder, 'log.txt'), 'w').write("21:05:30 - INFO - Start\n" +
+                                                             "21:06:00 - WARNING - node x failed\n")
+
+        storage = open_storage(self.folder)
+        cluster = CephCluster(JResultStorage(storage), storage)
+        cluster.osds = []
+        cluster.report_collected_at_local = "2015-09-07 21:08:26"
+        return [(event.time, event.source, event.severity)
+                for event in merge_events(cluster.timeline_streams())]
+
+    def check(self, events):
+        self.assertEqual(events, [("2015-09-07 21:05:30.000000", 'collector', 'INF'),
+                                  ("2015-09-07 21:06:00.000000", 'collector', 'WRN')])
+
+    def test_manifest_folder(self):
+        self.check(self.events(FolderResultsWriter(self.folder)))
+
+    def test_sqlite_folder(self):
+        self.check(self.events(SQLiteResultsWriter(os.path.join(self.folder, SQLITE_FILE))))
+
+
+if __name__ == '__main__':
+    unittest.main()